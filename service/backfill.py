@@ -0,0 +1,79 @@
+"""Backfill a symbol from a local file while the service is stopped.
+
+The symbol is built with the configuration of the service and installed
+where the service finds it when started: in DATA_DIR with the "mmap" storage
+backend, and in the snapshots of the write-ahead log when it is enabled.
+All data points stored for the symbol before are replaced.
+
+    python backfill.py SYMBOL prices.csv
+    python backfill.py SYMBOL prices.f32 --format binary --value-type float32
+
+While the service runs, use `POST /admin/symbols/{symbol}/backfill/` instead.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import get_args
+
+from service import backfill, dependencies, wal
+from service.config import config
+from service.dtos import BinaryValueType
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("symbol")
+    parser.add_argument("path", type=Path)
+    parser.add_argument(
+        "--format",
+        choices=get_args(backfill.BackfillFormat),
+        default="csv",
+    )
+    parser.add_argument(
+        "--value-type",
+        choices=get_args(BinaryValueType),
+        default="float64",
+    )
+    parser.add_argument(
+        "--timestamp",
+        type=float,
+        help="Seconds stamped on values read without timestamps, now by default",
+    )
+    args = parser.parse_args()
+
+    if config.STORAGE_BACKEND != "mmap" and not config.WAL_ENABLED:
+        sys.exit(
+            "Backfilled symbols would be lost: enable WAL_ENABLED or the "
+            '"mmap" STORAGE_BACKEND',
+        )
+    if config.WAL_ENABLED:
+        dependencies.write_ahead_log = wal.WriteAheadLog(
+            config.WAL_DIR,
+            fsync_interval=config.WAL_FSYNC_INTERVAL,
+            segment_bytes=config.WAL_SEGMENT_BYTES,
+        )
+    started_at = time.perf_counter()
+    try:
+        points = dependencies.backfill_symbol(
+            args.symbol,
+            backfill.read_file(args.path, args.format, args.value_type),
+            args.timestamp,
+        )
+    except ValueError as e:
+        sys.exit(f"{args.path}: {e}")
+    finally:
+        if dependencies.write_ahead_log is not None:
+            dependencies.write_ahead_log.close()
+    print(  # noqa: T201
+        f"Backfilled {args.symbol} with {points} points "
+        f"in {time.perf_counter() - started_at:.2f}s",
+    )
+
+
+if __name__ == "__main__":
+    main()
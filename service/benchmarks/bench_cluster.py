@@ -0,0 +1,165 @@
+"""Throughput of the sharded multi-process mode for 1, 2 and 4 shards.
+
+Every run starts `service.cluster` with as many routers as shards and drives
+it with client processes, each mixing `/add_batch/` and `/stats/` requests
+over its own symbols. Run from the `service` directory:
+
+    python -m benchmarks.bench_cluster --output cluster.json
+
+Scaling is bounded by the number of cores of the machine, which is reported
+alongside the results.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+SYMBOLS_PER_CLIENT = 10
+
+
+def _wait_ready(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            # Every shard answers 404 for unknown symbols, so any other status
+            # means that the router or a shard is still starting
+            response = httpx.get(f"{url}/stats/", params={"symbol": "_", "k": 1})
+            if response.status_code == httpx.codes.NOT_FOUND:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    msg = f"Cluster at {url} did not start in {timeout}s"
+    raise TimeoutError(msg)
+
+
+def _symbols(client: int) -> list[str]:
+    return [f"SYMBOL_{client}_{i}" for i in range(SYMBOLS_PER_CLIENT)]
+
+
+def _populate(url: str, client: int) -> None:
+    """Add a value to every symbol of the client, so that stats never miss."""
+    with httpx.Client(base_url=url) as http:
+        for symbol in _symbols(client):
+            http.post(
+                "/add_batch/",
+                json={"symbol": symbol, "values": [1.0]},
+            ).raise_for_status()
+
+
+def _client(url: str, client: int, duration: float, batch_size: int) -> int:
+    """Send requests for `duration` seconds and return how many succeeded."""
+    symbols = _symbols(client)
+    values = [random.random() * 100 for _ in range(batch_size)]
+    requests = 0
+    with httpx.Client(base_url=url) as http:
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            symbol = symbols[requests % SYMBOLS_PER_CLIENT]
+            if requests % 2:
+                response = http.get("/stats/", params={"symbol": symbol, "k": 2})
+            else:
+                response = http.post(
+                    "/add_batch/",
+                    json={"symbol": symbol, "values": values},
+                )
+            response.raise_for_status()
+            requests += 1
+    return requests
+
+
+def bench_cluster(
+    shards: int,
+    clients: int,
+    duration: float,
+    batch_size: int,
+    port: int,
+) -> dict:
+    """Measure requests per second served by `shards` shards."""
+    url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as directory:
+        cluster = subprocess.Popen(  # noqa: S603
+            [
+                sys.executable,
+                "-m",
+                "service.cluster",
+                "--shards",
+                str(shards),
+                "--routers",
+                str(shards),
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(port),
+                "--shard-port",
+                str(port + 1),
+            ],
+            env=os.environ
+            | {
+                "DATA_DIR": str(Path(directory) / "data"),
+                "WAL_DIR": str(Path(directory) / "wal"),
+            },
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_ready(url, timeout=60.0)
+            with multiprocessing.Pool(clients) as pool:
+                pool.starmap(_populate, [(url, i) for i in range(clients)])
+                started_at = time.perf_counter()
+                requests = pool.starmap(
+                    _client,
+                    [(url, i, duration, batch_size) for i in range(clients)],
+                )
+                elapsed = time.perf_counter() - started_at
+        finally:
+            cluster.terminate()
+            cluster.wait()
+    return {
+        "shards": shards,
+        "clients": clients,
+        "batch_size": batch_size,
+        "requests_per_second": sum(requests) / elapsed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    results = {
+        "cpu_count": os.cpu_count(),
+        "runs": [
+            bench_cluster(
+                shards,
+                args.clients,
+                args.duration,
+                args.batch_size,
+                args.port,
+            )
+            for shards in args.shards
+        ],
+    }
+    report = json.dumps(results, indent=2)
+    if args.output is not None:
+        args.output.write_text(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
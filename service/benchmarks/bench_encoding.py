@@ -0,0 +1,102 @@
+"""CPU time per request of `/stats/` and `/add_batch/`, responses included.
+
+Requests are sent one after another through an in-process ASGI client, so
+that the process time of the whole request, routing, validation, storage and
+response encoding, is measured without any network. `/stats/` responses are
+not cached, as with the first read after every write. Batches hold a single
+value, so that the cost of the request itself dominates. Run from the
+`service` directory:
+
+    python -m benchmarks.bench_encoding --output encoding.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+import httpx
+
+from main import app
+from service import controllers, storage
+from service.cache import ResponseCache
+
+SYMBOL = "ENCODING"
+
+
+async def _cpu_per_request(
+    client: httpx.AsyncClient,
+    requests: int,
+    send: Callable[[httpx.AsyncClient], Awaitable[httpx.Response]],
+) -> float:
+    # Warm up code paths and allocations first
+    for _ in range(min(requests, 100)):
+        (await send(client)).raise_for_status()
+    started_at = time.process_time()
+    for _ in range(requests):
+        (await send(client)).raise_for_status()
+    return (time.process_time() - started_at) / requests
+
+
+async def _get_stats(client: httpx.AsyncClient) -> httpx.Response:
+    return await client.get(
+        "/stats/",
+        params={"symbol": SYMBOL, "k": random.randint(1, 4)},
+    )
+
+
+async def _add_batch(client: httpx.AsyncClient) -> httpx.Response:
+    return await client.post(
+        "/add_batch/",
+        json={"symbol": SYMBOL, "values": [random.random()]},
+    )
+
+
+async def _bench_encoding(requests: int) -> dict:
+    storage.symbol_store.clear()
+    cache = controllers.stats_cache
+    # Nothing fits, every read encodes its response
+    controllers.stats_cache = ResponseCache(0)
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app),
+            base_url="http://bench",
+        ) as client:
+            response = await client.post(
+                "/add_batch/",
+                json={
+                    "symbol": SYMBOL,
+                    "values": [random.random() for _ in range(10**4)],
+                },
+            )
+            response.raise_for_status()
+            stats_us = await _cpu_per_request(client, requests, _get_stats) * 1e6
+            add_batch_us = await _cpu_per_request(client, requests, _add_batch) * 1e6
+    finally:
+        controllers.stats_cache = cache
+        storage.symbol_store.clear()
+    return {
+        "requests": requests,
+        "stats_cpu_us": stats_us,
+        "add_batch_cpu_us": add_batch_us,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    random.seed(0)
+
+    report = json.dumps(asyncio.run(_bench_encoding(args.requests)), indent=2)
+    if args.output is not None:
+        args.output.write_text(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
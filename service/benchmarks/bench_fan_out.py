@@ -0,0 +1,98 @@
+"""Add and query latency and memory of interval trees for every fan-out.
+
+Every tree is filled with batches appended one after another, as the storage
+does, and then queried for the last `10**k` points at every `k`. Run from the
+`service` directory:
+
+    python -m benchmarks.bench_fan_out --output fan_out.json
+
+Pick the fan-out with `TREE_FAN_OUT` in the configuration.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from service.dependencies import TREE_BACKENDS
+from service.statistics import Statistic
+
+FAN_OUTS = (2, 4, 8, 10, 16, 32, 64)
+
+
+def bench_fan_out(
+    backend: str,
+    fan_out: int,
+    size: int,
+    batch_size: int,
+    queries: int,
+) -> dict:
+    values = [random.random() * 100 for _ in range(size)]
+    tree_class = TREE_BACKENDS[backend]
+    tree = tree_class(size, Statistic, fan_out=fan_out)
+    add_timings = []
+    for start in range(0, size, batch_size):
+        batch = values[start : start + batch_size]
+        started_at = time.perf_counter()
+        tree.add(batch, start)
+        add_timings.append(time.perf_counter() - started_at)
+
+    # Tracing slows allocations down, so memory is measured on another tree
+    tracemalloc.start()
+    try:
+        traced_tree = tree_class(size, Statistic, fan_out=fan_out)
+        for start in range(0, size, batch_size):
+            traced_tree.add(values[start : start + batch_size], start)
+        memory, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del traced_tree
+
+    get_us = {}
+    for k in range(1, len(str(size))):
+        last_n = 10**k
+        get_timings = []
+        for _ in range(queries):
+            end = random.randint(last_n - 1, size - 1)
+            started_at = time.perf_counter()
+            tree.calculate(end - last_n + 1, end)
+            get_timings.append(time.perf_counter() - started_at)
+        get_us[k] = statistics.median(get_timings) * 1e6
+    return {
+        "backend": backend,
+        "fan_out": fan_out,
+        "size": size,
+        "batch_size": batch_size,
+        "add_us": statistics.median(add_timings) * 1e6,
+        "get_us": get_us,
+        "memory_bytes": memory,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backends", nargs="+", default=list(TREE_BACKENDS))
+    parser.add_argument("--fan-outs", type=int, nargs="+", default=FAN_OUTS)
+    parser.add_argument("--size", type=int, default=10**6)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    random.seed(0)
+
+    results = [
+        bench_fan_out(backend, fan_out, args.size, args.batch_size, args.queries)
+        for backend in args.backends
+        for fan_out in args.fan_outs
+    ]
+    report = json.dumps(results, indent=2)
+    if args.output is not None:
+        args.output.write_text(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
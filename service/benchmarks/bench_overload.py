@@ -0,0 +1,200 @@
+"""Latency of `/stats/` reads during a storm of `/add_batch/` writes.
+
+Every run starts the service with one admission control mode, floods it with
+large batches from many concurrent writers and measures the latency of
+a single reader meanwhile. Writers retry rejected batches after
+`Retry-After` seconds, like well-behaved clients. Run from the `service`
+directory:
+
+    python -m benchmarks.bench_overload --output overload.json
+
+Modes: "off" disables admission control, "fair" bounds reads and writes
+independently and "reads" additionally runs writes one at a time while reads
+are queued or slower than ADMISSION_READ_SLO.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+
+MODES = {
+    "off": {"ADMISSION_ENABLED": "false"},
+    "fair": {"ADMISSION_ENABLED": "true", "ADMISSION_PRIORITY": "fair"},
+    "reads": {"ADMISSION_ENABLED": "true", "ADMISSION_PRIORITY": "reads"},
+}
+SYMBOLS = [f"SYMBOL_{i}" for i in range(4)]
+
+
+def _wait_ready(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = httpx.get(f"{url}/stats/", params={"symbol": "_", "k": 1})
+            if response.status_code == httpx.codes.NOT_FOUND:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    msg = f"Service at {url} did not start in {timeout}s"
+    raise TimeoutError(msg)
+
+
+def _write(url: str, duration: float, batch_size: int) -> Counter[int]:
+    """Send batches for `duration` seconds and count responses per status."""
+    values = [random.random() * 100 for _ in range(batch_size)]
+    statuses: Counter[int] = Counter()
+    with httpx.Client(base_url=url, timeout=60.0) as http:
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            response = http.post(
+                "/add_batch/",
+                json={"symbol": random.choice(SYMBOLS), "values": values},
+            )
+            statuses[response.status_code] += 1
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None:
+                time.sleep(float(retry_after))
+    return statuses
+
+
+def _writers(url: str, writers: int, duration: float, batch_size: int) -> dict:
+    with ThreadPoolExecutor(writers) as executor:
+        results = list(
+            executor.map(
+                lambda _: _write(url, duration, batch_size),
+                range(writers),
+            ),
+        )
+    return dict(sum(results, Counter()))
+
+
+def _read(url: str, duration: float) -> tuple[list[float], dict]:
+    """Read stats for `duration` seconds, return latencies and statuses."""
+    latencies = []
+    statuses: Counter[int] = Counter()
+    with httpx.Client(base_url=url, timeout=60.0) as http:
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            started_at = time.perf_counter()
+            response = http.get(
+                "/stats/",
+                params={"symbol": random.choice(SYMBOLS), "k": random.randint(1, 5)},
+            )
+            latencies.append(time.perf_counter() - started_at)
+            statuses[response.status_code] += 1
+            time.sleep(0.01)
+    return latencies, dict(statuses)
+
+
+def bench_overload(  # noqa: PLR0913
+    mode: str,
+    writers: int,
+    duration: float,
+    batch_size: int,
+    read_slo: float,
+    port: int,
+) -> dict:
+    """Measure read latencies and write throughput under a write storm."""
+    url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as directory:
+        server = subprocess.Popen(  # noqa: S603
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "main:app",
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(port),
+                "--log-level",
+                "warning",
+            ],
+            env=os.environ
+            | MODES[mode]
+            | {
+                "ADMISSION_READ_SLO": str(read_slo),
+                "STORAGE_BACKEND": "memory",
+                "SPILL_DIR": str(Path(directory) / "spill"),
+            },
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            _wait_ready(url, timeout=60.0)
+            for symbol in SYMBOLS:
+                httpx.post(
+                    f"{url}/add_batch/",
+                    json={"symbol": symbol, "values": [1.0]},
+                ).raise_for_status()
+            with multiprocessing.Pool(2) as pool:
+                writes = pool.apply_async(
+                    _writers,
+                    (url, writers, duration, batch_size),
+                )
+                reads = pool.apply_async(_read, (url, duration))
+                write_statuses = writes.get()
+                latencies, read_statuses = reads.get()
+        finally:
+            server.terminate()
+            server.wait()
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "mode": mode,
+        "writers": writers,
+        "batch_size": batch_size,
+        "reads": len(latencies),
+        "read_statuses": read_statuses,
+        "read_p50_ms": quantiles[49] * 1000,
+        "read_p99_ms": quantiles[98] * 1000,
+        "read_max_ms": max(latencies) * 1000,
+        "write_statuses": write_statuses,
+        "accepted_writes_per_second": write_statuses.get(httpx.codes.OK, 0) / duration,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--writers", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--read-slo", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=18100)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    results = {
+        "cpu_count": os.cpu_count(),
+        "runs": [
+            bench_overload(
+                mode,
+                args.writers,
+                args.duration,
+                args.batch_size,
+                args.read_slo,
+                args.port,
+            )
+            for mode in args.modes
+        ],
+    }
+    report = json.dumps(results, indent=2)
+    if args.output is not None:
+        args.output.write_text(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
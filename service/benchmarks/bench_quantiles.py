@@ -0,0 +1,143 @@
+"""Accuracy, latency and memory of quantile sketches against exact sorting.
+
+A `DenaryIntervalTree` of `QuantileStatistic` is filled with batches of
+`MAX_BATCH_SIZE` values, then the quantiles of the last `10**k` points ending
+at random positions are estimated by the tree and computed exactly by sorting
+the window with NumPy, as clients exporting raw values do. A tree of
+`CenteredStatistic`, which has no sketch, is the reference for the cost of
+sketches. Ingest is measured on `StatsStorage` with the windows of
+`/stats/` maintained on every write, as for other statistics, and without
+them, as served. Run from the `service` directory:
+
+    python -m benchmarks.bench_quantiles --output quantiles.json
+
+Distributions: "prices" are positive values within a few percent of each
+other, "returns" are signed values spread over many orders of magnitude,
+which makes sketches reach MAX_BINS and collapse their bins closest to zero.
+"""
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+
+from service.config import config
+from service.dependencies import WINDOWS
+from service.statistics import CenteredStatistic, QuantileStatistic
+from service.storage import StatsStorage
+from service.utils.interval_tree import DenaryIntervalTree
+
+QS = [0.01, 0.5, 0.95, 0.99]
+
+
+def _values(distribution: str, size: int) -> np.ndarray:
+    rng = np.random.default_rng(size)
+    if distribution == "prices":
+        return 10_000 * np.exp(np.cumsum(rng.normal(0, 1e-4, size)))
+    return rng.choice([-1.0, 1.0], size) * rng.lognormal(-6, 2, size)
+
+
+def _build(
+    stats_class: type[CenteredStatistic | QuantileStatistic],
+    values: np.ndarray,
+) -> tuple[DenaryIntervalTree, float]:
+    started_at = time.perf_counter()
+    tree = DenaryIntervalTree(len(values), stats_class)
+    for start in range(0, len(values), config.MAX_BATCH_SIZE):
+        tree.add(values[start : start + config.MAX_BATCH_SIZE].tolist(), start)
+    return tree, time.perf_counter() - started_at
+
+
+def _add_us(values: np.ndarray, windows: list[int], adds: int = 100) -> float:
+    """Median time of adding 10 values to a full storage of `values`."""
+    storage = StatsStorage(len(values), QuantileStatistic, windows=windows)
+    for start in range(0, len(values), config.MAX_BATCH_SIZE):
+        storage.add(values[start : start + config.MAX_BATCH_SIZE])
+    timings = []
+    for start in range(0, adds * 10, 10):
+        started_at = time.perf_counter()
+        storage.add(values[start : start + 10])
+        timings.append(time.perf_counter() - started_at)
+    return statistics.median(timings) * 1e6
+
+
+def bench_quantiles(distribution: str, size: int, queries: int) -> dict:
+    values = _values(distribution, size)
+    tree, build_s = _build(QuantileStatistic, values)
+    reference, reference_build_s = _build(CenteredStatistic, values)
+    rng = np.random.default_rng(0)
+
+    windows = {}
+    for k in range(1, len(str(size))):
+        last_n = 10**k
+        sketch_timings, exact_timings = [], []
+        errors: dict[float, list[float]] = {q: [] for q in QS}
+        for _ in range(queries):
+            end = int(rng.integers(last_n - 1, size))
+            started_at = time.perf_counter()
+            stats = tree.calculate(end - last_n + 1, end)
+            estimates = stats.quantiles(QS)
+            sketch_timings.append(time.perf_counter() - started_at)
+
+            started_at = time.perf_counter()
+            ordered = np.sort(values[end - last_n + 1 : end + 1])
+            exact = [ordered[int(q * (last_n - 1))] for q in QS]
+            exact_timings.append(time.perf_counter() - started_at)
+            for q, estimate, value in zip(QS, estimates, exact, strict=True):
+                errors[q].append(abs(estimate - value) / abs(value))
+        windows[k] = {
+            "sketch_us": statistics.median(sketch_timings) * 1e6,
+            "exact_sort_us": statistics.median(exact_timings) * 1e6,
+            "max_relative_error": {
+                f"p{q * 100:g}": max(errors_of_q) for q, errors_of_q in errors.items()
+            },
+        }
+    root = tree.calculate(0, size - 1)
+    return {
+        "distribution": distribution,
+        "size": size,
+        "relative_accuracy": QuantileStatistic.RELATIVE_ACCURACY,
+        "max_bins": QuantileStatistic.MAX_BINS,
+        "root_bins": len(root.bins),
+        "build_s": build_s,
+        "reference_build_s": reference_build_s,
+        "add_10_us": _add_us(values, []),
+        "add_10_with_windows_us": _add_us(
+            values,
+            [window for window in WINDOWS if window <= size],
+        ),
+        "tree_bytes": tree.nbytes,
+        "reference_tree_bytes": reference.nbytes,
+        "windows": windows,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--distributions",
+        nargs="+",
+        choices=["prices", "returns"],
+        default=["prices", "returns"],
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10**5, 10**6])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    results = [
+        bench_quantiles(distribution, size, args.queries)
+        for distribution in args.distributions
+        for size in args.sizes
+    ]
+    report = json.dumps(results, indent=2)
+    if args.output is not None:
+        args.output.write_text(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Query latency of the iterative range decomposition against the recursive one.
+
+For every `k` the last `10**k` points of a full tree are queried, once as a
+contiguous range and once wrapped around the end of the ring buffer, i.e. as
+two ranges. Run from the `service` directory:
+
+    python -m benchmarks.bench_query --output query.json
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from service.statistics import Statistic
+from service.utils.columnar_interval_tree import ColumnarIntervalTree
+from service.utils.interval_tree import DenaryIntervalTree
+
+
+def recursive_calculate(
+    tree: DenaryIntervalTree,
+    start: int,
+    end: int,
+) -> Statistic | None:
+    """Query recursively from the root, as done before the iterative walk."""
+    levels = tree._levels  # noqa: SLF001
+
+    def _query(depth: int, node_idx: int) -> Statistic | None:
+        level = levels[depth]
+        if node_idx >= len(level) or level[node_idx] is None:
+            return None
+        node = level[node_idx]
+        if node.interval[1] < start or end < node.interval[0]:
+            return None
+        if start <= node.interval[0] and node.interval[1] <= end:
+            return node.stat
+        children_stats = [
+            _query(depth + 1, 10 * node_idx + child_idx) for child_idx in range(10)
+        ]
+        children_stats = [stat for stat in children_stats if stat is not None]
+        if not children_stats:
+            return None
+        return Statistic.merge(*children_stats)
+
+    if not levels[0]:
+        return None
+    return _query(0, 0)
+
+
+def _median_microseconds(query: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        query()
+        timings.append(time.perf_counter() - started_at)
+    return statistics.median(timings) * 1e6
+
+
+def bench_queries(max_k: int, repeat: int) -> list[dict]:
+    size = 10**max_k
+    values = [random.random() * 100 for _ in range(size)]
+    denary = DenaryIntervalTree(size, Statistic)
+    columnar = ColumnarIntervalTree(size, Statistic)
+    for start in range(0, size, 10**4):
+        denary.add(values[start : start + 10**4], start)
+        columnar.add(values[start : start + 10**4], start)
+
+    results = []
+    for k in range(1, max_k + 1):
+        last_n = 10**k
+        # The same number of points in the middle of the buffer and split into
+        # two ranges across its end, as after the ring buffer wrapped around
+        contiguous = (size // 2 - last_n // 2, size // 2 - last_n // 2 + last_n - 1)
+        wrapped = [(size - last_n // 2, size - 1), (0, last_n - last_n // 2 - 1)]
+
+        def _recursive_wrapped(wrapped: list[tuple[int, int]] = wrapped) -> None:
+            Statistic.merge(
+                *(recursive_calculate(denary, start, end) for start, end in wrapped),
+            )
+
+        results.append(
+            {
+                "k": k,
+                "denary_recursive_us": _median_microseconds(
+                    lambda contiguous=contiguous: recursive_calculate(
+                        denary,
+                        *contiguous,
+                    ),
+                    repeat,
+                ),
+                "denary_iterative_us": _median_microseconds(
+                    lambda contiguous=contiguous: denary.calculate(*contiguous),
+                    repeat,
+                ),
+                "columnar_us": _median_microseconds(
+                    lambda contiguous=contiguous: columnar.calculate(*contiguous),
+                    repeat,
+                ),
+                "wrapped_denary_recursive_us": _median_microseconds(
+                    _recursive_wrapped,
+                    repeat,
+                ),
+                "wrapped_denary_calculate_many_us": _median_microseconds(
+                    lambda wrapped=wrapped: denary.calculate_many(wrapped),
+                    repeat,
+                ),
+                "wrapped_columnar_calculate_many_us": _median_microseconds(
+                    lambda wrapped=wrapped: columnar.calculate_many(wrapped),
+                    repeat,
+                ),
+            },
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--max-k", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    random.seed(0)
+
+    report = json.dumps(bench_queries(args.max_k, args.repeat), indent=2)
+    if args.output is not None:
+        args.output.write_text(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
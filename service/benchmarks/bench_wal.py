@@ -0,0 +1,146 @@
+"""Cost of durability: ingest throughput and recovery time with the WAL.
+
+Run from the `service` directory:
+
+    python -m benchmarks.bench_wal --output wal.json
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from service import storage
+from service.statistics import Statistic
+from service.utils.columnar_interval_tree import ColumnarIntervalTree
+from service.wal import WriteAheadLog, recover_symbol_store, snapshot_symbol_store
+
+MAX_SIZE = 10**6
+
+
+def _batch(size: int) -> list[float]:
+    return [random.random() * 100 for _ in range(size)]
+
+
+def _get_storage(
+    wal: WriteAheadLog | None,
+) -> Callable[[str], storage.StatsStorage]:
+    def _get(symbol: str) -> storage.StatsStorage:
+        return storage.get_storage_for_symbol(
+            symbol,
+            MAX_SIZE,
+            Statistic,
+            ColumnarIntervalTree,
+            log=wal.append if wal is not None else None,
+        )
+
+    return _get
+
+
+def bench_ingest(
+    fsync_interval: float | None,
+    writers: int,
+    batches: int,
+    batch_size: int,
+) -> dict:
+    """Batches per second with `writers` threads, each writing its own symbol."""
+    storage.symbol_store.clear()
+    with tempfile.TemporaryDirectory() as directory:
+        wal = (
+            WriteAheadLog(Path(directory), fsync_interval=fsync_interval)
+            if fsync_interval is not None
+            else None
+        )
+        get_storage = _get_storage(wal)
+        values = _batch(batch_size)
+
+        def _write(writer: int) -> None:
+            symbol_storage = get_storage(f"SYMBOL_{writer}")
+            for _ in range(batches):
+                symbol_storage.add(values)
+
+        threads = [threading.Thread(target=_write, args=(i,)) for i in range(writers)]
+        started_at = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started_at
+        if wal is not None:
+            wal.close()
+    return {
+        "wal": fsync_interval is not None,
+        "fsync_interval": fsync_interval,
+        "writers": writers,
+        "batch_size": batch_size,
+        "batches_per_second": writers * batches / elapsed,
+    }
+
+
+def bench_recovery(points: int, batch_size: int, *, snapshot: bool) -> dict:
+    """Seconds needed to recover one symbol holding `points` values."""
+    storage.symbol_store.clear()
+    with tempfile.TemporaryDirectory() as directory:
+        wal_dir, snapshot_dir = Path(directory) / "wal", Path(directory) / "snapshots"
+        wal = WriteAheadLog(wal_dir)
+        symbol_storage = _get_storage(wal)("SYMBOL")
+        for _ in range(points // batch_size):
+            symbol_storage.add(_batch(batch_size))
+        if snapshot:
+            snapshot_symbol_store(wal, snapshot_dir)
+        wal.close()
+        storage.symbol_store.clear()
+
+        started_at = time.perf_counter()
+        wal = WriteAheadLog(wal_dir)
+        recover_symbol_store(wal, snapshot_dir, _get_storage(None))
+        elapsed = time.perf_counter() - started_at
+        wal.close()
+
+        started_at = time.perf_counter()
+        naive_storage = _get_storage(None)("NAIVE")
+        for _, _, values in WriteAheadLog(wal_dir).read():
+            naive_storage.add(values)
+        naive_elapsed = time.perf_counter() - started_at
+    storage.symbol_store.clear()
+    return {
+        "points": points,
+        "batch_size": batch_size,
+        "snapshot": snapshot,
+        "recovery_seconds": elapsed,
+        "batch_by_batch_replay_seconds": naive_elapsed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--batches", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--points", type=int, default=10**6)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+    random.seed(0)
+
+    results = {
+        "ingest": [
+            bench_ingest(fsync_interval, args.writers, args.batches, args.batch_size)
+            for fsync_interval in (None, 0.0, 0.001, 0.005)
+        ],
+        "recovery": [
+            bench_recovery(args.points, args.batch_size, snapshot=snapshot)
+            for snapshot in (False, True)
+        ],
+    }
+    report = json.dumps(results, indent=2)
+    if args.output is not None:
+        args.output.write_text(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
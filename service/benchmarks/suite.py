@@ -0,0 +1,336 @@
+"""Benchmark suite for the tree, storage and HTTP hot paths.
+
+Covers tree construction at several sizes, `StatsStorage.add` with batch
+sizes up to `MAX_BATCH_SIZE` with and without maintained windows,
+`StatsStorage.get` at every `k` with and
+without ring wraparound, RSS per symbol (Linux only) and end-to-end `/add_batch/`
+and `/stats/` requests through an in-process ASGI client.
+
+Every measurement is a named metric saved as JSON, so that runs can be
+compared against a baseline run. Run from the `service` directory:
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --output new.json --baseline results.json
+
+With a baseline, metrics worse than the baseline by more than `--tolerance`
+are reported and the exit status is 1.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Literal, TypedDict
+
+import httpx
+import numpy as np
+
+from main import app
+from service import storage
+from service.config import config
+from service.dependencies import TREE_BACKENDS, WINDOWS
+from service.statistics import Statistic
+
+Better = Literal["lower", "higher"]
+
+BATCH_SIZES = (1, 10, 100, 1000, config.MAX_BATCH_SIZE)
+
+
+class Metric(TypedDict):
+    # Unique name, used to match metrics of different runs
+    name: str
+    value: float
+    unit: str
+    better: Better
+
+
+def _metric(name: str, value: float, unit: str, better: Better) -> Metric:
+    return Metric(name=name, value=value, unit=unit, better=better)
+
+
+def _median_us(timings: list[float]) -> float:
+    return statistics.median(timings) * 1e6
+
+
+def _values(size: int) -> np.ndarray:
+    return np.random.default_rng(size).random(size) * 100
+
+
+def bench_tree_construction(sizes: list[int]) -> Iterator[Metric]:
+    """Fill trees of every size with batches of `MAX_BATCH_SIZE` values."""
+    for backend, tree_class in TREE_BACKENDS.items():
+        for size in sizes:
+            values = _values(size)
+            started_at = time.perf_counter()
+            tree = tree_class(size, Statistic)
+            for start in range(0, size, config.MAX_BATCH_SIZE):
+                tree.add(values[start : start + config.MAX_BATCH_SIZE], start)
+            yield _metric(
+                f"tree_construction.{backend}.size_{size}",
+                time.perf_counter() - started_at,
+                "s",
+                "lower",
+            )
+
+
+def _filled_storage(
+    backend: str,
+    size: int,
+    windows: list[int] = WINDOWS,
+) -> storage.StatsStorage:
+    stats_storage = storage.StatsStorage(
+        size,
+        Statistic,
+        TREE_BACKENDS[backend],
+        windows=[window for window in windows if window <= size],
+    )
+    values = _values(size)
+    for start in range(0, size, config.MAX_BATCH_SIZE):
+        stats_storage.add(values[start : start + config.MAX_BATCH_SIZE])
+    return stats_storage
+
+
+def bench_storage_add(size: int, repeat: int) -> Iterator[Metric]:
+    """Median latency of adding a batch to a full storage, for every batch size.
+
+    Storages maintain the windows of `/stats/` on every write, as served.
+    `storage_add_without_windows` metrics leave them out, the difference is
+    the cost of refreshing them.
+    """
+    for name, windows in (
+        ("storage_add", WINDOWS),
+        ("storage_add_without_windows", []),
+    ):
+        for backend in TREE_BACKENDS:
+            stats_storage = _filled_storage(backend, size, windows)
+            for batch_size in BATCH_SIZES:
+                batch = _values(batch_size)
+                timings = []
+                for _ in range(repeat):
+                    started_at = time.perf_counter()
+                    stats_storage.add(batch)
+                    timings.append(time.perf_counter() - started_at)
+                yield _metric(
+                    f"{name}.{backend}.batch_{batch_size}",
+                    _median_us(timings),
+                    "us",
+                    "lower",
+                )
+
+
+def bench_storage_get(size: int, repeat: int) -> Iterator[Metric]:
+    """Median latency of `get` at every `k`, with and without wraparound.
+
+    Windows are answered without walking the tree, so the storage keeps none
+    of them here.
+    """
+    for backend in TREE_BACKENDS:
+        stats_storage = storage.StatsStorage(size, Statistic, TREE_BACKENDS[backend])
+        stats_storage.add(_values(size))
+        for wrapped in (False, True):
+            if wrapped:
+                # The last point is now at the start of the buffer, so every
+                # query wraps around its end
+                stats_storage.add(_values(1))
+            for k in range(1, len(str(size))):
+                timings = []
+                for _ in range(repeat):
+                    started_at = time.perf_counter()
+                    stats_storage.get(10**k)
+                    timings.append(time.perf_counter() - started_at)
+                yield _metric(
+                    f"storage_get.{backend}.{'wrapped' if wrapped else 'contiguous'}"
+                    f".k_{k}",
+                    _median_us(timings),
+                    "us",
+                    "lower",
+                )
+
+
+def _rss() -> int:
+    """Return the current resident set size of the process, Linux only."""
+    resident_pages = int(Path("/proc/self/statm").read_text().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def _rss_per_symbol(backend: str, symbols: int, points: int) -> float:
+    """RSS growth per symbol, run in a fresh process."""
+    # Kept alive, so that memory of imports and the first allocations is
+    # not mistaken for memory of the measured symbols
+    storages = [_filled_storage(backend, points)]
+    before = _rss()
+    storages += [_filled_storage(backend, points) for _ in range(symbols)]
+    return (_rss() - before) / symbols
+
+
+def bench_rss_per_symbol(symbols: int, points: int) -> Iterator[Metric]:
+    if not Path("/proc/self/statm").exists():
+        return
+    context = multiprocessing.get_context("spawn")
+    for backend in TREE_BACKENDS:
+        with context.Pool(1) as pool:
+            rss = pool.apply(_rss_per_symbol, (backend, symbols, points))
+        yield _metric(
+            f"rss_per_symbol.{backend}.points_{points}",
+            rss,
+            "bytes",
+            "lower",
+        )
+
+
+async def _load(
+    client: httpx.AsyncClient,
+    worker: int,
+    requests: int,
+    latencies: dict[str, list[float]],
+) -> None:
+    symbol = f"BENCH_{worker}"
+    values = _values(100).tolist()
+    for i in range(requests):
+        started_at = time.perf_counter()
+        if i % 2:
+            response = await client.get(
+                "/stats/",
+                params={"symbol": symbol, "k": random.randint(1, 4)},
+            )
+            endpoint = "stats"
+        else:
+            response = await client.post(
+                "/add_batch/",
+                json={"symbol": symbol, "values": values},
+            )
+            endpoint = "add_batch"
+        response.raise_for_status()
+        latencies[endpoint].append(time.perf_counter() - started_at)
+
+
+async def _bench_http(concurrency: int, requests: int) -> list[Metric]:
+    storage.symbol_store.clear()
+    latencies: dict[str, list[float]] = {"add_batch": [], "stats": []}
+    transport = httpx.ASGITransport(app)
+    async with httpx.AsyncClient(
+        transport=transport,
+        base_url="http://bench",
+    ) as client:
+        started_at = time.perf_counter()
+        await asyncio.gather(
+            *(
+                _load(client, worker, requests, latencies)
+                for worker in range(concurrency)
+            ),
+        )
+        elapsed = time.perf_counter() - started_at
+    storage.symbol_store.clear()
+
+    metrics = [
+        _metric(
+            "http.requests_per_second",
+            concurrency * requests / elapsed,
+            "1/s",
+            "higher",
+        ),
+    ]
+    for endpoint, timings in latencies.items():
+        quantiles = statistics.quantiles(timings, n=100)
+        metrics += [
+            _metric(f"http.{endpoint}.p50", quantiles[49] * 1e6, "us", "lower"),
+            _metric(f"http.{endpoint}.p99", quantiles[98] * 1e6, "us", "lower"),
+        ]
+    return metrics
+
+
+def bench_http(concurrency: int, requests: int) -> Iterator[Metric]:
+    """Mixed `/add_batch/` and `/stats/` load from concurrent in-process clients."""
+    yield from asyncio.run(_bench_http(concurrency, requests))
+
+
+def compare(
+    results: list[Metric],
+    baseline: list[Metric],
+    tolerance: float,
+) -> list[str]:
+    """Describe metrics worse than the baseline by more than `tolerance`."""
+    baseline_values = {metric["name"]: metric["value"] for metric in baseline}
+    regressions = []
+    for metric in results:
+        base = baseline_values.get(metric["name"])
+        if not base:
+            continue
+        change = metric["value"] / base - 1
+        if metric["better"] == "higher":
+            change = -change
+        if change > tolerance:
+            regressions.append(
+                f"{metric['name']}: {base:.6g} -> {metric['value']:.6g} "
+                f"{metric['unit']} ({change:+.0%} worse)",
+            )
+    return regressions
+
+
+def _run(benchmarks: list[Callable[[], Iterator[Metric]]]) -> list[Metric]:
+    results = []
+    for benchmark in benchmarks:
+        for metric in benchmark():
+            print(f"{metric['name']}: {metric['value']:.6g} {metric['unit']}")
+            results.append(metric)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10**4, 10**5, 10**6])
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--rss-symbols", type=int, default=20)
+    parser.add_argument("--rss-points", type=int, default=10**5)
+    parser.add_argument("--http-concurrency", type=int, default=16)
+    parser.add_argument("--http-requests", type=int, default=200)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    random.seed(0)
+
+    size = max(args.sizes)
+    results = _run(
+        [
+            lambda: bench_tree_construction(args.sizes),
+            lambda: bench_storage_add(size, args.repeat),
+            lambda: bench_storage_get(size, args.repeat),
+            lambda: bench_rss_per_symbol(args.rss_symbols, args.rss_points),
+            lambda: bench_http(args.http_concurrency, args.http_requests),
+        ],
+    )
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "metrics": results,
+    }
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())["metrics"]
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,42 @@
 import logging
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
 
+from service import admin, monitoring
+from service.admission import (
+    AdmissionMiddleware,
+    OverloadedError,
+    overloaded_response,
+)
+from service.config import config
 from service.controllers import router
+from service.dependencies import close_storages, load_storages
 
 logger = logging.getLogger(__name__)
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    load_storages()
+    yield
+    close_storages()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(router)
+app.include_router(monitoring.router)
+app.include_router(admin.router)
+app.add_middleware(AdmissionMiddleware)
+if config.METRICS_ENABLED:
+    app.add_middleware(monitoring.MetricsMiddleware)
+
+
+@app.exception_handler(OverloadedError)
+def overloaded_exception_handler(_: Request, exc: OverloadedError) -> JSONResponse:
+    return overloaded_response(exc)
 
 
 @app.exception_handler(ValueError)
@@ -1,4 +1,7 @@
 #!/bin/bash
 set -e
 
+if [ "${SHARDS:-1}" -gt 1 ]; then
+    exec python -m service.cluster --shards "$SHARDS" --routers "${ROUTERS:-$SHARDS}" --port 8000
+fi
 python -m uvicorn main:app --host 0.0.0.0 --port 8000
@@ -0,0 +1,124 @@
+import logging
+
+from fastapi import APIRouter, status
+from fastapi.exceptions import HTTPException
+
+from service import backfill, storage
+from service.config import config
+from service.dependencies import backfill_symbol, drop_symbol
+from service.dtos import (
+    BackfillRequest,
+    BackfillResponse,
+    DropSymbolResponse,
+    SymbolsResponse,
+)
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+def _check_enabled() -> None:
+    if not config.ADMIN_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Admin endpoints are disabled",
+        )
+
+
+@router.get(
+    "/symbols/",
+    name="List symbols",
+    description="Every resident and spilled symbol with its footprint, "
+    "from the largest. Disabled unless ADMIN_ENABLED is set.",
+    responses={
+        status.HTTP_200_OK: {
+            "model": SymbolsResponse,
+        },
+        status.HTTP_404_NOT_FOUND: {"description": "Admin endpoints are disabled"},
+    },
+)
+def list_symbols_controller() -> SymbolsResponse:
+    _check_enabled()
+    footprints = sorted(
+        storage.symbol_footprints(),
+        key=lambda footprint: footprint.bytes,
+        reverse=True,
+    )
+    return SymbolsResponse(
+        symbols=[
+            SymbolsResponse.Symbol(**footprint._asdict()) for footprint in footprints
+        ],
+        resident_bytes=sum(
+            footprint.bytes for footprint in footprints if footprint.resident
+        ),
+    )
+
+
+@router.delete(
+    "/symbols/{symbol:path}/",
+    name="Drop symbol",
+    description="Delete all data points of a symbol, resident or spilled. "
+    "Disabled unless ADMIN_ENABLED is set.",
+    responses={
+        status.HTTP_200_OK: {
+            "model": DropSymbolResponse,
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "description": "Unknown symbol or admin endpoints are disabled",
+        },
+    },
+)
+def drop_symbol_controller(symbol: str) -> DropSymbolResponse:
+    _check_enabled()
+    if not drop_symbol(symbol):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No data points found for the symbol",
+        )
+    logger.info("Dropped symbol %s", symbol)
+    return DropSymbolResponse(symbol=symbol, message="OK")
+
+
+@router.post(
+    "/symbols/{symbol:path}/backfill/",
+    name="Backfill symbol",
+    description="Replace all data points of a symbol with those of a CSV or raw "
+    "binary file under BACKFILL_DIR. The tree is built aside in one bottom-up "
+    "pass and installed at once, readers never see a partial backfill. "
+    "Disabled unless ADMIN_ENABLED is set.",
+    responses={
+        status.HTTP_200_OK: {
+            "model": BackfillResponse,
+        },
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "Path outside BACKFILL_DIR or invalid file",
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "description": "Unknown file or admin endpoints are disabled",
+        },
+    },
+)
+def backfill_symbol_controller(
+    symbol: str,
+    request: BackfillRequest,
+) -> BackfillResponse:
+    _check_enabled()
+    root = config.BACKFILL_DIR.resolve()
+    path = (root / request.path).resolve()
+    if not path.is_relative_to(root):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Path must be inside BACKFILL_DIR",
+        )
+    if not path.is_file():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No such file",
+        )
+    points = backfill_symbol(
+        symbol,
+        backfill.read_file(path, request.format, request.value_type),
+        request.timestamp,
+    )
+    logger.info("Backfilled symbol %s with %d points from %s", symbol, points, path)
+    return BackfillResponse(symbol=symbol, points=points)
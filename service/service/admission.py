@@ -0,0 +1,333 @@
+"""Admission control of HTTP requests, applied before they cost any work.
+
+Reads and writes are admitted by separate pools, each running a bounded
+number of requests at once and queueing a bounded number of others for
+a bounded time. Requests which cannot be queued are answered at once, so that
+bursts of writes stuck behind slow tree repairs cannot delay reads
+indefinitely:
+
+- 503 when the queue of the pool is full or the request waited too long,
+- 429 when too many requests of the same symbol are running or queued.
+
+Both carry a `Retry-After` header. Pools are applied by `AdmissionMiddleware`
+before the body of a request is even read, since parsing large batches takes
+the event loop away from reads. Symbols are only known once the body is
+parsed, so routes opt in to the per-symbol limit with
+`dependencies=[Depends(limit_symbols("read"))]`.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from typing import Literal
+
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from service import metrics
+from service.config import config
+
+Pool = Literal["read", "write"]
+
+# Reads finished longer ago than this no longer slow writes down
+_SLO_WINDOW = 1.0
+# Weight of the latest read in the moving average of read latencies
+_LATENCY_WEIGHT = 0.2
+
+
+class OverloadedError(Exception):
+    """Raised when a request is not admitted."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        """Initialize error.
+
+        :param message: Reason of the rejection
+        :param status_code: 429 or 503
+        :param retry_after: Seconds the client should wait before retrying
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded concurrency and queues for reads and writes, per process.
+
+    A request is admitted at once when its pool runs fewer requests than its
+    limit and nobody is queued before it, and otherwise waits in the FIFO
+    queue of the pool. Released slots are handed over to queued requests
+    directly, so a newcomer can never overtake them.
+
+    With `priority="reads"`, writes run one at a time while reads are queued
+    or reads finished recently took longer than `read_slo` seconds on
+    average. Writes keep making progress, but leave the CPU and the
+    worker threads to reads until they are fast again.
+
+    Note:
+        - This class is **not thread-safe**, it must be used from the event
+            loop of the application only.
+
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        read_concurrency: int,
+        write_concurrency: int,
+        max_queue: int,
+        queue_timeout: float,
+        max_symbol_queue: int,
+        priority: Literal["fair", "reads"] = "fair",
+        read_slo: float = 0.05,
+        retry_after: int = 1,
+    ):
+        """Initialize controller.
+
+        :param read_concurrency: Maximum number of reads running at once
+        :param write_concurrency: Maximum number of writes running at once
+        :param max_queue: Maximum number of requests queued per pool
+        :param queue_timeout: Seconds a request may wait in the queue
+        :param max_symbol_queue: Maximum number of requests of a symbol
+            running or queued per pool
+        :param priority: "fair" keeps pools independent, "reads" slows writes
+            down while reads are queued or slow
+        :param read_slo: Target average latency of reads in seconds
+        :param retry_after: Value of the `Retry-After` header of rejections
+        """
+        self._limits: dict[Pool, int] = {
+            "read": read_concurrency,
+            "write": write_concurrency,
+        }
+        self._max_queue = max_queue
+        self._queue_timeout = queue_timeout
+        self._max_symbol_queue = max_symbol_queue
+        self._priority = priority
+        self._read_slo = read_slo
+        self._retry_after = retry_after
+        self._running: dict[Pool, int] = {"read": 0, "write": 0}
+        self._queues: dict[Pool, deque[asyncio.Future[None]]] = {
+            "read": deque(),
+            "write": deque(),
+        }
+        self._symbols: dict[tuple[Pool, str], int] = {}
+        self._read_latency = 0.0
+        self._last_read_at = -math.inf
+
+    @asynccontextmanager
+    async def admit(self, pool: Pool) -> AsyncIterator[None]:
+        """Hold a slot of the pool for the duration of the context.
+
+        :raises OverloadedError: If the request is not admitted
+        """
+        started_at = time.monotonic()
+        await self._acquire(pool)
+        try:
+            yield
+        finally:
+            self._release(pool, time.monotonic() - started_at)
+
+    @contextmanager
+    def limit_symbols(self, pool: Pool, symbols: Iterable[str]) -> Iterator[None]:
+        """Count the request against the limit of each of its symbols.
+
+        :raises OverloadedError: If a symbol already has too many requests
+        """
+        keys = [(pool, symbol) for symbol in set(symbols)]
+        if any(self._symbols.get(key, 0) >= self._max_symbol_queue for key in keys):
+            self._reject(pool, "symbol")
+            raise OverloadedError(
+                "Too many concurrent requests for the symbol",
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                self._retry_after,
+            )
+        for key in keys:
+            self._symbols[key] = self._symbols.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            for key in keys:
+                self._symbols[key] -= 1
+                if not self._symbols[key]:
+                    del self._symbols[key]
+
+    def queued(self, pool: Pool) -> int:
+        return len(self._queues[pool])
+
+    async def _acquire(self, pool: Pool) -> None:
+        queue = self._queues[pool]
+        if not queue and self._can_start(pool):
+            self._running[pool] += 1
+            return
+        if len(queue) >= self._max_queue:
+            self._reject(pool, "queue")
+            raise OverloadedError(
+                "Too many queued requests",
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                self._retry_after,
+            )
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self._queue_timeout)
+        # Not the builtin TimeoutError before Python 3.11
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done():
+                # The slot was handed over just before the timeout
+                self._running[pool] -= 1
+                self._dispatch()
+            else:
+                waiter.cancel()
+                queue.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject(pool, "timeout")
+            raise OverloadedError(
+                "Request waited too long in the queue",
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                self._retry_after,
+            ) from e
+
+    def _release(self, pool: Pool, latency: float) -> None:
+        self._running[pool] -= 1
+        if pool == "read":
+            self._read_latency += _LATENCY_WEIGHT * (latency - self._read_latency)
+            self._last_read_at = time.monotonic()
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots over to queued requests, reads first."""
+        for pool in ("read", "write"):
+            queue = self._queues[pool]
+            while queue and self._can_start(pool):
+                self._running[pool] += 1
+                queue.popleft().set_result(None)
+
+    def _can_start(self, pool: Pool) -> bool:
+        limit = self._limits[pool]
+        if pool == "write" and self._priority == "reads" and self._reads_struggle():
+            limit = 1
+        return self._running[pool] < limit
+
+    def _reads_struggle(self) -> bool:
+        if self._queues["read"]:
+            return True
+        recent = time.monotonic() - self._last_read_at < _SLO_WINDOW
+        return recent and self._read_latency > self._read_slo
+
+    def _reject(self, pool: Pool, reason: str) -> None:
+        metrics.rejected_requests.inc(1, pool, reason)
+
+
+# Documentation of rejections, for the `responses` of admitted routes
+RESPONSES: dict[int | str, dict] = {
+    status.HTTP_429_TOO_MANY_REQUESTS: {
+        "model": dict,
+        "description": "Too many concurrent requests for the symbol",
+    },
+    status.HTTP_503_SERVICE_UNAVAILABLE: {
+        "model": dict,
+        "description": "Service is overloaded, retry after `Retry-After` seconds",
+    },
+}
+
+controller = AdmissionController(
+    read_concurrency=config.ADMISSION_READ_CONCURRENCY,
+    write_concurrency=config.ADMISSION_WRITE_CONCURRENCY,
+    max_queue=config.ADMISSION_MAX_QUEUE,
+    queue_timeout=config.ADMISSION_QUEUE_TIMEOUT,
+    max_symbol_queue=config.ADMISSION_MAX_SYMBOL_QUEUE,
+    priority=config.ADMISSION_PRIORITY,
+    read_slo=config.ADMISSION_READ_SLO,
+    retry_after=config.ADMISSION_RETRY_AFTER,
+)
+
+
+def overloaded_response(error: OverloadedError) -> JSONResponse:
+    return JSONResponse(
+        status_code=error.status_code,
+        content={"message": str(error)},
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+class AdmissionMiddleware:
+    """Admit HTTP requests of ingest and stats routes through their pool.
+
+    The slot is held until the response is sent, reading and parsing the body
+    included. Other routes and websockets are left untouched, batch streams
+    have backpressure of their own.
+    """
+
+    def __init__(self, app: ASGIApp):
+        """Initialize middleware.
+
+        :param app: Wrapped application
+        """
+        self._app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Forward the request once admitted, or reject it."""
+        pool = _pool(scope) if config.ADMISSION_ENABLED else None
+        if pool is None:
+            await self._app(scope, receive, send)
+            return
+        admitted = False
+        try:
+            async with controller.admit(pool):
+                admitted = True
+                await self._app(scope, receive, send)
+        except OverloadedError as e:
+            if admitted:
+                raise
+            await overloaded_response(e)(scope, receive, send)
+
+
+def _pool(scope: Scope) -> Pool | None:
+    if scope["type"] != "http":
+        return None
+    if scope["path"].startswith("/stats/"):
+        return "read"
+    if scope["method"] == "POST" and scope["path"].startswith("/add_batch/"):
+        return "write"
+    return None
+
+
+def limit_symbols(pool: Pool) -> Callable[[Request], AsyncIterator[None]]:
+    """Return a route dependency limiting requests per symbol in `pool`."""
+
+    async def _limit(request: Request) -> AsyncIterator[None]:
+        if not config.ADMISSION_ENABLED:
+            yield
+            return
+        with controller.limit_symbols(pool, await _request_symbols(request)):
+            yield
+
+    return _limit
+
+
+async def _request_symbols(request: Request) -> list[str]:
+    """Return the symbols a request reads or writes.
+
+    Symbols are taken from the path or the query, or else from a JSON body,
+    which FastAPI has already parsed and cached by the time dependencies run.
+    """
+    symbol = request.path_params.get("symbol") or request.query_params.get("symbol")
+    if symbol is not None:
+        return [symbol]
+    if request.headers.get("content-type", "").startswith("application/json"):
+        body = await request.json()
+        if isinstance(body, dict):
+            if isinstance(body.get("symbol"), str):
+                return [body["symbol"]]
+            if isinstance(body.get("batches"), dict):
+                return list(body["batches"])
+            if isinstance(body.get("queries"), list):
+                return [
+                    query["symbol"]
+                    for query in body["queries"]
+                    if isinstance(query, dict) and isinstance(query.get("symbol"), str)
+                ]
+    return []
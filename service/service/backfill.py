@@ -0,0 +1,239 @@
+"""Bulk loading of historical data points from local files.
+
+A backfilled symbol is built aside in a fresh storage and installed at once
+with `storage.install_storage`, replacing anything stored for the symbol
+before. Files are read in large chunks and every chunk is appended to the
+tree with a single `add`, right after the previous one. Every level is thus
+computed once, bottom-up, in a linear pass over the data, while HTTP ingest
+would repair the tree once per batch of at most MAX_BATCH_SIZE points.
+
+Chunks are applied with `StatsStorage.replay`, so the points are not written
+to the write-ahead log one by one. When the log is enabled, the installed
+storage is snapshotted instead, see `install_storage`.
+"""
+
+import functools
+import math
+import shutil
+import time
+import warnings
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from pathlib import Path
+from typing import Literal, NoReturn
+
+import numpy as np
+
+from service import storage
+from service.dtos import BINARY_DTYPES, BinaryValueType
+from service.statistics import StatisticProtocol
+from service.utils.interval_tree import IntervalTreeProtocol
+
+BackfillFormat = Literal["csv", "binary"]
+
+# Size of the chunks files are read in
+CHUNK_BYTES = 64 * 2**20
+
+Chunk = tuple[np.ndarray, np.ndarray | None]
+
+
+def read_csv(path: Path, chunk_bytes: int = CHUNK_BYTES) -> Iterator[Chunk]:
+    """Yield values and timestamps of a CSV file, chunk by chunk.
+
+    Every line holds either a value or a `timestamp,value` pair, all lines
+    of a file alike. A first line which is not numeric is skipped as
+    a header.
+
+    :raises ValueError: If a line cannot be parsed, naming its line number
+    """
+    columns: int | None = None
+    rest = b""
+    first_line = True
+    # Number in the file of the first line of `lines`
+    line_number = 1
+    with path.open("rb") as file:
+        while True:
+            data = file.read(chunk_bytes)
+            lines = rest + data
+            separator = b""
+            if data:
+                # The last line may continue in the next chunk
+                lines, separator, rest = lines.rpartition(b"\n")
+            next_line_number = line_number + lines.count(b"\n") + len(separator)
+            if first_line and lines:
+                header, _, body = lines.partition(b"\n")
+                if not _is_numeric(header):
+                    lines = body
+                    line_number += 1
+                first_line = False
+            if lines.strip():
+                if columns is None:
+                    columns = lines.lstrip().split(b"\n", 1)[0].count(b",") + 1
+                    if columns > 2:  # noqa: PLR2004
+                        msg = "Lines must hold a value or a timestamp and a value"
+                        raise ValueError(msg)
+                yield _parse_csv(lines, columns, line_number)
+            if not data:
+                return
+            line_number = next_line_number
+
+
+def _is_numeric(line: bytes) -> bool:
+    try:
+        [float(field) for field in line.split(b",")]
+    except ValueError:
+        return False
+    return True
+
+
+def _parse_csv(lines: bytes, columns: int, line_number: int) -> Chunk:
+    """Parse CSV lines holding `columns` fields each.
+
+    :param line_number: Number in the file of the first of `lines`
+    """
+    # Blank lines around are ignored, lines must not be split across them
+    text = lines.rstrip()
+    stripped = text.lstrip()
+    line_number += text.count(b"\n", 0, len(text) - len(stripped))
+    # Counting commas per line catches lines with fields missing or extra,
+    # which would otherwise balance out in the total number of fields
+    buffer = np.frombuffer(stripped, dtype=np.uint8)
+    commas = np.flatnonzero(buffer == ord(","))
+    ends = np.searchsorted(commas, np.flatnonzero(buffer == ord("\n")))
+    commas_per_line = np.diff(ends, prepend=0, append=len(commas))
+    invalid = np.flatnonzero(commas_per_line != columns - 1)
+    if len(invalid):
+        _raise_invalid_line(line_number + int(invalid[0]), columns)
+    # NumPy parses separated text in C, far faster than the csv module. At an
+    # invalid field it raises, or stops with a warning in older versions
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            fields = np.fromstring(stripped.replace(b",", b" "), sep=" ")
+    except ValueError:
+        fields = None
+    if fields is None or len(fields) != len(commas_per_line) * columns:
+        # Rare, so the offending line is looked up line by line
+        for offset, line in enumerate(stripped.split(b"\n")):
+            if not _is_numeric(line):
+                _raise_invalid_line(line_number + offset, columns)
+        _raise_invalid_line(line_number, columns)
+    if columns == 1:
+        return fields, None
+    rows_fields = fields.reshape(-1, 2)
+    return rows_fields[:, 1].copy(), rows_fields[:, 0].copy()
+
+
+def _raise_invalid_line(line_number: int, columns: int) -> NoReturn:
+    msg = f"Line {line_number} must hold {columns} numeric field(s)"
+    raise ValueError(msg)
+
+
+def read_binary(
+    path: Path,
+    value_type: BinaryValueType = "float64",
+    chunk_bytes: int = CHUNK_BYTES,
+) -> Iterator[Chunk]:
+    """Yield values of a file of raw little-endian floats, chunk by chunk.
+
+    :raises ValueError: If the file size is not a multiple of the value size
+    """
+    dtype = BINARY_DTYPES[value_type]
+    if path.stat().st_size % dtype.itemsize:
+        msg = f"File size must be a multiple of {dtype.itemsize}"
+        raise ValueError(msg)
+    count = chunk_bytes // dtype.itemsize
+    with path.open("rb") as file:
+        while True:
+            values = np.fromfile(file, dtype=dtype, count=count)
+            if not len(values):
+                return
+            yield values.astype(np.float64, copy=False), None
+
+
+def read_file(
+    path: Path,
+    file_format: BackfillFormat,
+    value_type: BinaryValueType = "float64",
+) -> Iterator[Chunk]:
+    if file_format == "csv":
+        return read_csv(path)
+    return read_binary(path, value_type)
+
+
+def backfill(  # noqa: PLR0913
+    symbol: str,
+    chunks: Iterable[Chunk],
+    max_size: int,
+    stats_class: type[StatisticProtocol],
+    tree_class: type[IntervalTreeProtocol],
+    spill_dir: Path,
+    windows: Sequence[int] = (),
+    data_dir: Path | None = None,
+    log: Callable[[str, Sequence[float], np.ndarray], int] | None = None,
+    next_lsn: Callable[[], int] | None = None,
+    linger: float = 0.0,
+    timestamp: float | None = None,
+) -> int:
+    """Replace all data of a symbol with the points of `chunks`.
+
+    Chunks without timestamps are stamped with `timestamp`, or with the
+    current time. Only the latest `max_size` points are kept, like with any
+    other ingest.
+
+    :param log: Write-ahead log hook of the installed storage, for later writes
+    :param next_lsn: Returns the LSN of the next log record, see
+        `storage.install_storage`
+    :raises ValueError: If values are not finite or timestamps decrease,
+        the symbol is then left untouched
+    :return: Number of points read
+    """
+    directory = None
+    if data_dir is not None:
+        directory = storage.staging_directory(data_dir, symbol)
+        # Left over by an interrupted backfill
+        shutil.rmtree(directory, ignore_errors=True)
+    built = storage.StatsStorage[stats_class](
+        max_size=max_size,
+        stats_class=stats_class,
+        tree_class=tree_class,
+        windows=windows,
+        directory=directory,
+        log=functools.partial(log, symbol) if log is not None else None,
+        linger=linger,
+    )
+    try:
+        points = _fill(built, chunks, max_size, timestamp)
+        storage.install_storage(symbol, built, spill_dir, data_dir, next_lsn)
+    except BaseException:
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return points
+
+
+def _fill(
+    built: storage.StatsStorage,
+    chunks: Iterable[Chunk],
+    max_size: int,
+    timestamp: float | None,
+) -> int:
+    stamp = time.time() if timestamp is None else timestamp
+    last = -math.inf
+    points = 0
+    for values, read_timestamps in chunks:
+        if not len(values):
+            continue
+        if not np.isfinite(values).all():
+            raise ValueError("Values must not contain NaN or infinite values")
+        timestamps = read_timestamps
+        if timestamps is None:
+            timestamps = np.full(len(values), stamp)
+        elif not np.isfinite(timestamps).all():
+            raise ValueError("Timestamps must be finite")
+        if timestamps[0] < last or (np.diff(timestamps) < 0).any():
+            raise ValueError("Timestamps must not decrease")
+        last = timestamps[-1]
+        points += len(values)
+        # Points older than the last `max_size` ones would be overwritten
+        built.replay(values[-max_size:], 0, timestamps[-max_size:])
+    return points
@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+
+from service import metrics
+from service.config import config
+
+
+class ResponseCache:
+    """Bounded LRU cache of encoded responses tagged with a data version.
+
+    An entry is only returned for the version it was stored with, so bumping
+    the version of the underlying data invalidates it without any explicit
+    eviction. The total size of cached bodies never exceeds `max_bytes`,
+    least recently used entries are evicted first.
+
+    Attributes:
+        _max_bytes (int): Memory cap for cached bodies.
+        _entries (OrderedDict[Hashable, tuple[int, bytes]]): Version and body
+            of every cached key, from least to most recently used.
+        _size (int): Total size of cached bodies.
+        _lookups (metrics.Counter | None): Counter of lookups exported per
+            result, "hit" or "miss".
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups which found no fresh entry.
+
+    This class is thread-safe.
+
+    """
+
+    def __init__(self, max_bytes: int, lookups: metrics.Counter | None = None):
+        """Initialize cache.
+
+        :param max_bytes: Maximum total size of cached bodies
+        :param lookups: Counter labelled with the result of every lookup
+        """
+        self._max_bytes = max_bytes
+        self._lookups = lookups
+        self._entries: OrderedDict[Hashable, tuple[int, bytes]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        """Return the number of cached entries."""
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get(self, key: Hashable, version: int) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                body = None
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                body = entry[1]
+        if self._lookups is not None:
+            self._lookups.inc(1, "miss" if body is None else "hit")
+        return body
+
+    def put(self, key: Hashable, version: int, body: bytes) -> None:
+        if len(body) > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            self._entries[key] = (version, body)
+            self._size += len(body)
+            while self._size > self._max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+stats_cache = ResponseCache(
+    config.STATS_CACHE_MAX_BYTES,
+    metrics.stats_cache_lookups,
+)
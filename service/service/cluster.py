@@ -0,0 +1,96 @@
+"""Run the service as hash-sharded processes behind stateless routers.
+
+Every shard is a regular single-process service owning the symbols hashed to
+it (see `service.sharding.shard_for`), with its own DATA_DIR, WAL_DIR and
+SPILL_DIR. BACKFILL_DIR is shared, backfills are routed to the shard owning
+their symbol, which reads the file from there.
+Routers are stateless, so they run as `--routers` uvicorn workers sharing
+the public port and forward every request to the shard owning its symbol.
+
+    python -m service.cluster --shards 4 --routers 4 --port 8000
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from types import FrameType
+
+from service.config import config
+
+
+def _uvicorn(app: str, host: str, port: int, *extra_args: str) -> list[str]:
+    return [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        app,
+        "--host",
+        host,
+        "--port",
+        str(port),
+        *extra_args,
+    ]
+
+
+def _shard_env(shard: int) -> dict[str, str]:
+    """Directories owned by a shard, which deletes stale files found in them."""
+    return {
+        name: str(getattr(config, name) / f"shard-{shard}")
+        for name in ("DATA_DIR", "WAL_DIR", "SPILL_DIR")
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shards", type=int, default=os.cpu_count())
+    parser.add_argument("--routers", type=int, default=os.cpu_count())
+    parser.add_argument("--host", default="0.0.0.0")  # noqa: S104
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--shard-port", type=int, default=9000)
+    args = parser.parse_args()
+
+    shard_urls = [
+        f"http://127.0.0.1:{args.shard_port + shard}" for shard in range(args.shards)
+    ]
+    processes = [
+        subprocess.Popen(  # noqa: S603
+            _uvicorn("main:app", "127.0.0.1", args.shard_port + shard),
+            env=os.environ | _shard_env(shard),
+        )
+        for shard in range(args.shards)
+    ]
+    processes.append(
+        subprocess.Popen(  # noqa: S603
+            _uvicorn(
+                "service.sharding:router_app",
+                args.host,
+                args.port,
+                "--workers",
+                str(args.routers),
+            ),
+            env=os.environ | {"SHARD_URLS": json.dumps(shard_urls)},
+        ),
+    )
+
+    def _terminate(*_: int | FrameType | None) -> None:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGINT, _terminate)
+    # The cluster is only useful as a whole, stop it when any process exits
+    while all(process.poll() is None for process in processes):
+        time.sleep(0.5)
+    _terminate()
+    for process in processes:
+        process.wait()
+    sys.exit(max(process.returncode for process in processes))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+from pathlib import Path
+from typing import Literal
+
 from pydantic.v1 import BaseSettings
 
 
@@ -5,6 +8,90 @@ class Config(BaseSettings):
     MAX_K: int = 8
     MAX_LEN: int = 10**MAX_K
     MAX_BATCH_SIZE: int = 10000
+    # Maximum number of buckets of a /stats/series/ response
+    MAX_SERIES_BUCKETS: int = 10000
+    # Interval tree backend: "denary" keeps a tree of Python objects and
+    # supports any `StatisticProtocol`, "columnar" keeps NumPy arrays per level
+    TREE_BACKEND: Literal["denary", "columnar"] = "denary"
+    # Number of children of every tree node, higher values make trees shallower
+    # at the cost of merging more nodes per level (see benchmarks/bench_fan_out)
+    TREE_FAN_OUT: int = 10
+    # Statistic kept in tree nodes: "sums" derives the variance from sums of
+    # squares, "centered" keeps means and squared deviations from them, which
+    # stays accurate for large windows of values far from zero
+    STATISTIC: Literal["sums", "centered", "quantiles"] = "sums"
+    # "quantiles" additionally keeps a mergeable sketch of the values in every
+    # node (denary tree only), and responses report these quantiles of the
+    # window, within 1% of the exact values. Windows are then computed when
+    # read instead of on every write, merging sketches for all of them would
+    # make writes several times slower
+    QUANTILES: list[float] = [0.5, 0.95, 0.99]
+    # Number of lowest tree levels stored in float32 (columnar tree and
+    # "centered" statistic only). Values are rounded to about 7 significant
+    # digits; 1 keeps only the leaves compact, which roughly halves memory and
+    # keeps aggregates exact for the rounded values, higher levels save little
+    # more and also round the means of their nodes
+    TREE_COMPACT_LEVELS: int = 0
+    # Storage backend: "memory" loses data on restart, "mmap" keeps every
+    # symbol in memory-mapped files under DATA_DIR (columnar tree only)
+    STORAGE_BACKEND: Literal["memory", "mmap"] = "memory"
+    DATA_DIR: Path = Path("data")
+    # Write-ahead log: every acknowledged batch is fsynced to WAL_DIR first.
+    # Commits wait WAL_FSYNC_INTERVAL seconds to group concurrent writers and
+    # storages are snapshotted every WAL_SNAPSHOT_INTERVAL seconds, which lets
+    # old log segments be deleted
+    WAL_ENABLED: bool = False
+    WAL_DIR: Path = Path("wal")
+    WAL_FSYNC_INTERVAL: float = 0.001
+    WAL_SEGMENT_BYTES: int = 64 * 2**20
+    WAL_SNAPSHOT_INTERVAL: float = 300.0
+    # Concurrent batches of a symbol are applied together with a single tree
+    # repair; a writer waits INGEST_LINGER seconds to collect more of them
+    INGEST_LINGER: float = 0.0
+    # Streaming ingest: batches acknowledged at once and maximum number of
+    # unacknowledged batches a client may have in flight
+    STREAM_ACK_EVERY: int = 16
+    STREAM_CREDIT: int = 64
+    # Limits of the symbol store: least recently used symbols idle for at
+    # least SYMBOL_IDLE_SECONDS are spilled to SPILL_DIR (the snapshot
+    # directory of the write-ahead log when it is enabled) and loaded back on
+    # their next access. Limits are checked every EVICTION_INTERVAL seconds
+    SYMBOL_STORE_MAX_BYTES: int = 8 * 2**30
+    SYMBOL_STORE_MAX_SYMBOLS: int = 100_000
+    SYMBOL_IDLE_SECONDS: float = 60.0
+    SPILL_DIR: Path = Path("spill")
+    EVICTION_INTERVAL: float = 1.0
+    # Admission control (see `service.admission`): at most
+    # ADMISSION_*_CONCURRENCY reads and writes run at once, others wait in
+    # a queue of ADMISSION_MAX_QUEUE requests per pool for at most
+    # ADMISSION_QUEUE_TIMEOUT seconds and are answered 503 beyond that.
+    # Requests beyond ADMISSION_MAX_SYMBOL_QUEUE running or queued ones of
+    # a symbol are answered 429. Both come with a Retry-After header.
+    # The "reads" priority runs writes one at a time while reads are queued or
+    # slower than ADMISSION_READ_SLO seconds on average. Limits should leave
+    # some of the 40 worker threads of FastAPI free
+    ADMISSION_ENABLED: bool = False
+    ADMISSION_READ_CONCURRENCY: int = 16
+    ADMISSION_WRITE_CONCURRENCY: int = 8
+    ADMISSION_MAX_QUEUE: int = 256
+    ADMISSION_QUEUE_TIMEOUT: float = 1.0
+    ADMISSION_MAX_SYMBOL_QUEUE: int = 32
+    ADMISSION_PRIORITY: Literal["fair", "reads"] = "fair"
+    ADMISSION_READ_SLO: float = 0.05
+    ADMISSION_RETRY_AFTER: int = 1
+    # /admin/ endpoints listing, dropping and backfilling symbols. Backfills
+    # only read files under BACKFILL_DIR
+    ADMIN_ENABLED: bool = False
+    BACKFILL_DIR: Path = Path("backfill")
+    # Memory cap for encoded /stats/ responses
+    STATS_CACHE_MAX_BYTES: int = 64 * 2**20
+    # /metrics endpoint and per-request latency histograms
+    METRICS_ENABLED: bool = True
+    # /debug/profile endpoint sampling all threads for a requested window
+    PROFILER_ENABLED: bool = False
+    # Base URLs of shard processes, used by the router of the multi-process
+    # mode (see `service.cluster`)
+    SHARD_URLS: list[str] = []
 
 
 config = Config()
@@ -1,43 +1,75 @@
+import asyncio
 import logging
-from typing import Annotated
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Annotated, TypeVar
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Body, Depends, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.exceptions import HTTPException
-from pydantic import Field
+from fastapi.responses import Response
+from pydantic import Field, ValidationError
 
+from service.admission import RESPONSES, limit_symbols
+from service.cache import stats_cache
 from service.config import config
-from service.dependencies import get_storage
-from service.dtos import AddBatchRequest, AddBatchResponse, StatsResponse
-from service.statistics import Statistic
+from service.dependencies import find_storage, get_storage
+from service.dtos import (
+    AddBatchRequest,
+    AddBatchResponse,
+    BinaryValueType,
+    BulkAddBatchRequest,
+    BulkAddBatchResponse,
+    BulkStatsRequest,
+    BulkStatsResponse,
+    DurationStatsResponse,
+    SeriesResponse,
+    StatsResponse,
+    StreamAck,
+    StreamBatch,
+    StreamError,
+    decode_binary_values,
+)
 from service.storage import StatsStorage
 
 logger = logging.getLogger(__name__)
+_T = TypeVar("_T")
 router = APIRouter(prefix="", tags=["statistics"])
 
 
 @router.post(
     "/add_batch/",
     name="Add batch",
+    dependencies=[Depends(limit_symbols("write"))],
+    response_model=AddBatchResponse,
     description="Allows the bulk addition of consecutive "
-    "trading data points for a specific symbol.",
+    "trading data points for a specific symbol, optionally with their "
+    "timestamps.",
     responses={
         status.HTTP_200_OK: {
             "model": AddBatchResponse,
         },
+        status.HTTP_400_BAD_REQUEST: {
+            "model": dict,
+            "description": "Timestamps do not match the values or decrease",
+        },
         status.HTTP_422_UNPROCESSABLE_ENTITY: {
             "model": dict,
             "description": "Unprocessable content in the request",
         },
+        **RESPONSES,
     },
 )
 def add_batch_controller(
     request: AddBatchRequest,
     storage: Annotated[StatsStorage, Depends(get_storage)],
-) -> AddBatchResponse:
+) -> Response:
     try:
-        storage.add(request.values)
-        return AddBatchResponse(symbol=request.symbol, message="OK")
-    except HTTPException:
+        storage.add(request.values, request.timestamps)
+        return Response(
+            content=AddBatchResponse.render(request.symbol),
+            media_type="application/json",
+        )
+    except (HTTPException, ValueError):
         raise
     except Exception as e:
         logger.exception("Unknown error adding batch")
@@ -47,9 +79,243 @@ def add_batch_controller(
         ) from e
 
 
+@router.post(
+    "/add_batch/{symbol:path}/binary/",
+    name="Add binary batch",
+    dependencies=[Depends(limit_symbols("write"))],
+    response_model=AddBatchResponse,
+    description="Allows the bulk addition of consecutive trading data points "
+    "for a specific symbol, sent as raw little-endian floats. All points get "
+    "the same optional timestamp.",
+    responses={
+        status.HTTP_200_OK: {
+            "model": AddBatchResponse,
+        },
+        status.HTTP_400_BAD_REQUEST: {
+            "model": dict,
+            "description": "Body is not a valid batch of finite values",
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {
+            "model": dict,
+            "description": "Unprocessable content in the request",
+        },
+        **RESPONSES,
+    },
+)
+def add_binary_batch_controller(
+    symbol: str,
+    body: Annotated[bytes, Body(media_type="application/octet-stream")] = b"",
+    value_type: BinaryValueType = "float64",
+    timestamp: float | None = None,
+) -> Response:
+    values = decode_binary_values(body, value_type)
+    try:
+        get_storage(symbol).add(values, timestamp)
+        return Response(
+            content=AddBatchResponse.render(symbol),
+            media_type="application/json",
+        )
+    except (HTTPException, ValueError):
+        raise
+    except Exception as e:
+        logger.exception("Unknown error adding binary batch")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {e}",
+        ) from e
+
+
+@router.post(
+    "/add_batch/bulk/",
+    name="Add bulk batch",
+    dependencies=[Depends(limit_symbols("write"))],
+    response_model=BulkAddBatchResponse,
+    description="Allows the bulk addition of consecutive "
+    "trading data points for many symbols at once.",
+    responses={
+        status.HTTP_200_OK: {
+            "model": BulkAddBatchResponse,
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {
+            "model": dict,
+            "description": "Unprocessable content in the request",
+        },
+        **RESPONSES,
+    },
+)
+def add_bulk_batch_controller(request: BulkAddBatchRequest) -> Response:
+    try:
+        for symbol, values in request.batches.items():
+            get_storage(symbol).add(values)
+        return Response(
+            content=BulkAddBatchResponse.render(list(request.batches)),
+            media_type="application/json",
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Unknown error adding bulk batch")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {e}",
+        ) from e
+
+
+@router.websocket("/add_batch/stream/", name="Add batch stream")
+async def add_batch_stream_controller(websocket: WebSocket) -> None:
+    """Stream batches for any number of symbols over one connection.
+
+    The server opens with a `StreamAck` granting the initial credit. The client
+    sends `StreamBatch` messages with increasing `seq` and keeps at most
+    `credit` batches past the last acknowledged one in flight, sending more
+    closes the connection. Batches are applied one at a time in arrival order
+    and acknowledged in groups of `STREAM_ACK_EVERY`, or immediately when
+    `flush` is set. Invalid messages and batches rejected by the storage, e.g.
+    with decreasing timestamps, are answered with a `StreamError` and close
+    the connection.
+    """
+    await serve_batch_stream(
+        websocket,
+        lambda batch: run_in_threadpool(_add_stream_batch, batch),
+    )
+
+
+def _add_stream_batch(batch: StreamBatch) -> None:
+    # Looking the storage up may load a spilled symbol from disk
+    get_storage(batch).add(batch.values, batch.timestamps)
+
+
+class _StreamWindow:
+    """Batches received from a stream client and not acknowledged yet.
+
+    Attributes:
+        _credit (int): Number of batches a client may send past the last
+            acknowledgement.
+        _received (int): Number of batches received.
+        _acknowledged (int): Number of batches acknowledged.
+        _items (asyncio.Queue): Received batches in arrival order, then None
+            once the client closes the connection, or the `StreamError` and
+            close code to close it with.
+
+    """
+
+    def __init__(self, credit: int):
+        self._credit = credit
+        self._received = 0
+        self._acknowledged = 0
+        self._items: asyncio.Queue[StreamBatch | tuple[StreamError, int] | None] = (
+            asyncio.Queue()
+        )
+
+    async def receive(self, websocket: WebSocket) -> None:
+        """Receive messages until the client closes the connection or errs."""
+        last_seq = None
+        while True:
+            try:
+                batch = StreamBatch.model_validate_json(await websocket.receive_text())
+            except WebSocketDisconnect:
+                self._items.put_nowait(None)
+                return
+            except ValidationError as e:
+                self._close(None, str(e), status.WS_1007_INVALID_FRAME_PAYLOAD_DATA)
+                return
+            except Exception as e:
+                logger.exception("Unknown error receiving batches")
+                self._close(
+                    None,
+                    f"Internal server error: {e}",
+                    status.WS_1011_INTERNAL_ERROR,
+                )
+                return
+            if last_seq is not None and batch.seq <= last_seq:
+                error = "Sequence number must grow"
+            elif self._received - self._acknowledged >= self._credit:
+                error = f"More than {self._credit} batches are unacknowledged"
+            else:
+                self._received, last_seq = self._received + 1, batch.seq
+                self._items.put_nowait(batch)
+                continue
+            self._close(batch.seq, error, status.WS_1008_POLICY_VIOLATION)
+            return
+
+    async def get(self) -> StreamBatch | tuple[StreamError, int] | None:
+        return await self._items.get()
+
+    def acknowledge(self, batches: int) -> None:
+        self._acknowledged += batches
+
+    def _close(self, seq: int | None, message: str, code: int) -> None:
+        self._items.put_nowait((StreamError(seq=seq, message=message), code))
+
+
+async def serve_batch_stream(
+    websocket: WebSocket,
+    apply: Callable[[StreamBatch], Awaitable[None]],
+) -> None:
+    """Run the batch stream protocol, storing every batch with `apply`.
+
+    Messages are received while earlier batches are applied, into a window of
+    at most `STREAM_CREDIT` batches past the last acknowledgement. Batches are
+    applied and errors answered in arrival order, by this coroutine only.
+    """
+    await websocket.accept()
+    ack_every = min(config.STREAM_ACK_EVERY, config.STREAM_CREDIT)
+    window = _StreamWindow(config.STREAM_CREDIT)
+    last_seq: int | None = None
+    unacknowledged = 0
+    await websocket.send_text(
+        StreamAck(ack=last_seq, credit=config.STREAM_CREDIT).model_dump_json(),
+    )
+    receiver = asyncio.create_task(window.receive(websocket))
+    try:
+        while (item := await window.get()) is not None:
+            if isinstance(item, tuple):
+                await _close_stream(websocket, *item)
+                return
+            try:
+                await apply(item)
+            except ValueError as e:
+                await _close_stream(
+                    websocket,
+                    StreamError(seq=item.seq, message=str(e)),
+                    status.WS_1007_INVALID_FRAME_PAYLOAD_DATA,
+                )
+                return
+            last_seq = item.seq
+            unacknowledged += 1
+            if item.flush or unacknowledged >= ack_every:
+                await websocket.send_text(
+                    StreamAck(
+                        ack=last_seq,
+                        credit=config.STREAM_CREDIT,
+                    ).model_dump_json(),
+                )
+                window.acknowledge(unacknowledged)
+                unacknowledged = 0
+        logger.info("Batch stream closed by the client after seq %s", last_seq)
+    except WebSocketDisconnect:
+        logger.info("Batch stream closed by the client after seq %s", last_seq)
+    except Exception as e:
+        logger.exception("Unknown error streaming batches")
+        await _close_stream(
+            websocket,
+            StreamError(seq=last_seq, message=f"Internal server error: {e}"),
+            status.WS_1011_INTERNAL_ERROR,
+        )
+    finally:
+        receiver.cancel()
+
+
+async def _close_stream(websocket: WebSocket, error: StreamError, code: int) -> None:
+    await websocket.send_text(error.model_dump_json())
+    await websocket.close(code=code)
+
+
 @router.get(
     "/stats/",
     name="Get stats",
+    dependencies=[Depends(limit_symbols("read"))],
+    response_model=StatsResponse,
     description="Rapid statistical analyses of recent "
     "trading data for specified symbol.",
     responses={
@@ -64,6 +330,7 @@ def add_batch_controller(
             "model": dict,
             "description": "Unprocessable content in the request",
         },
+        **RESPONSES,
     },
 )
 def get_stats_controller(
@@ -72,20 +339,206 @@ def get_stats_controller(
         int,
         Field(gt=0, le=config.MAX_K),
     ],
-) -> StatsResponse:
+) -> Response:
     try:
-        storage = get_storage(symbol)
-        stats: Statistic | None = storage.get(10**k)
+        body = _cached_stats_body(
+            symbol,
+            (symbol, k),
+            lambda storage: storage.get(10**k),
+            lambda stats: StatsResponse.render(symbol=symbol, k=k, stats=stats),
+        )
+        return Response(content=body, media_type="application/json")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Unknown error retrieving stats")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {e}",
+        ) from e
+
+
+@router.get(
+    "/stats/duration/",
+    name="Get duration stats",
+    dependencies=[Depends(limit_symbols("read"))],
+    response_model=DurationStatsResponse,
+    description="Statistical analyses of the trading data points of a symbol "
+    "stamped less than `seconds` before its latest data point.",
+    responses={
+        status.HTTP_200_OK: {
+            "model": DurationStatsResponse,
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "model": dict,
+            "description": "No data points found for the symbol",
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {
+            "model": dict,
+            "description": "Unprocessable content in the request",
+        },
+        **RESPONSES,
+    },
+)
+def get_duration_stats_controller(
+    symbol: str,
+    seconds: Annotated[float, Field(gt=0)],
+) -> Response:
+    try:
+        body = _cached_stats_body(
+            symbol,
+            (symbol, "seconds", seconds),
+            lambda storage: storage.get_within(seconds),
+            lambda stats: DurationStatsResponse.render(
+                symbol=symbol,
+                seconds=seconds,
+                stats=stats,
+            ),
+        )
+        return Response(content=body, media_type="application/json")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Unknown error retrieving duration stats")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {e}",
+        ) from e
+
+
+@router.get(
+    "/stats/series/",
+    name="Get series stats",
+    dependencies=[Depends(limit_symbols("read"))],
+    response_model=SeriesResponse,
+    description="Statistical analyses of the last 10^k trading data points of "
+    "a symbol, ending `offset` points before the latest one, split into at "
+    "most `buckets` buckets of consecutive points, oldest first. Each bucket "
+    "also reports its first value, e.g. to draw candlestick charts.",
+    responses={
+        status.HTTP_200_OK: {
+            "model": SeriesResponse,
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "model": dict,
+            "description": "No data points found for the symbol",
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {
+            "model": dict,
+            "description": "Unprocessable content in the request",
+        },
+        **RESPONSES,
+    },
+)
+def get_series_stats_controller(
+    symbol: str,
+    k: Annotated[int, Field(gt=0, le=config.MAX_K)],
+    buckets: Annotated[int, Field(gt=0, le=config.MAX_SERIES_BUCKETS)],
+    offset: Annotated[int, Field(ge=0)] = 0,
+) -> Response:
+    try:
+        body = _cached_stats_body(
+            symbol,
+            (symbol, "series", k, buckets, offset),
+            lambda storage: storage.get_series(10**k, buckets, offset) or None,
+            lambda series: SeriesResponse.render(
+                symbol=symbol,
+                k=k,
+                offset=offset,
+                buckets=series,
+            ),
+        )
+        return Response(content=body, media_type="application/json")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Unknown error retrieving series stats")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {e}",
+        ) from e
+
+
+def _cached_stats_body(
+    symbol: str,
+    key: Hashable,
+    calculate: Callable[[StatsStorage], _T | None],
+    render: Callable[[_T], bytes],
+) -> bytes:
+    """Encode stats of the symbol, served from the cache while still current.
+
+    :raises HTTPException: 404 if the symbol has no data points
+    """
+    storage = find_storage(symbol)
+    if storage is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No data points found for the symbol",
+        )
+    # Read the version before the data, so that a concurrent write can only
+    # make the cached body fresher than its version, never staler
+    version = storage.version
+    body = stats_cache.get(key, version)
+    if body is None:
+        stats = calculate(storage)
         if stats is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No data points found for the symbol",
             )
-        return StatsResponse.create(symbol=symbol, k=k, stats=stats)
+        body = render(stats)
+        stats_cache.put(key, version, body)
+    return body
+
+
+@router.post(
+    "/stats/bulk/",
+    name="Get bulk stats",
+    dependencies=[Depends(limit_symbols("read"))],
+    description="Rapid statistical analyses of recent trading data "
+    "for many symbols at once. Symbols without data are reported per query.",
+    responses={
+        status.HTTP_200_OK: {
+            "model": BulkStatsResponse,
+        },
+        status.HTTP_422_UNPROCESSABLE_ENTITY: {
+            "model": dict,
+            "description": "Unprocessable content in the request",
+        },
+        **RESPONSES,
+    },
+)
+def get_bulk_stats_controller(request: BulkStatsRequest) -> BulkStatsResponse:
+    try:
+        # Group queries per symbol, so that every storage is looked up once
+        queries_by_symbol: dict[str, list[int]] = {}
+        for position, query in enumerate(request.queries):
+            queries_by_symbol.setdefault(query.symbol, []).append(position)
+
+        results: list[BulkStatsResponse.Result | None] = [None] * len(request.queries)
+        for symbol, positions in queries_by_symbol.items():
+            storage = find_storage(symbol)
+            for position in positions:
+                k = request.queries[position].k
+                stats = storage.get(10**k) if storage is not None else None
+                results[position] = (
+                    BulkStatsResponse.Result(
+                        symbol=symbol,
+                        k=k,
+                        statistics=StatsResponse.Statistics.create(stats),
+                    )
+                    if stats is not None
+                    else BulkStatsResponse.Result(
+                        symbol=symbol,
+                        k=k,
+                        message="No data points found for the symbol",
+                    )
+                )
+        return BulkStatsResponse(results=results)
     except HTTPException:
         raise
     except Exception as e:
-        logger.exception("Unknown error retrieving stats")
+        logger.exception("Unknown error retrieving bulk stats")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {e}",
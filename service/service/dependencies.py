@@ -1,7 +1,65 @@
-from service import storage
+import functools
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+
+from service import backfill, storage, wal
 from service.config import config
 from service.dtos import AddBatchRequest
-from service.statistics import Statistic
+from service.statistics import CenteredStatistic, QuantileStatistic, Statistic
+from service.utils.columnar_interval_tree import ColumnarIntervalTree
+from service.utils.interval_tree import DenaryIntervalTree, IntervalTreeProtocol
+
+TREE_BACKENDS = {
+    "denary": DenaryIntervalTree,
+    "columnar": ColumnarIntervalTree,
+}
+STATISTICS = {
+    "sums": Statistic,
+    "centered": CenteredStatistic,
+    "quantiles": QuantileStatistic,
+}
+
+
+WINDOWS = [10**k for k in range(1, config.MAX_K + 1)]
+SNAPSHOT_DIR = config.WAL_DIR / "snapshots"
+
+write_ahead_log: wal.WriteAheadLog | None = None
+_stop_snapshots = threading.Event()
+_stop_evictions = threading.Event()
+
+
+def tree_class() -> type[IntervalTreeProtocol]:
+    return functools.partial(
+        TREE_BACKENDS[config.TREE_BACKEND],
+        fan_out=config.TREE_FAN_OUT,
+        compact_levels=config.TREE_COMPACT_LEVELS,
+    )
+
+
+def check_config() -> None:
+    """Reject settings every write would fail with, before serving anything.
+
+    :raises ValueError: If the tree backend cannot keep the configured
+        statistic, compact levels or storage backend
+    """
+    if config.STORAGE_BACKEND == "mmap" and config.TREE_BACKEND != "columnar":
+        raise ValueError("STORAGE_BACKEND=mmap needs TREE_BACKEND=columnar")
+    try:
+        # Trees check their statistic and compact levels when created
+        tree_class()(1, STATISTICS[config.STATISTIC])
+    except ValueError as e:
+        msg = (
+            f"TREE_BACKEND={config.TREE_BACKEND} cannot be used with "
+            f"STATISTIC={config.STATISTIC} and "
+            f"TREE_COMPACT_LEVELS={config.TREE_COMPACT_LEVELS}: {e}"
+        )
+        raise ValueError(msg) from e
+
+
+def windows() -> list[int]:
+    # Sketches of every window would be merged again on every write
+    return [] if STATISTICS[config.STATISTIC] is QuantileStatistic else WINDOWS
 
 
 def get_storage(request: AddBatchRequest | str) -> storage.StatsStorage:
@@ -9,5 +67,123 @@ def get_storage(request: AddBatchRequest | str) -> storage.StatsStorage:
     return storage.get_storage_for_symbol(
         symbol=symbol,
         max_size=config.MAX_LEN,
-        stats_class=Statistic,
+        stats_class=STATISTICS[config.STATISTIC],
+        tree_class=tree_class(),
+        windows=windows(),
+        data_dir=data_dir(),
+        log=write_ahead_log.append if write_ahead_log is not None else None,
+        linger=config.INGEST_LINGER,
+    )
+
+
+def find_storage(symbol: str) -> storage.StatsStorage | None:
+    found = storage.find_storage_for_symbol(symbol)
+    if found is None and symbol in storage.spilled_symbols:
+        # Loaded back on access, like any other known symbol
+        return get_storage(symbol)
+    return found
+
+
+def backfill_symbol(
+    symbol: str,
+    chunks: Iterable[backfill.Chunk],
+    timestamp: float | None = None,
+) -> int:
+    log = write_ahead_log
+    return backfill.backfill(
+        symbol,
+        chunks,
+        max_size=config.MAX_LEN,
+        stats_class=STATISTICS[config.STATISTIC],
+        tree_class=tree_class(),
+        spill_dir=spill_dir(),
+        windows=windows(),
+        data_dir=data_dir(),
+        log=log.append if log is not None else None,
+        next_lsn=(lambda: log.next_lsn) if log is not None else None,
+        linger=config.INGEST_LINGER,
+        timestamp=timestamp,
     )
+
+
+def drop_symbol(symbol: str) -> bool:
+    log = write_ahead_log
+    return storage.drop_symbol(
+        symbol,
+        spill_dir(),
+        data_dir(),
+        next_lsn=(lambda: log.next_lsn) if log is not None else None,
+    )
+
+
+def data_dir() -> Path | None:
+    return config.DATA_DIR if config.STORAGE_BACKEND == "mmap" else None
+
+
+def spill_dir() -> Path:
+    # Spilled storages then also serve as snapshots of the write-ahead log,
+    # which may drop their records once covered
+    return SNAPSHOT_DIR if config.WAL_ENABLED else config.SPILL_DIR
+
+
+def load_storages() -> None:
+    global write_ahead_log  # noqa: PLW0603
+    check_config()
+    if config.WAL_ENABLED:
+        write_ahead_log = wal.WriteAheadLog(
+            config.WAL_DIR,
+            fsync_interval=config.WAL_FSYNC_INTERVAL,
+            segment_bytes=config.WAL_SEGMENT_BYTES,
+        )
+    if config.STORAGE_BACKEND == "mmap":
+        storage.load_symbol_store(
+            data_dir=config.DATA_DIR,
+            max_size=config.MAX_LEN,
+            stats_class=STATISTICS[config.STATISTIC],
+            tree_class=tree_class(),
+            windows=windows(),
+            log=write_ahead_log.append if write_ahead_log is not None else None,
+            linger=config.INGEST_LINGER,
+        )
+    if write_ahead_log is not None:
+        wal.recover_symbol_store(write_ahead_log, SNAPSHOT_DIR, get_storage)
+        _stop_snapshots.clear()
+        threading.Thread(
+            target=wal.run_snapshots,
+            args=(
+                write_ahead_log,
+                SNAPSHOT_DIR,
+                config.WAL_SNAPSHOT_INTERVAL,
+                _stop_snapshots,
+            ),
+            name="wal-snapshots",
+            daemon=True,
+        ).start()
+    else:
+        # Without the log, spilled storages do not outlive the process
+        for path in config.SPILL_DIR.glob("*.snapshot"):
+            path.unlink()
+    _stop_evictions.clear()
+    threading.Thread(
+        target=storage.run_evictions,
+        args=(
+            config.SYMBOL_STORE_MAX_BYTES,
+            config.SYMBOL_STORE_MAX_SYMBOLS,
+            config.SYMBOL_IDLE_SECONDS,
+            spill_dir(),
+            config.EVICTION_INTERVAL,
+            _stop_evictions,
+        ),
+        name="symbol-evictions",
+        daemon=True,
+    ).start()
+
+
+def close_storages() -> None:
+    global write_ahead_log  # noqa: PLW0603
+    _stop_evictions.set()
+    if write_ahead_log is not None:
+        _stop_snapshots.set()
+        wal.snapshot_symbol_store(write_ahead_log, SNAPSHOT_DIR)
+        write_ahead_log.close()
+        write_ahead_log = None
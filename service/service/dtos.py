@@ -1,10 +1,12 @@
-from typing import Annotated
+from typing import Annotated, Literal
 
-from pydantic import Field
+import numpy as np
+import orjson
+from pydantic import Field, SerializerFunctionWrapHandler, model_serializer
 
 from service.config import config
 from service.core import BaseDTO
-from service.statistics import Statistic
+from service.statistics import QuantileStatistic, SummaryStatistic
 
 
 class AddBatchRequest(BaseDTO):
@@ -13,12 +15,97 @@ class AddBatchRequest(BaseDTO):
         list[float],
         Field(min_length=0, max_length=config.MAX_BATCH_SIZE),
     ]
+    # Seconds, one per value or one for the whole batch, must not decrease.
+    # Batches without timestamps are stamped with their arrival time
+    timestamps: (
+        float | Annotated[list[float], Field(max_length=config.MAX_BATCH_SIZE)] | None
+    ) = None
+
+
+class StreamBatch(AddBatchRequest):
+    seq: Annotated[int, Field(ge=0)]
+    # Asks the server to acknowledge immediately instead of waiting for a group
+    flush: bool = False
+
+
+class StreamAck(BaseDTO):
+    # Sequence number of the last applied batch, None before the first batch
+    ack: int | None
+    # Number of batches the client may send past `ack`
+    credit: int
+
+
+class StreamError(BaseDTO):
+    seq: int | None
+    message: str
+
+
+BinaryValueType = Literal["float64", "float32"]
+
+BINARY_DTYPES: dict[str, np.dtype] = {
+    "float64": np.dtype("<f8"),
+    "float32": np.dtype("<f4"),
+}
+
+
+def decode_binary_values(body: bytes, value_type: BinaryValueType) -> np.ndarray:
+    """Decode a raw little-endian batch of floats without copying it.
+
+    float32 batches are widened to float64, the precision used by the storage.
+
+    :raises ValueError: If the body is not a valid batch of finite values.
+    """
+    dtype = BINARY_DTYPES[value_type]
+    if len(body) % dtype.itemsize:
+        msg = f"Body length must be a multiple of {dtype.itemsize}"
+        raise ValueError(msg)
+    if len(body) // dtype.itemsize > config.MAX_BATCH_SIZE:
+        msg = f"Batch can hold at most {config.MAX_BATCH_SIZE} values"
+        raise ValueError(msg)
+    values = np.frombuffer(body, dtype=dtype)
+    if not np.isfinite(values).all():
+        raise ValueError("Batch must not contain NaN or infinite values")
+    return values.astype(np.float64, copy=False)
+
+
+def _dumps(content: object) -> bytes:
+    # Statistics of the columnar tree may hold NumPy scalars
+    return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+# Constant end of successful ingest responses
+_OK_MESSAGE = b',"message":"OK"}'
+
+# Hot responses are rendered by `render` methods straight from the data,
+# skipping the construction, validation and serialization of the models,
+# which only document them. Bodies are the same JSON as `create(...)`
+# serialized by pydantic.
 
 
 class AddBatchResponse(BaseDTO):
     symbol: str
     message: str
 
+    @staticmethod
+    def render(symbol: str) -> bytes:
+        return b'{"symbol":' + _dumps(symbol) + _OK_MESSAGE
+
+
+class BulkAddBatchRequest(BaseDTO):
+    batches: dict[
+        str,
+        Annotated[list[float], Field(min_length=0, max_length=config.MAX_BATCH_SIZE)],
+    ]
+
+
+class BulkAddBatchResponse(BaseDTO):
+    symbols: list[str]
+    message: str
+
+    @staticmethod
+    def render(symbols: list[str]) -> bytes:
+        return b'{"symbols":' + _dumps(symbols) + _OK_MESSAGE
+
 
 class StatsResponse(BaseDTO):
     class Statistics(BaseDTO):
@@ -27,21 +114,193 @@ class StatsResponse(BaseDTO):
         last: float
         avg: float
         var: float
+        # Configured QUANTILES by name, e.g. "p99", with the "quantiles"
+        # statistic only, left out of the response otherwise
+        quantiles: dict[str, float] | None = None
+
+        # Not annotated, an annotated return type would replace the schema
+        @model_serializer(mode="wrap")
+        def _serialize(self, handler: SerializerFunctionWrapHandler):  # noqa: ANN202
+            data = handler(self)
+            if self.quantiles is None:
+                del data["quantiles"]
+            return data
+
+        @classmethod
+        def create(cls, stats: SummaryStatistic) -> "StatsResponse.Statistics":
+            return cls(**cls.content(stats))
+
+        @staticmethod
+        def content(stats: SummaryStatistic) -> dict[str, object]:
+            """Return the fields of the statistics, as serialized."""
+            content: dict[str, object] = {
+                "min": stats.min,
+                "max": stats.max,
+                "last": stats.last,
+                "avg": stats.avg,
+                "var": stats.var,
+            }
+            if isinstance(stats, QuantileStatistic):
+                content["quantiles"] = dict(
+                    zip(
+                        [f"p{q * 100:g}" for q in config.QUANTILES],
+                        stats.quantiles(config.QUANTILES),
+                        strict=True,
+                    ),
+                )
+            return content
 
     symbol: str
     k: Annotated[int, Field(gt=0, le=config.MAX_K)]
     statistics: Statistics
 
     @classmethod
-    def create(cls, symbol: str, k: int, stats: Statistic) -> "StatsResponse":
+    def create(cls, symbol: str, k: int, stats: SummaryStatistic) -> "StatsResponse":
+        return cls(symbol=symbol, k=k, statistics=cls.Statistics.create(stats))
+
+    @classmethod
+    def render(cls, symbol: str, k: int, stats: SummaryStatistic) -> bytes:
+        return _dumps(
+            {"symbol": symbol, "k": k, "statistics": cls.Statistics.content(stats)},
+        )
+
+
+class DurationStatsResponse(BaseDTO):
+    symbol: str
+    seconds: Annotated[float, Field(gt=0)]
+    statistics: StatsResponse.Statistics
+
+    @classmethod
+    def create(
+        cls,
+        symbol: str,
+        seconds: float,
+        stats: SummaryStatistic,
+    ) -> "DurationStatsResponse":
+        return cls(
+            symbol=symbol,
+            seconds=seconds,
+            statistics=StatsResponse.Statistics.create(stats),
+        )
+
+    @staticmethod
+    def render(symbol: str, seconds: float, stats: SummaryStatistic) -> bytes:
+        return _dumps(
+            {
+                "symbol": symbol,
+                "seconds": seconds,
+                "statistics": StatsResponse.Statistics.content(stats),
+            },
+        )
+
+
+class SeriesResponse(BaseDTO):
+    class Bucket(BaseDTO):
+        count: int
+        first: float
+        statistics: StatsResponse.Statistics
+
+    symbol: str
+    k: Annotated[int, Field(gt=0, le=config.MAX_K)]
+    offset: Annotated[int, Field(ge=0)]
+    buckets: list[Bucket]
+
+    @classmethod
+    def create(
+        cls,
+        symbol: str,
+        k: int,
+        offset: int,
+        buckets: list[tuple[SummaryStatistic, SummaryStatistic]],
+    ) -> "SeriesResponse":
         return cls(
             symbol=symbol,
             k=k,
-            statistics=cls.Statistics(
-                min=stats.min,
-                max=stats.max,
-                last=stats.last,
-                avg=stats.sum / stats.count,
-                var=stats.sum_squares / stats.count - (stats.sum / stats.count) ** 2,
-            ),
+            offset=offset,
+            buckets=[
+                cls.Bucket(
+                    count=stats.count,
+                    first=first.last,
+                    statistics=StatsResponse.Statistics.create(stats),
+                )
+                for first, stats in buckets
+            ],
         )
+
+    @staticmethod
+    def render(
+        symbol: str,
+        k: int,
+        offset: int,
+        buckets: list[tuple[SummaryStatistic, SummaryStatistic]],
+    ) -> bytes:
+        return _dumps(
+            {
+                "symbol": symbol,
+                "k": k,
+                "offset": offset,
+                "buckets": [
+                    {
+                        "count": stats.count,
+                        "first": first.last,
+                        "statistics": StatsResponse.Statistics.content(stats),
+                    }
+                    for first, stats in buckets
+                ],
+            },
+        )
+
+
+class StatsQuery(BaseDTO):
+    symbol: str
+    k: Annotated[int, Field(gt=0, le=config.MAX_K)]
+
+
+class BulkStatsRequest(BaseDTO):
+    queries: list[StatsQuery]
+
+
+class BulkStatsResponse(BaseDTO):
+    class Result(StatsQuery):
+        # Exactly one of `statistics` and `message` is set
+        statistics: StatsResponse.Statistics | None = None
+        message: str | None = None
+
+    results: list[Result]
+
+
+class SymbolsResponse(BaseDTO):
+    class Symbol(BaseDTO):
+        symbol: str
+        # False for symbols spilled to disk, loaded back on their next access
+        resident: bool
+        # Memory of resident symbols, size on disk of spilled ones
+        bytes: int
+        # Seconds since the last access, None for spilled symbols
+        idle_seconds: float | None
+
+    symbols: list[Symbol]
+    resident_bytes: int
+
+
+class DropSymbolResponse(BaseDTO):
+    symbol: str
+    message: str
+
+
+class BackfillRequest(BaseDTO):
+    # File under BACKFILL_DIR, relative to it
+    path: str
+    # "csv" lines hold a value or a `timestamp,value` pair, "binary" files
+    # hold raw little-endian floats of `value_type`
+    format: Literal["csv", "binary"] = "csv"
+    value_type: BinaryValueType = "float64"
+    # Seconds, stamped on values read without timestamps, the current time
+    # by default
+    timestamp: float | None = None
+
+
+class BackfillResponse(BaseDTO):
+    symbol: str
+    # Number of data points read, only the latest MAX_LEN ones are kept
+    points: int
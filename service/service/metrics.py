@@ -0,0 +1,221 @@
+"""Minimal Prometheus instrumentation, rendered in the text exposition format.
+
+Only what the service needs is implemented: counters, histograms with fixed
+buckets and gauges computed when scraped. Recording a value costs a bisect
+and a short critical section, so instruments are cheap enough to stay on in
+the hot paths.
+"""
+
+import bisect
+import math
+import threading
+from collections.abc import Callable, Iterable, Sequence
+
+# Latency buckets in seconds, from 10us to 10s
+LATENCY_BUCKETS = (
+    *(scale * 10.0**exponent for exponent in range(-5, 1) for scale in (1, 2.5, 5)),
+    10.0,
+)
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)
+    )
+    return f"{{{pairs}}}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Common part of all instruments, registered in `registry` on creation."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        """Initialize metric.
+
+        :param name: Metric name, prefixed with the service namespace
+        :param documentation: Help text
+        :param labelnames: Names of labels, values are given on every record
+        """
+        self.name = f"stats_service_{name}"
+        self._documentation = documentation
+        self._labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self._documentation}"
+        yield f"# TYPE {self.name} {self.type_name}"
+        yield from self._samples()
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing total, e.g. of ingested points."""
+
+    type_name = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+    ):
+        """Initialize counter, see `_Metric`."""
+        super().__init__(f"{name}_total", documentation, labelnames)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield (
+                f"{self.name}{_format_labels(self._labelnames, labels)} "
+                f"{_format_value(value)}"
+            )
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        """Initialize histogram, see `_Metric`.
+
+        :param buckets: Upper bounds of buckets, +Inf is added implicitly
+        """
+        super().__init__(name, documentation, labelnames)
+        self._buckets = tuple(sorted(buckets))
+        # Per labels: non-cumulative count of every bucket and sum of values
+        self._counts: dict[Labels, list[int]] = {}
+        self._sums: dict[Labels, float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        bucket = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            counts = self._counts.get(labels)
+            if counts is None:
+                counts = self._counts[labels] = [0] * (len(self._buckets) + 1)
+                self._sums[labels] = 0.0
+            counts[bucket] += 1
+            self._sums[labels] += value
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            series = [
+                (labels, list(counts), self._sums[labels])
+                for labels, counts in self._counts.items()
+            ]
+        label_names = (*self._labelnames, "le")
+        for labels, counts, total in series:
+            cumulative = 0
+            for upper_bound, count in zip(
+                (*self._buckets, math.inf),
+                counts,
+                strict=True,
+            ):
+                cumulative += count
+                bucket_labels = (*labels, _format_value(upper_bound))
+                yield (
+                    f"{self.name}_bucket{_format_labels(label_names, bucket_labels)} "
+                    f"{cumulative}"
+                )
+            formatted_labels = _format_labels(self._labelnames, labels)
+            yield f"{self.name}_sum{formatted_labels} {_format_value(total)}"
+            yield f"{self.name}_count{formatted_labels} {cumulative}"
+
+
+class Gauge(_Metric):
+    """Current value computed by a callback every time metrics are scraped."""
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Iterable[tuple[Labels, float]]],
+        labelnames: Sequence[str] = (),
+    ):
+        """Initialize gauge, see `_Metric`.
+
+        :param collect: Returns `(label values, value)` of every series
+        """
+        super().__init__(name, documentation, labelnames)
+        self._collect = collect
+
+    def _samples(self) -> Iterable[str]:
+        for labels, value in self._collect():
+            yield (
+                f"{self.name}{_format_labels(self._labelnames, labels)} "
+                f"{_format_value(value)}"
+            )
+
+
+registry: list[_Metric] = []
+
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text format."""
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+
+request_duration = Histogram(
+    "request_duration_seconds",
+    "Duration of HTTP requests per route.",
+    labelnames=("method", "route", "status"),
+)
+ingested_points = Counter(
+    "ingested_points",
+    "Number of data points added to storages.",
+)
+rejected_requests = Counter(
+    "rejected_requests",
+    "Number of requests rejected by admission control.",
+    labelnames=("pool", "reason"),
+)
+tree_update_duration = Histogram(
+    "tree_update_duration_seconds",
+    "Duration of writing a batch into an interval tree and repairing it.",
+)
+tree_query_duration = Histogram(
+    "tree_query_duration_seconds",
+    "Duration of reads walking an interval tree, including retries.",
+)
+tree_query_points = Histogram(
+    "tree_query_points",
+    "Number of data points covered by reads walking an interval tree.",
+    buckets=tuple(10.0**k for k in range(1, 10)),
+)
+stats_cache_lookups = Counter(
+    "stats_cache_lookups",
+    "Number of /stats/ response cache lookups per result, hit or miss.",
+    labelnames=("result",),
+)
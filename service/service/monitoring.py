@@ -0,0 +1,139 @@
+import logging
+import time
+from collections.abc import Iterable
+from typing import Annotated
+
+from fastapi import APIRouter, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import HTTPException
+from fastapi.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from service import admission, metrics, storage
+from service.cache import stats_cache
+from service.config import config
+from service.profiler import ProfilerBusyError, profiler
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="", tags=["monitoring"])
+
+
+class MetricsMiddleware:
+    """Record the duration of every HTTP request per route template.
+
+    Implemented as a plain ASGI middleware, which adds a single histogram
+    observation to every request and leaves websockets untouched.
+    """
+
+    def __init__(self, app: ASGIApp):
+        """Initialize middleware.
+
+        :param app: Wrapped application
+        """
+        self._app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Forward the request and record its duration."""
+        if scope["type"] != "http":
+            await self._app(scope, receive, send)
+            return
+
+        status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+
+        async def _send(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started_at = time.perf_counter()
+        try:
+            await self._app(scope, receive, _send)
+        finally:
+            # Set by the router, templates keep the number of series bounded
+            route = scope.get("route")
+            metrics.request_duration.observe(
+                time.perf_counter() - started_at,
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status_code),
+            )
+
+
+def _storage_bytes() -> Iterable[tuple[metrics.Labels, float]]:
+    for symbol, symbol_storage in list(storage.symbol_store.items()):
+        yield (symbol,), symbol_storage.nbytes
+
+
+metrics.Gauge(
+    "symbols",
+    "Number of symbols with a storage in memory.",
+    lambda: [((), len(storage.symbol_store))],
+)
+metrics.Gauge(
+    "spilled_symbols",
+    "Number of symbols spilled to disk.",
+    lambda: [((), len(storage.spilled_symbols))],
+)
+metrics.Gauge(
+    "storage_bytes",
+    "Approximate memory held by the storage of every symbol.",
+    _storage_bytes,
+    labelnames=("symbol",),
+)
+metrics.Gauge(
+    "queued_requests",
+    "Number of requests waiting for admission.",
+    lambda: [
+        ((pool,), admission.controller.queued(pool)) for pool in ("read", "write")
+    ],
+    labelnames=("pool",),
+)
+metrics.Gauge(
+    "stats_cache_bytes",
+    "Total size of cached /stats/ responses.",
+    lambda: [((), stats_cache.size)],
+)
+
+
+@router.get(
+    "/metrics",
+    name="Metrics",
+    description="Service metrics in the Prometheus text format.",
+    response_class=PlainTextResponse,
+)
+def metrics_controller() -> PlainTextResponse:
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return PlainTextResponse(
+        metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@router.get(
+    "/debug/profile",
+    name="Profile",
+    description="Sample the stacks of all threads for a short window and return "
+    "them in the collapsed format of flame graph tools. Disabled unless "
+    "PROFILER_ENABLED is set.",
+    response_class=PlainTextResponse,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "Profiler is disabled"},
+        status.HTTP_409_CONFLICT: {"description": "A profile is already running"},
+    },
+)
+async def profile_controller(
+    seconds: Annotated[float, Query(gt=0, le=60)] = 5.0,
+    interval: Annotated[float, Query(ge=0.001, le=1)] = 0.005,
+) -> PlainTextResponse:
+    if not config.PROFILER_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profiler is disabled",
+        )
+    try:
+        stacks = await run_in_threadpool(profiler.profile, seconds, interval)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e)) from e
+    return PlainTextResponse(stacks)
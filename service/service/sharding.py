@@ -0,0 +1,387 @@
+import asyncio
+import logging
+import zlib
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Annotated
+from urllib.parse import quote
+
+import httpx
+from fastapi import APIRouter, Body, FastAPI, Request, WebSocket, status
+from fastapi.exceptions import HTTPException
+from fastapi.responses import JSONResponse, Response
+from pydantic import Field
+
+from service.config import config
+from service.controllers import serve_batch_stream
+from service.dtos import (
+    AddBatchRequest,
+    AddBatchResponse,
+    BackfillRequest,
+    BackfillResponse,
+    BinaryValueType,
+    BulkAddBatchRequest,
+    BulkAddBatchResponse,
+    BulkStatsRequest,
+    BulkStatsResponse,
+    DropSymbolResponse,
+    DurationStatsResponse,
+    SeriesResponse,
+    StatsResponse,
+    StreamBatch,
+    SymbolsResponse,
+)
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="", tags=["statistics"])
+
+
+def shard_for(symbol: str, shard_count: int) -> int:
+    """Index of the shard owning `symbol`, stable across processes and runs."""
+    return zlib.crc32(symbol.encode()) % shard_count
+
+
+class ShardClient:
+    """Forwards requests to the shard processes owning their symbols.
+
+    Every shard is a regular service process holding a disjoint subset of
+    symbols, so each symbol has a single, complete series. The client keeps
+    a pool of connections to every shard.
+    """
+
+    def __init__(
+        self,
+        shard_urls: list[str],
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        """Initialize client.
+
+        :param shard_urls: Base URLs of shards, a symbol is owned by the shard
+            at index `shard_for(symbol, len(shard_urls))`
+        :param transport: Custom transport, e.g. to reach in-process shards
+        """
+        self._shard_urls = shard_urls
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=256),
+            timeout=httpx.Timeout(30.0),
+            transport=transport,
+        )
+
+    @property
+    def shard_count(self) -> int:
+        return len(self._shard_urls)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    async def request(
+        self,
+        shard: int,
+        method: str,
+        path: str,
+        **kwargs: object,
+    ) -> httpx.Response:
+        try:
+            return await self._client.request(
+                method,
+                f"{self._shard_urls[shard]}{path}",
+                **kwargs,
+            )
+        except httpx.HTTPError as e:
+            logger.exception("Shard %d is unavailable", shard)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Shard {shard} is unavailable",
+            ) from e
+
+    async def forward(
+        self,
+        symbol: str,
+        method: str,
+        path: str,
+        **kwargs: object,
+    ) -> Response:
+        response = await self.request(
+            shard_for(symbol, self.shard_count),
+            method,
+            path,
+            **kwargs,
+        )
+        # Shards rejecting requests under overload tell clients when to retry
+        retry_after = response.headers.get("retry-after")
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            media_type=response.headers.get("content-type"),
+            headers={"Retry-After": retry_after} if retry_after is not None else None,
+        )
+
+
+def _client(request: Request | WebSocket) -> ShardClient:
+    return request.app.state.shard_client
+
+
+@router.post("/add_batch/", name="Add batch", response_model=AddBatchResponse)
+async def add_batch_controller(
+    request: Request,
+    batch: AddBatchRequest,
+) -> Response:
+    return await _client(request).forward(
+        batch.symbol,
+        "POST",
+        "/add_batch/",
+        content=batch.model_dump_json(),
+        headers={"Content-Type": "application/json"},
+    )
+
+
+@router.post(
+    "/add_batch/{symbol:path}/binary/",
+    name="Add binary batch",
+    response_model=AddBatchResponse,
+)
+async def add_binary_batch_controller(
+    request: Request,
+    symbol: str,
+    body: Annotated[bytes, Body(media_type="application/octet-stream")] = b"",
+    value_type: BinaryValueType = "float64",
+    timestamp: float | None = None,
+) -> Response:
+    params: dict[str, str | float] = {"value_type": value_type}
+    if timestamp is not None:
+        params["timestamp"] = timestamp
+    return await _client(request).forward(
+        symbol,
+        "POST",
+        f"/add_batch/{quote(symbol, safe='')}/binary/",
+        content=body,
+        params=params,
+        headers={"Content-Type": "application/octet-stream"},
+    )
+
+
+@router.post(
+    "/add_batch/bulk/",
+    name="Add bulk batch",
+    response_model=BulkAddBatchResponse,
+)
+async def add_bulk_batch_controller(
+    request: Request,
+    bulk: BulkAddBatchRequest,
+) -> Response:
+    client = _client(request)
+    batches_by_shard: dict[int, dict[str, list[float]]] = {}
+    for symbol, values in bulk.batches.items():
+        shard = shard_for(symbol, client.shard_count)
+        batches_by_shard.setdefault(shard, {})[symbol] = values
+    responses = await asyncio.gather(
+        *(
+            client.request(
+                shard,
+                "POST",
+                "/add_batch/bulk/",
+                content=BulkAddBatchRequest(batches=batches).model_dump_json(),
+                headers={"Content-Type": "application/json"},
+            )
+            for shard, batches in batches_by_shard.items()
+        ),
+    )
+    for response in responses:
+        if response.status_code != status.HTTP_200_OK:
+            return JSONResponse(response.json(), status_code=response.status_code)
+    return JSONResponse(
+        BulkAddBatchResponse(
+            symbols=list(bulk.batches),
+            message="OK",
+        ).model_dump(),
+    )
+
+
+# Statuses of requests shards did not admit, see `service.admission`
+_OVERLOADED = (status.HTTP_429_TOO_MANY_REQUESTS, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@router.websocket("/add_batch/stream/", name="Add batch stream")
+async def add_batch_stream_controller(websocket: WebSocket) -> None:
+    client = _client(websocket)
+
+    async def _apply(batch: StreamBatch) -> None:
+        content = AddBatchRequest(
+            symbol=batch.symbol,
+            values=batch.values,
+            timestamps=batch.timestamps,
+        ).model_dump_json()
+        while True:
+            response = await client.request(
+                shard_for(batch.symbol, client.shard_count),
+                "POST",
+                "/add_batch/",
+                content=content,
+                headers={"Content-Type": "application/json"},
+            )
+            retry_after = response.headers.get("retry-after")
+            if retry_after is None or response.status_code not in _OVERLOADED:
+                break
+            # Not admitted by the shard. The stream stalls meanwhile, and its
+            # credit keeps the client from sending more than a window ahead
+            await asyncio.sleep(float(retry_after))
+        if response.status_code == status.HTTP_400_BAD_REQUEST:
+            # Rejected by the shard, reported to the client like local errors
+            raise ValueError(response.json()["message"])
+        response.raise_for_status()
+
+    await serve_batch_stream(websocket, _apply)
+
+
+@router.get("/stats/", name="Get stats", response_model=StatsResponse)
+async def get_stats_controller(
+    request: Request,
+    symbol: str,
+    k: Annotated[int, Field(gt=0, le=config.MAX_K)],
+) -> Response:
+    return await _client(request).forward(
+        symbol,
+        "GET",
+        "/stats/",
+        params={"symbol": symbol, "k": k},
+    )
+
+
+@router.get(
+    "/stats/duration/",
+    name="Get duration stats",
+    response_model=DurationStatsResponse,
+)
+async def get_duration_stats_controller(
+    request: Request,
+    symbol: str,
+    seconds: Annotated[float, Field(gt=0)],
+) -> Response:
+    return await _client(request).forward(
+        symbol,
+        "GET",
+        "/stats/duration/",
+        params={"symbol": symbol, "seconds": seconds},
+    )
+
+
+@router.get(
+    "/stats/series/",
+    name="Get series stats",
+    response_model=SeriesResponse,
+)
+async def get_series_stats_controller(
+    request: Request,
+    symbol: str,
+    k: Annotated[int, Field(gt=0, le=config.MAX_K)],
+    buckets: Annotated[int, Field(gt=0, le=config.MAX_SERIES_BUCKETS)],
+    offset: Annotated[int, Field(ge=0)] = 0,
+) -> Response:
+    return await _client(request).forward(
+        symbol,
+        "GET",
+        "/stats/series/",
+        params={"symbol": symbol, "k": k, "buckets": buckets, "offset": offset},
+    )
+
+
+@router.post("/stats/bulk/", name="Get bulk stats", response_model=BulkStatsResponse)
+async def get_bulk_stats_controller(
+    request: Request,
+    bulk: BulkStatsRequest,
+) -> Response:
+    client = _client(request)
+    positions_by_shard: dict[int, list[int]] = {}
+    for position, query in enumerate(bulk.queries):
+        shard = shard_for(query.symbol, client.shard_count)
+        positions_by_shard.setdefault(shard, []).append(position)
+    responses = await asyncio.gather(
+        *(
+            client.request(
+                shard,
+                "POST",
+                "/stats/bulk/",
+                content=BulkStatsRequest(
+                    queries=[bulk.queries[position] for position in positions],
+                ).model_dump_json(),
+                headers={"Content-Type": "application/json"},
+            )
+            for shard, positions in positions_by_shard.items()
+        ),
+    )
+    results: list[dict | None] = [None] * len(bulk.queries)
+    for positions, response in zip(
+        positions_by_shard.values(),
+        responses,
+        strict=True,
+    ):
+        if response.status_code != status.HTTP_200_OK:
+            return JSONResponse(response.json(), status_code=response.status_code)
+        for position, result in zip(positions, response.json()["results"], strict=True):
+            results[position] = result
+    return JSONResponse({"results": results})
+
+
+@router.get("/admin/symbols/", name="List symbols", response_model=SymbolsResponse)
+async def list_symbols_controller(request: Request) -> Response:
+    client = _client(request)
+    responses = await asyncio.gather(
+        *(
+            client.request(shard, "GET", "/admin/symbols/")
+            for shard in range(client.shard_count)
+        ),
+    )
+    symbols: list[dict] = []
+    resident_bytes = 0
+    for response in responses:
+        if response.status_code != status.HTTP_200_OK:
+            return JSONResponse(response.json(), status_code=response.status_code)
+        body = response.json()
+        symbols += body["symbols"]
+        resident_bytes += body["resident_bytes"]
+    symbols.sort(key=lambda symbol: symbol["bytes"], reverse=True)
+    return JSONResponse({"symbols": symbols, "resident_bytes": resident_bytes})
+
+
+@router.delete(
+    "/admin/symbols/{symbol:path}/",
+    name="Drop symbol",
+    response_model=DropSymbolResponse,
+)
+async def drop_symbol_controller(request: Request, symbol: str) -> Response:
+    return await _client(request).forward(
+        symbol,
+        "DELETE",
+        f"/admin/symbols/{quote(symbol, safe='')}/",
+    )
+
+
+@router.post(
+    "/admin/symbols/{symbol:path}/backfill/",
+    name="Backfill symbol",
+    response_model=BackfillResponse,
+)
+async def backfill_symbol_controller(
+    request: Request,
+    symbol: str,
+    backfill: BackfillRequest,
+) -> Response:
+    # The file must be readable by the shard owning the symbol
+    return await _client(request).forward(
+        symbol,
+        "POST",
+        f"/admin/symbols/{quote(symbol, safe='')}/backfill/",
+        content=backfill.model_dump_json(),
+        headers={"Content-Type": "application/json"},
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    app.state.shard_client = ShardClient(config.SHARD_URLS)
+    yield
+    await app.state.shard_client.close()
+
+
+router_app = FastAPI(lifespan=lifespan)
+router_app.include_router(router)
@@ -1,4 +1,17 @@
-from typing import NamedTuple, Protocol
+import math
+from collections.abc import Sequence
+from typing import ClassVar, Literal, NamedTuple, Protocol, TypeVar
+
+Aggregation = Literal[
+    "min",
+    "max",
+    "last",
+    "sum",
+    "count",
+    "sum_squares",
+    "mean",
+    "m2",
+]
 
 
 class StatisticProtocol(Protocol):
@@ -9,6 +22,35 @@ class StatisticProtocol(Protocol):
     def merge(cls, *statistics: "StatisticProtocol") -> "StatisticProtocol": ...
 
 
+class BulkStatisticProtocol(StatisticProtocol, Protocol):
+    """Statistic which can create and merge many aggregates in one call.
+
+    Optional: trees call `create_many` and `merge_many` of this module, which
+    fall back to `create` and `merge` for classes without these methods.
+    """
+
+    @classmethod
+    def create_many(cls, values: Sequence[float]) -> list["StatisticProtocol"]: ...
+
+    @classmethod
+    def merge_many(
+        cls,
+        groups: Sequence[Sequence["StatisticProtocol"]],
+    ) -> list["StatisticProtocol"]: ...
+
+
+class ColumnarStatisticProtocol(StatisticProtocol, Protocol):
+    """Statistic which can be stored column by column.
+
+    `COLUMNS` maps every field of the statistic to the aggregation used to build
+    a leaf from a single value and to merge children into their parent.
+    "mean" and "m2" are merged together with the "count" column, see
+    `CenteredStatistic`.
+    """
+
+    COLUMNS: ClassVar[dict[str, Aggregation]]
+
+
 class Statistic(NamedTuple):
     min: float
     max: float
@@ -17,6 +59,23 @@ class Statistic(NamedTuple):
     count: int
     sum_squares: float
 
+    COLUMNS = {  # noqa: RUF012
+        "min": "min",
+        "max": "max",
+        "last": "last",
+        "sum": "sum",
+        "count": "count",
+        "sum_squares": "sum_squares",
+    }
+
+    @property
+    def avg(self) -> float:
+        return self.sum / self.count
+
+    @property
+    def var(self) -> float:
+        return self.sum_squares / self.count - self.avg**2
+
     @classmethod
     def create(cls, value: float) -> "Statistic":
         return cls(
@@ -30,11 +89,301 @@ class Statistic(NamedTuple):
 
     @classmethod
     def merge(cls, *statistics: "Statistic") -> "Statistic":
+        return cls.merge_many([statistics])[0]
+
+    # Bulk operations build tuples directly, skipping the keyword handling
+    # of the generated `__new__`, which dominates the cost of tiny tuples
+
+    @classmethod
+    def create_many(cls, values: Sequence[float]) -> list["Statistic"]:
+        new = tuple.__new__
+        return [new(cls, (value, value, value, value, 1, value**2)) for value in values]
+
+    @classmethod
+    def merge_many(
+        cls,
+        groups: Sequence[Sequence["Statistic"]],
+    ) -> list["Statistic"]:
+        new = tuple.__new__
+        merged = []
+        for group in groups:
+            # One pass transposes the group into a sequence per field
+            mins, maxs, lasts, sums, counts, sums_squares = zip(*group, strict=True)
+            merged.append(
+                new(
+                    cls,
+                    (
+                        min(mins),
+                        max(maxs),
+                        lasts[-1],
+                        sum(sums),
+                        sum(counts),
+                        sum(sums_squares),
+                    ),
+                ),
+            )
+        return merged
+
+
+class CenteredStatistic(NamedTuple):
+    """Statistic keeping the mean and the sum of squared deviations from it.
+
+    `Statistic` derives the variance as `sum_squares/count - avg**2`, which
+    cancels catastrophically once the sums grow large relative to the spread
+    of the values, e.g. for prices around 10^4 over 10^8 points, and is unusable
+    when the sums are stored in float32. Here `m2` is the sum of squared
+    deviations from `mean`, and groups are merged with the parallel formula of
+    Chan et al.:
+
+        mean = sum(count_i * mean_i) / count
+        m2 = sum(m2_i) + sum(count_i * (mean_i - mean)**2)
+
+    Every term is non-negative and scaled to the spread of the values, so the
+    variance keeps full relative precision over windows of any size.
+    """
+
+    min: float
+    max: float
+    last: float
+    count: int
+    mean: float
+    m2: float
+
+    COLUMNS = {  # noqa: RUF012
+        "min": "min",
+        "max": "max",
+        "last": "last",
+        "count": "count",
+        "mean": "mean",
+        "m2": "m2",
+    }
+
+    @property
+    def avg(self) -> float:
+        return self.mean
+
+    @property
+    def var(self) -> float:
+        return self.m2 / self.count
+
+    @classmethod
+    def create(cls, value: float) -> "CenteredStatistic":
+        return cls(min=value, max=value, last=value, count=1, mean=value, m2=0.0)
+
+    @classmethod
+    def merge(cls, *statistics: "CenteredStatistic") -> "CenteredStatistic":
+        return cls.merge_many([statistics])[0]
+
+    @classmethod
+    def create_many(cls, values: Sequence[float]) -> list["CenteredStatistic"]:
+        new = tuple.__new__
+        return [new(cls, (value, value, value, 1, value, 0.0)) for value in values]
+
+    @classmethod
+    def merge_many(
+        cls,
+        groups: Sequence[Sequence["CenteredStatistic"]],
+    ) -> list["CenteredStatistic"]:
+        new = tuple.__new__
+        merged = []
+        for group in groups:
+            mins, maxs, lasts, counts, means, m2s = zip(*group, strict=True)
+            count = sum(counts)
+            mean = sum(n * m for n, m in zip(counts, means, strict=True)) / count
+            m2 = sum(m2s) + sum(
+                n * (m - mean) ** 2 for n, m in zip(counts, means, strict=True)
+            )
+            merged.append(
+                new(cls, (min(mins), max(maxs), lasts[-1], count, mean, m2)),
+            )
+        return merged
+
+
+class QuantileStatistic(NamedTuple):
+    """`CenteredStatistic` with a DDSketch of the values, for their quantiles.
+
+    Values are counted in logarithmic bins: bin `k` of either sign holds the
+    values of magnitude in (GAMMA**(k-1), GAMMA**k] and estimates them by
+    `2*GAMMA**k/(GAMMA+1)`, off by at most RELATIVE_ACCURACY of any of them.
+    Zeros are the values of `count` missing from the bins. Sketches merge by
+    adding the counts of equal bins, so the quantiles of a window do not
+    depend on the nodes the tree splits it into.
+
+    A sketch holds at most MAX_BINS bins, whatever the number of values below
+    its node: beyond that, the lowest bins are collapsed into the next one,
+    which only makes quantiles within the collapsed values less accurate.
+    Leaves hold no sketch at all, their single bin is derived from `last`
+    when they are merged, so they take no more memory than other statistics.
+    """
+
+    min: float
+    max: float
+    last: float
+    count: int
+    mean: float
+    m2: float
+    # Count of values per bin, the key of bin `k` is `2*k` for positive
+    # values and `2*k + 1` for negative ones. None for a single value
+    bins: dict[int, int] | None
+
+    RELATIVE_ACCURACY = 0.01
+    MAX_BINS = 1024
+    GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    LOG_GAMMA = math.log(GAMMA)
+
+    @property
+    def avg(self) -> float:
+        return self.mean
+
+    @property
+    def var(self) -> float:
+        return self.m2 / self.count
+
+    def quantiles(self, qs: Sequence[float]) -> list[float]:
+        """Return the `q`-quantile of the values for every `q` of `qs`.
+
+        The `q`-quantile is the value of rank `floor(q * (count - 1))` in
+        ascending order, estimated within RELATIVE_ACCURACY and clamped to
+        the exact `min` and `max`, which the 0- and 1-quantiles are.
+        """
+        cls = type(self)
+        if self.bins is None:
+            return [self.last for _ in qs]
+        ordered = sorted((cls._estimate(key), n) for key, n in self.bins.items())
+        zeros = self.count - sum(n for _, n in ordered)
+        if zeros:
+            ordered.append((0.0, zeros))
+            ordered.sort()
+        results = []
+        for q in qs:
+            rank = q * (self.count - 1)
+            if rank < 1:
+                results.append(self.min)
+                continue
+            if rank >= self.count - 1:
+                results.append(self.max)
+                continue
+            seen = 0
+            value = self.max
+            for estimate, n in ordered:
+                seen += n
+                if seen > rank:
+                    value = estimate
+                    break
+            results.append(min(max(value, self.min), self.max))
+        return results
+
+    @classmethod
+    def create(cls, value: float) -> "QuantileStatistic":
         return cls(
-            min=min(stat.min for stat in statistics),
-            max=max(stat.max for stat in statistics),
-            last=statistics[-1].last,
-            sum=sum(stat.sum for stat in statistics),
-            count=sum(stat.count for stat in statistics),
-            sum_squares=sum(stat.sum_squares for stat in statistics),
+            min=value,
+            max=value,
+            last=value,
+            count=1,
+            mean=value,
+            m2=0.0,
+            bins=None,
         )
+
+    @classmethod
+    def merge(cls, *statistics: "QuantileStatistic") -> "QuantileStatistic":
+        return cls.merge_many([statistics])[0]
+
+    @classmethod
+    def create_many(cls, values: Sequence[float]) -> list["QuantileStatistic"]:
+        new = tuple.__new__
+        return [
+            new(cls, (value, value, value, 1, value, 0.0, None)) for value in values
+        ]
+
+    @classmethod
+    def merge_many(
+        cls,
+        groups: Sequence[Sequence["QuantileStatistic"]],
+    ) -> list["QuantileStatistic"]:
+        new = tuple.__new__
+        merged = []
+        for group in groups:
+            mins, maxs, lasts, counts, means, m2s, bins_list = zip(*group, strict=True)
+            count = sum(counts)
+            mean = sum(n * m for n, m in zip(counts, means, strict=True)) / count
+            m2 = sum(m2s) + sum(
+                n * (m - mean) ** 2 for n, m in zip(counts, means, strict=True)
+            )
+            # Counts are added to a copy of the largest sketch, copied in C
+            largest = max(
+                range(len(group)),
+                key=lambda i: len(bins_list[i]) if bins_list[i] else 0,
+            )
+            bins = dict(bins_list[largest] or {})
+            get = bins.get
+            for i, (stat_bins, last) in enumerate(zip(bins_list, lasts, strict=True)):
+                if stat_bins is None:
+                    if last:
+                        key = cls._key(last)
+                        bins[key] = get(key, 0) + 1
+                elif i != largest:
+                    for key, n in stat_bins.items():
+                        bins[key] = get(key, 0) + n
+            if len(bins) > cls.MAX_BINS:
+                cls._collapse(bins)
+            merged.append(
+                new(cls, (min(mins), max(maxs), lasts[-1], count, mean, m2, bins)),
+            )
+        return merged
+
+    @classmethod
+    def _key(cls, value: float) -> int:
+        """Return the key of the bin of a non-zero value."""
+        k = math.ceil(math.log(abs(value)) / cls.LOG_GAMMA)
+        return 2 * k + (value < 0)
+
+    @classmethod
+    def _estimate(cls, key: int) -> float:
+        magnitude = 2 * math.exp((key >> 1) * cls.LOG_GAMMA) / (cls.GAMMA + 1)
+        return -magnitude if key & 1 else magnitude
+
+    @classmethod
+    def _collapse(cls, bins: dict[int, int]) -> None:
+        """Merge bins closest to zero into the next one of their sign.
+
+        The bin of the largest magnitude of each sign is always kept, so
+        that the tails of the values, usually the interesting quantiles, stay
+        accurate.
+        """
+        ordered = sorted(bins, key=lambda key: key >> 1)
+        largest = {key & 1: key for key in ordered}.values()
+        collapsed = [key for key in ordered if key not in largest]
+        carried = [0, 0]
+        for key in collapsed[: len(bins) - cls.MAX_BINS]:
+            carried[key & 1] += bins.pop(key)
+        for key in ordered:
+            # The remaining bin closest to zero of each sign takes the counts
+            if carried[key & 1] and key in bins:
+                bins[key] += carried[key & 1]
+                carried[key & 1] = 0
+
+
+# Statistics which responses are rendered from, through `avg` and `var`
+SummaryStatistic = Statistic | CenteredStatistic | QuantileStatistic
+
+StatT = TypeVar("StatT", bound=StatisticProtocol)
+
+
+def create_many(stats_class: type[StatT], values: Sequence[float]) -> list[StatT]:
+    """Create a statistic of every value, in bulk if the class supports it."""
+    bulk_create = getattr(stats_class, "create_many", None)
+    if bulk_create is not None:
+        return bulk_create(values)
+    return [stats_class.create(value) for value in values]
+
+
+def merge_many(
+    stats_class: type[StatT],
+    groups: Sequence[Sequence[StatT]],
+) -> list[StatT]:
+    """Merge every group of statistics, in bulk if the class supports it."""
+    bulk_merge = getattr(stats_class, "merge_many", None)
+    if bulk_merge is not None:
+        return bulk_merge(groups)
+    return [stats_class.merge(*group) for group in groups]
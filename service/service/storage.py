@@ -1,13 +1,54 @@
+import functools
+import itertools
+import logging
+import pickle
+import shutil
 import threading
-from typing import Generic, TypeVar
+import time
+from collections.abc import Callable, Iterable, Sequence
+from pathlib import Path
+from typing import Generic, NamedTuple, TypeVar
 
-from service.statistics import StatisticProtocol
-from service.utils.interval_tree import DenaryIntervalTree
+import numpy as np
+
+from service import metrics
+from service.statistics import StatisticProtocol, merge_many
+from service.utils.files import write_atomically
+from service.utils.interval_tree import DenaryIntervalTree, IntervalTreeProtocol
+from service.utils.timestamp_index import TimestampIndex
 
 StatT = TypeVar("StatT", bound=StatisticProtocol)
+_T = TypeVar("_T")
+
+logger = logging.getLogger(__name__)
 
 symbol_store_lock = threading.Lock()
 
+# Versions of every storage start in a range of their own, so that versions
+# of a dropped or spilled storage never match those of its successor
+_VERSION_RANGE_BITS = 48
+_version_ranges = itertools.count()
+
+# Memory-mapped state of persistent storages: index, max_size and length
+_STATE_LENGTH = 3
+
+
+class StorageClosedError(RuntimeError):
+    """Raised when writing to a storage which was spilled or dropped."""
+
+
+class _PendingBatch:
+    """Batch waiting in `StatsStorage.add` for the writer applying its group."""
+
+    __slots__ = ("applied", "error", "timestamps", "values")
+
+    def __init__(self, values: Sequence[float], timestamps: np.ndarray | None):
+        self.values = values
+        # None until stamped with the arrival time by the writer
+        self.timestamps = timestamps
+        self.applied = False
+        self.error: Exception | None = None
+
 
 class StatsStorage(Generic[StatT]):
     """In-memory circular storage for calculating aggregates over time series data.
@@ -22,19 +63,56 @@ class StatsStorage(Generic[StatT]):
         _max_size (int): Maximum number of latest values to
             retain (circular buffer capacity).
         _stats_class (type[StatT]): Class implementing `StatisticProtocol`.
-        _interval_tree (DenaryIntervalTree): Efficient interval-based
+        _interval_tree (IntervalTreeProtocol): Efficient interval-based
             structure for O(log n) stats.
         _index (int): Current index in the circular buffer
             where the next data point will be inserted.
+        _timestamps (TimestampIndex): Timestamp of every data point, kept next
+            to the circular buffer and overwritten with it.
+        _length (int): Number of stored data points, at most `_max_size`.
+        _windows (dict[int, StatT | None]): Aggregates over the most recent
+            `window` data points, replaced as a whole on every `add`.
+        _state (np.ndarray | None): Memory-mapped `[index, max_size, length]`
+            of a persistent storage.
+        _log (Callable[[Sequence[float], np.ndarray], int] | None): Write-ahead
+            log hook, called with every batch and its timestamps before it is
+            applied; returns its LSN.
+        _lsn (int): LSN following the last logged batch.
+        _write_lock (threading.Lock): Serializes writers.
+        _pending (list[_PendingBatch]): Batches waiting for a writer,
+            in arrival order.
+        _linger (float): Seconds a writer waits to coalesce more batches.
+        _version (int): Sequence counter, odd while a write is in progress.
+        _closed (bool): Set once the storage is spilled or dropped, later
+            writes raise `StorageClosedError`.
 
     Methods:
-        add(values: list[float]) -> None:
-            Inserts a batch of new data points into the circular
-            buffer and updates internal structures.
+        add(values: Sequence[float], timestamps=None) -> None:
+            Inserts a batch of new data points (a list or a NumPy array)
+            into the circular buffer and updates internal structures.
+            Timestamps, one per value or one for the whole batch, must not
+            decrease; batches without them are stamped with the arrival time.
 
         get(last_n: int) -> StatT | None:
             Retrieves aggregated statistics over the last `last_n` data points.
             Returns `None` if no points are available.
+            Windows passed to the constructor are answered in O(1)
+            without querying the interval tree.
+
+        get_within(seconds: float) -> StatT | None:
+            Retrieves aggregated statistics over the data points stamped
+            less than `seconds` before the latest one, found by binary search
+            and aggregated with a single tree query.
+
+        snapshot(path: Path) -> None / restore(path: Path) -> None:
+            Save and load the state of the storage for crash recovery.
+
+        spill(path: Path) -> None:
+            Snapshots the storage and closes it for writes, so that it can be
+            dropped from memory and restored later.
+
+        replay(values, next_lsn, timestamps) -> None:
+            Applies values recovered from the write-ahead log.
 
     Example:
         >>> stats_storage = StatsStorage(max_size=10000, stats_class=OnlineStats)
@@ -43,62 +121,780 @@ class StatsStorage(Generic[StatT]):
         >>> print(stats.min, stats.max, stats.avg, stats.var)
         100.1 102.5 100.766... 2.156...
 
-    This class is not thread-safe.
+    Concurrent writers are coalesced: batches queue up while a write is in
+    progress and the next writer applies all of them, in arrival order, as one
+    contiguous append with a single tree repair. Every `add` still returns
+    only once its own batch is visible to readers.
+
+    Writers are serialized with a per-storage lock. Readers never take it:
+    window aggregates are read from an immutable snapshot and other reads
+    are optimistic (seqlock), retried whenever they overlap with a write.
 
     """
 
-    def __init__(self, max_size: int, stats_class: type[StatT]):
+    def __init__(  # noqa: PLR0913
+        self,
+        max_size: int,
+        stats_class: type[StatT],
+        tree_class: type[IntervalTreeProtocol] = DenaryIntervalTree,
+        windows: Sequence[int] = (),
+        directory: Path | None = None,
+        log: Callable[[Sequence[float], np.ndarray], int] | None = None,
+        linger: float = 0.0,
+    ):
         """Initialize storage.
 
         :param max_size: Maximum number of latest data points to retain
         :param stats_class: Class implementing `StatisticProtocol`.
+        :param tree_class: Interval tree backend used to compute aggregates.
+        :param windows: Sizes of suffix windows whose aggregates are maintained
+            on every write so that reading them does not walk the tree.
+        :param directory: Directory of memory-mapped files keeping the storage
+            across restarts, reopened if it already exists. None keeps the
+            storage in memory.
+        :param log: Write-ahead log hook called with every batch and its
+            timestamps before it is applied, returns the LSN of the logged batch.
+        :param linger: Seconds a writer waits for more concurrent batches
+            to coalesce with its own.
         """
         self._max_size = max_size
         self._stats_class = stats_class
-        self._interval_tree = DenaryIntervalTree[StatT](max_size, self._stats_class)
+        self._interval_tree = tree_class(
+            max_size,
+            self._stats_class,
+            directory=directory / "tree" if directory is not None else None,
+        )
+        self._state = (
+            _open_state(directory / "state.npy", max_size)
+            if directory is not None
+            else None
+        )
+        self._timestamps = TimestampIndex(
+            max_size,
+            directory / "timestamps.npy" if directory is not None else None,
+        )
         # Index of last inserted data point plus one modulo max_size,
         # i.e. the index of the next data point
-        self._index = 0
+        self._index = int(self._state[0]) if self._state is not None else 0
+        self._length = int(self._state[2]) if self._state is not None else 0
+        self._windows: dict[int, StatT | None] = dict(
+            zip(windows, self._calculate_many(windows), strict=True),
+        )
+        self._log = log
+        self._lsn = 0
+        self._write_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending: list[_PendingBatch] = []
+        self._linger = linger
+        self._version = next(_version_ranges) << _VERSION_RANGE_BITS
+        self._closed = False
+
+    @property
+    def version(self) -> int:
+        """Sequence number of the stored data, changed by every `add`."""
+        return self._version
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the storage."""
+        return self._interval_tree.nbytes + self._timestamps.nbytes
+
+    @property
+    def persistent(self) -> bool:
+        """Whether data is kept in memory-mapped files paged in by the OS."""
+        return self._state is not None
+
+    @property
+    def lsn(self) -> int:
+        """LSN following the last batch applied to the storage."""
+        return self._lsn
+
+    def add(
+        self,
+        values: Sequence[float],
+        timestamps: Sequence[float] | float | None = None,
+    ) -> None:
+        """Append a batch, stamped with `timestamps` or with the arrival time.
+
+        :raises ValueError: If timestamps do not match the values or are
+            earlier than the timestamp of the last stored data point
+        """
+        batch = _PendingBatch(values, _batch_timestamps(timestamps, len(values)))
+        with self._pending_lock:
+            self._pending.append(batch)
+        with self._write_lock:
+            # A previous writer may have applied the batch with its group
+            if batch.applied:
+                return
+            if batch.error is not None:
+                raise batch.error
+            if self._closed:
+                raise StorageClosedError("Storage was spilled or dropped")
+            if self._linger:
+                time.sleep(self._linger)
+            with self._pending_lock:
+                group, self._pending = self._pending, []
+            try:
+                self._add_group(self._stamp(group))
+            except Exception as e:
+                for pending in group:
+                    pending.error = e
+                raise
+            for pending in group:
+                pending.applied = pending.error is None
+            if batch.error is not None:
+                raise batch.error
+
+    def replay(
+        self,
+        values: Sequence[float],
+        next_lsn: int,
+        timestamps: np.ndarray,
+    ) -> None:
+        """Apply values recovered from the write-ahead log without logging them.
+
+        :param values: Values of consecutive logged batches, of any length
+        :param next_lsn: LSN following the last replayed batch
+        :param timestamps: Timestamp of every value
+        """
+        with self._write_lock:
+            for start in range(0, len(values), self._max_size):
+                end = start + self._max_size
+                self._apply(values[start:end], timestamps[start:end])
+            self._lsn = next_lsn
+
+    def snapshot(self, path: Path) -> None:
+        """Atomically write everything needed to `restore` the storage.
+
+        Nothing is written once the storage is closed, its snapshot may
+        have been deleted with it.
+        """
+        with self._write_lock:
+            if self._closed:
+                return
+            data = self._snapshot_data()
+        write_atomically(path, data)
+
+    def spill(self, path: Path) -> None:
+        """Snapshot the storage to `path` and reject any later write.
+
+        Writers which looked the storage up before it was spilled get
+        a `StorageClosedError` instead of writing to a storage nobody reads.
+        """
+        with self._write_lock:
+            write_atomically(path, self._snapshot_data())
+            self._closed = True
+
+    def close(self) -> None:
+        """Reject any later write."""
+        with self._write_lock:
+            self._closed = True
 
-    def add(self, values: list[float]) -> None:
+    def flush(self) -> None:
+        """Write memory-mapped files back to disk, nothing to do in memory."""
+        with self._write_lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._state is not None:
+            self._interval_tree.flush()
+            self._timestamps.flush()
+            self._state.flush()
+
+    def _snapshot_data(self) -> bytes:
+        """Serialize the storage, must be called with `_write_lock` held."""
+        if self._state is not None:
+            # Memory-mapped files are the snapshot, make them durable
+            self._flush()
+            tree, timestamps = None, None
+        else:
+            tree, timestamps = self._interval_tree, self._timestamps
+        return pickle.dumps((self._lsn, self._index, tree, self._length, timestamps))
+
+    def restore(self, path: Path) -> None:
+        # Snapshots are only ever written by `snapshot`
+        lsn, index, tree, length, timestamps = pickle.loads(  # noqa: S301
+            path.read_bytes(),
+        )
+        with self._write_lock:
+            self._version += 1
+            try:
+                if tree is not None:
+                    self._interval_tree = tree
+                    self._timestamps = timestamps
+                self._index = index
+                self._length = length
+                if self._state is not None:
+                    self._state[0] = index
+                    self._state[2] = length
+                self._lsn = lsn
+                self._refresh_windows()
+            finally:
+                self._version += 1
+
+    def get(self, last_n: int) -> StatT | None:
+        windows = self._windows
+        if last_n in windows:
+            return windows[last_n]
+        started_at = time.perf_counter()
+        stats = self._read(lambda: self._calculate(last_n))
+        metrics.tree_query_duration.observe(time.perf_counter() - started_at)
+        metrics.tree_query_points.observe(last_n)
+        return stats
+
+    def get_within(self, seconds: float) -> StatT | None:
+        """Aggregate data points stamped within `seconds` of the latest one.
+
+        The window ends at the latest timestamp rather than the current time,
+        so its aggregate only changes with the stored data.
+        """
+        started_at = time.perf_counter()
+        stats = self._read(lambda: self._calculate_within(seconds))
+        metrics.tree_query_duration.observe(time.perf_counter() - started_at)
+        return stats
+
+    def get_series(
+        self,
+        last_n: int,
+        buckets: int,
+        offset: int = 0,
+    ) -> list[tuple[StatT, StatT]]:
+        """Split a window into equal buckets and aggregate each of them.
+
+        The window holds the `last_n` points ending `offset` points before the
+        latest one, clipped to the stored points, and is split into at most
+        `buckets` buckets of consecutive points, oldest first. Bucket sizes
+        differ by at most one point.
+
+        :return: Aggregates of the first point and of all points of every
+            bucket, empty if the window holds no points
+        """
+        started_at = time.perf_counter()
+        series = self._read(lambda: self._calculate_series(last_n, buckets, offset))
+        metrics.tree_query_duration.observe(time.perf_counter() - started_at)
+        metrics.tree_query_points.observe(last_n)
+        return series
+
+    def _read(self, calculate: Callable[[], _T]) -> _T:
+        """Calculate a consistent aggregate, retrying reads torn by writers."""
+        while True:
+            version = self._version
+            if version % 2:
+                # Yield to the writer instead of reading a half-repaired tree
+                time.sleep(0)
+                continue
+            try:
+                stats = calculate()
+            except Exception:
+                # Torn reads may fail, they are retried like any other torn read
+                if self._version == version:
+                    raise
+                continue
+            if self._version == version:
+                return stats
+
+    def _stamp(self, group: list[_PendingBatch]) -> list[_PendingBatch]:
+        """Stamp batches without timestamps and reject out of order ones.
+
+        Rejected batches get their `error` set and are left out of the returned
+        batches, so that they do not fail the rest of their group.
+        """
+        last = (
+            self._timestamps.get((self._index - 1) % self._max_size)
+            if self._length
+            else -np.inf
+        )
+        now = time.time()
+        accepted = []
+        for pending in group:
+            if pending.timestamps is None:
+                # Never earlier than stored points, even if the clock goes back
+                last = max(last, now)
+                pending.timestamps = np.full(len(pending.values), last)
+            elif len(pending.timestamps):
+                if pending.timestamps[0] < last:
+                    pending.error = ValueError(
+                        "Timestamps must not be earlier than the last stored one",
+                    )
+                    continue
+                last = pending.timestamps[-1]
+            accepted.append(pending)
+        return accepted
+
+    def _add_group(self, batches: list[_PendingBatch]) -> None:
+        """Log and apply batches as one, must be called with `_write_lock` held."""
+        if not batches:
+            return
+        if len(batches) == 1:
+            values, timestamps = batches[0].values, batches[0].timestamps
+        else:
+            values = np.concatenate(
+                [np.asarray(batch.values, dtype=np.float64) for batch in batches],
+            )
+            timestamps = np.concatenate([batch.timestamps for batch in batches])
+        if self._log is not None:
+            self._lsn = self._log(values, timestamps) + 1
+        for start in range(0, len(values), self._max_size):
+            end = start + self._max_size
+            self._apply(values[start:end], timestamps[start:end])
+
+    def _apply(self, values: Sequence[float], timestamps: np.ndarray) -> None:
+        """Apply a batch, must be called with `_write_lock` held."""
+        self._version += 1
+        try:
+            started_at = time.perf_counter()
+            self._add(values, timestamps)
+            metrics.tree_update_duration.observe(time.perf_counter() - started_at)
+            metrics.ingested_points.inc(len(values))
+            self._refresh_windows()
+        finally:
+            self._version += 1
+
+    def _refresh_windows(self) -> None:
+        # Recomputed in one walk of the tree rather than updated with the
+        # batch: statistics have no inverse of `merge` to take out the values
+        # leaving a window. The per-write cost is measured by `benchmarks.suite`
+        self._windows = dict(
+            zip(self._windows, self._calculate_many(self._windows), strict=True),
+        )
+
+    def _add(self, values: Sequence[float], timestamps: np.ndarray) -> None:
         len_values = len(values)
         if self._index + len_values > self._max_size:
-            self._interval_tree.add(values[: self._max_size - self._index], self._index)
-            self._interval_tree.add(values[self._max_size - self._index :], 0)
+            split = self._max_size - self._index
+            self._interval_tree.add(values[:split], self._index)
+            self._interval_tree.add(values[split:], 0)
+            self._timestamps.add(timestamps[:split], self._index)
+            self._timestamps.add(timestamps[split:], 0)
         else:
             self._interval_tree.add(values, self._index)
+            self._timestamps.add(timestamps, self._index)
         self._index = (self._index + len_values) % self._max_size
+        self._length = min(self._length + len_values, self._max_size)
+        if self._state is not None:
+            self._state[0] = self._index
+            self._state[2] = self._length
 
-    def get(self, last_n: int) -> StatT | None:
-        end = (self._index - 1) % self._max_size
-        if end - last_n + 1 < 0:
-            # The order of queries is very important here if any statistic relies on
-            # ordering
-            queries = [
-                (self._max_size - (last_n - end - 1), self._max_size),
-                (0, end),
-            ]
-        else:
-            queries = [(end - last_n + 1, end)]
-        stats = [self._interval_tree.calculate(start, end) for start, end in queries]
-        stats = [stat for stat in stats if stat is not None]
-        if not stats:
+    def _calculate(self, last_n: int) -> StatT | None:
+        return self._calculate_many([last_n])[0]
+
+    def _calculate_within(self, seconds: float) -> StatT | None:
+        if not self._length:
             return None
-        return self._stats_class.merge(*stats)
+        end = (self._index - 1) % self._max_size
+        since = self._timestamps.get(end) - seconds
+        last_n = self._timestamps.count_after(since, end, self._length)
+        return self._calculate(last_n)
+
+    def _calculate_series(
+        self,
+        last_n: int,
+        buckets: int,
+        offset: int,
+    ) -> list[tuple[StatT, StatT]]:
+        length = min(last_n, self._length - offset)
+        buckets = min(buckets, length)
+        if buckets <= 0:
+            return []
+        # Bucket `i` holds points `bounds[i]` to `bounds[i + 1] - 1` of the
+        # window, counted from its oldest point, whose age is `oldest`
+        oldest = offset + length - 1
+        bounds = [i * length // buckets for i in range(buckets + 1)]
+        ages = [
+            (oldest - bounds[i + 1] + 1, oldest - bounds[i]) for i in range(buckets)
+        ]
+        # First points and whole buckets are aggregated in the same walk
+        results = self._calculate_ages(
+            [(last, last) for _, last in ages] + ages,
+        )
+        return list(zip(results[:buckets], results[buckets:], strict=True))
+
+    def _calculate_many(self, last_ns: Iterable[int]) -> list[StatT | None]:
+        """Aggregate the last `n` points for every `n` in one walk of the tree."""
+        return self._calculate_ages([(0, last_n - 1) for last_n in last_ns])
+
+    def _calculate_ages(self, ranges: Iterable[tuple[int, int]]) -> list[StatT | None]:
+        """Aggregate points by age in one walk of the tree.
+
+        :param ranges: `(first, last)` ages of the points of every range,
+            the latest point has age 0. Ages beyond the stored points are
+            ignored.
+        """
+        end = (self._index - 1) % self._max_size
+        queries: list[tuple[int, int]] = []
+        spans: list[slice] = []
+        for first, last in ranges:
+            oldest = min(last, self._length - 1)
+            if first > oldest:
+                spans.append(slice(len(queries), len(queries)))
+                continue
+            start, stop = end - oldest, end - first
+            if stop < 0:
+                start, stop = start + self._max_size, stop + self._max_size
+            if start < 0 <= stop:
+                # The order of queries is very important here if any statistic
+                # relies on ordering
+                spans.append(slice(len(queries), len(queries) + 2))
+                queries += [(start + self._max_size, self._max_size - 1), (0, stop)]
+            else:
+                spans.append(slice(len(queries), len(queries) + 1))
+                queries.append((start, stop))
+        results = self._interval_tree.calculate_many(queries)
+        groups = [
+            [stat for stat in results[span] if stat is not None] for span in spans
+        ]
+        merged = iter(
+            merge_many(self._stats_class, [group for group in groups if group]),
+        )
+        return [next(merged) if group else None for group in groups]
+
+
+def _batch_timestamps(
+    timestamps: Sequence[float] | float | None,
+    length: int,
+) -> np.ndarray | None:
+    """Validate timestamps of a batch, expanding one timestamp to every value."""
+    if timestamps is None:
+        return None
+    if isinstance(timestamps, int | float):
+        timestamps = np.full(length, timestamps, dtype=np.float64)
+    else:
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+    if timestamps.shape != (length,):
+        raise ValueError("Batch must have one timestamp per value")
+    if not np.isfinite(timestamps).all():
+        raise ValueError("Timestamps must be finite")
+    if (np.diff(timestamps) < 0).any():
+        raise ValueError("Timestamps must not decrease")
+    return timestamps
+
+
+def _open_state(path: Path, max_size: int) -> np.ndarray:
+    if path.exists():
+        state = np.load(path, mmap_mode="r+")
+        if state[1] != max_size:
+            msg = f"{path} belongs to a storage of size {state[1]}, not {max_size}"
+            raise ValueError(msg)
+        if len(state) == _STATE_LENGTH:
+            return state
+        # Storages created before timestamps were indexed have no timestamped
+        # points, so their length starts from zero
+        index = int(state[0])
+        del state
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        index = 0
+    state = np.lib.format.open_memmap(
+        path,
+        mode="w+",
+        dtype=np.int64,
+        shape=(_STATE_LENGTH,),
+    )
+    state[:] = (index, max_size, 0)
+    return state
 
 
 symbol_store: dict[str, StatsStorage] = {}
+# Symbols moved out of `symbol_store` by `evict_cold_symbols` with their
+# snapshot files, loaded back by `get_storage_for_symbol` on next access
+spilled_symbols: dict[str, Path] = {}
+# Monotonic time of the last lookup of every symbol in `symbol_store`
+_last_access: dict[str, float] = {}
+
 
+class SymbolFootprint(NamedTuple):
+    symbol: str
+    # False for spilled symbols
+    resident: bool
+    # Memory of resident symbols, size of the snapshot file of spilled ones
+    bytes: int
+    # Seconds since the last lookup, None for spilled symbols
+    idle_seconds: float | None
 
-def get_storage_for_symbol(
+
+def get_storage_for_symbol(  # noqa: PLR0913
     symbol: str,
     max_size: int,
     stats_class: type[StatisticProtocol],
+    tree_class: type[IntervalTreeProtocol] = DenaryIntervalTree,
+    windows: Sequence[int] = (),
+    data_dir: Path | None = None,
+    log: Callable[[str, Sequence[float], np.ndarray], int] | None = None,
+    linger: float = 0.0,
 ) -> StatsStorage:
+    # Lock-free fast path, lookups in a dict are atomic
+    storage = symbol_store.get(symbol)
+    if storage is not None:
+        _last_access[symbol] = time.monotonic()
+        return storage
     with symbol_store_lock:
         if symbol not in symbol_store:
-            symbol_store[symbol] = StatsStorage[stats_class](
+            storage = StatsStorage[stats_class](
                 max_size=max_size,
                 stats_class=stats_class,
+                tree_class=tree_class,
+                windows=windows,
+                directory=(
+                    _symbol_directory(data_dir, symbol)
+                    if data_dir is not None
+                    else None
+                ),
+                log=functools.partial(log, symbol) if log is not None else None,
+                linger=linger,
             )
+            spill_path = spilled_symbols.pop(symbol, None)
+            if spill_path is not None:
+                # The file is kept, it may also be the write-ahead log snapshot
+                storage.restore(spill_path)
+            symbol_store[symbol] = storage
+        _last_access[symbol] = time.monotonic()
         return symbol_store[symbol]
+
+
+def find_storage_for_symbol(symbol: str) -> StatsStorage | None:
+    """Return storage of the symbol without creating it for unknown symbols.
+
+    Spilled symbols are not loaded back, see `spilled_symbols`.
+    """
+    storage = symbol_store.get(symbol)
+    if storage is not None:
+        _last_access[symbol] = time.monotonic()
+    return storage
+
+
+def evict_cold_symbols(
+    max_bytes: int,
+    max_symbols: int,
+    idle_seconds: float,
+    spill_dir: Path,
+) -> list[str]:
+    """Spill least recently used symbols until the symbol store fits its limits.
+
+    Only symbols idle for at least `idle_seconds` are spilled, so that
+    writers still holding a storage they just looked up are unlikely to hit
+    `StorageClosedError`. Memory-mapped storages are paged by the OS and only
+    count towards `max_symbols`.
+
+    Spilling holds `symbol_store_lock`, which delays creating and loading back
+    symbols but not lookups of resident ones.
+
+    :return: Spilled symbols
+    """
+    now = time.monotonic()
+    spilled = []
+    with symbol_store_lock:
+        memory = {
+            symbol: storage.nbytes
+            for symbol, storage in symbol_store.items()
+            if not storage.persistent
+        }
+        total_bytes, count = sum(memory.values()), len(symbol_store)
+        for symbol in sorted(
+            symbol_store,
+            key=lambda symbol: _last_access.get(symbol, 0.0),
+        ):
+            if total_bytes <= max_bytes and count <= max_symbols:
+                break
+            if now - _last_access.get(symbol, 0.0) < idle_seconds:
+                # Every other symbol was used even more recently
+                logger.warning(
+                    "Symbol store exceeds its limits, but no symbol is idle for %.0fs",
+                    idle_seconds,
+                )
+                break
+            path = snapshot_path(spill_dir, symbol)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            symbol_store[symbol].spill(path)
+            del symbol_store[symbol]
+            _last_access.pop(symbol, None)
+            spilled_symbols[symbol] = path
+            total_bytes -= memory.get(symbol, 0)
+            count -= 1
+            spilled.append(symbol)
+    if spilled:
+        logger.info("Spilled %d cold symbols to %s", len(spilled), spill_dir)
+    return spilled
+
+
+def run_evictions(  # noqa: PLR0913
+    max_bytes: int,
+    max_symbols: int,
+    idle_seconds: float,
+    spill_dir: Path,
+    interval: float,
+    stop: threading.Event,
+) -> None:
+    """Evict cold symbols every `interval` seconds until `stop` is set."""
+    while not stop.wait(interval):
+        try:
+            evict_cold_symbols(max_bytes, max_symbols, idle_seconds, spill_dir)
+        except Exception:  # noqa: PERF203
+            logger.exception("Unknown error evicting cold symbols")
+
+
+def drop_symbol(
+    symbol: str,
+    spill_dir: Path,
+    data_dir: Path | None = None,
+    next_lsn: Callable[[], int] | None = None,
+) -> bool:
+    """Delete all data of a resident or spilled symbol.
+
+    :param spill_dir: Directory of spilled storages, their files outlive
+        loading them back
+    :param data_dir: Directory of memory-mapped storages, if used
+    :param next_lsn: Returns the LSN of the next write-ahead log record when
+        the log is enabled. A tombstone is then written to `spill_dir`, so
+        that recovery skips records logged for the dropped symbol.
+    :return: Whether the symbol was known
+    """
+    with symbol_store_lock:
+        storage = symbol_store.pop(symbol, None)
+        _last_access.pop(symbol, None)
+        spilled = spilled_symbols.pop(symbol, None) is not None
+        if storage is not None:
+            # No record of the dropped storage can be logged past this point
+            storage.close()
+        if next_lsn is not None and (storage is not None or spilled):
+            spill_dir.mkdir(parents=True, exist_ok=True)
+            write_atomically(
+                tombstone_path(spill_dir, symbol),
+                str(next_lsn()).encode(),
+            )
+        snapshot_path(spill_dir, symbol).unlink(missing_ok=True)
+        if data_dir is not None:
+            shutil.rmtree(_symbol_directory(data_dir, symbol), ignore_errors=True)
+    return storage is not None or spilled
+
+
+def install_storage(
+    symbol: str,
+    storage: StatsStorage,
+    spill_dir: Path,
+    data_dir: Path | None = None,
+    next_lsn: Callable[[], int] | None = None,
+) -> None:
+    """Atomically replace all data of a symbol with a storage built aside.
+
+    Writers still holding the replaced storage get `StorageClosedError`,
+    readers see either the old or the new storage, never a mix of both.
+
+    :param storage: Storage nobody else uses yet. A memory-mapped one must
+        live in `staging_directory(data_dir, symbol)`, it is moved into
+        `data_dir`.
+    :param spill_dir: Directory of spilled storages, the replaced symbol may
+        have been spilled there
+    :param data_dir: Directory of memory-mapped storages, if used
+    :param next_lsn: Returns the LSN of the next write-ahead log record when
+        the log is enabled. The storage is then snapshotted to `spill_dir`,
+        so that recovery restores it instead of replaying records logged for
+        the replaced storage.
+    """
+    with symbol_store_lock:
+        replaced = symbol_store.pop(symbol, None)
+        _last_access.pop(symbol, None)
+        spilled_symbols.pop(symbol, None)
+        if replaced is not None:
+            # No record of the replaced storage can be logged past this point
+            replaced.close()
+        path = snapshot_path(spill_dir, symbol)
+        if next_lsn is not None:
+            # Nothing to replay, only marks older records as covered
+            storage.replay([], next_lsn(), np.empty(0))
+            path.parent.mkdir(parents=True, exist_ok=True)
+            storage.snapshot(path)
+        else:
+            path.unlink(missing_ok=True)
+        if data_dir is not None:
+            storage.flush()
+            directory = _symbol_directory(data_dir, symbol)
+            replaced_directory = staging_directory(data_dir, symbol).with_suffix(
+                ".replaced",
+            )
+            if directory.exists():
+                directory.rename(replaced_directory)
+            # Mapped files stay valid when their directory is renamed
+            data_dir.mkdir(parents=True, exist_ok=True)
+            staging_directory(data_dir, symbol).rename(directory)
+            shutil.rmtree(replaced_directory, ignore_errors=True)
+        symbol_store[symbol] = storage
+        _last_access[symbol] = time.monotonic()
+
+
+def staging_directory(data_dir: Path, symbol: str) -> Path:
+    """Directory of a memory-mapped storage built aside, see `install_storage`.
+
+    It is next to `data_dir` rather than in it, where every directory is a
+    symbol, but on the same file system, so that it can be moved into it.
+    """
+    return data_dir.with_name(f"{data_dir.name}.staging") / symbol.encode().hex()
+
+
+def symbol_footprints() -> list[SymbolFootprint]:
+    """Describe every resident and spilled symbol."""
+    now = time.monotonic()
+    with symbol_store_lock:
+        resident = list(symbol_store.items())
+        spilled = list(spilled_symbols.items())
+    footprints = [
+        SymbolFootprint(
+            symbol,
+            resident=True,
+            bytes=storage.nbytes,
+            idle_seconds=now - _last_access.get(symbol, now),
+        )
+        for symbol, storage in resident
+    ]
+    for symbol, path in spilled:
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        footprints.append(
+            SymbolFootprint(symbol, resident=False, bytes=size, idle_seconds=None),
+        )
+    return footprints
+
+
+def snapshot_path(directory: Path, symbol: str) -> Path:
+    """Path of the snapshot of `symbol` in `directory`."""
+    return directory / f"{symbol.encode().hex()}.snapshot"
+
+
+def tombstone_path(directory: Path, symbol: str) -> Path:
+    """Path of the LSN at which `symbol` was last dropped, in `directory`."""
+    return directory / f"{symbol.encode().hex()}.dropped"
+
+
+def load_symbol_store(  # noqa: PLR0913
+    data_dir: Path,
+    max_size: int,
+    stats_class: type[StatisticProtocol],
+    tree_class: type[IntervalTreeProtocol],
+    windows: Sequence[int] = (),
+    log: Callable[[str, Sequence[float], np.ndarray], int] | None = None,
+    linger: float = 0.0,
+) -> None:
+    """Reopen storages persisted in `data_dir` by previous runs.
+
+    Files are only memory-mapped, nothing is read or rebuilt up front.
+    """
+    if not data_dir.exists():
+        return
+    with symbol_store_lock:
+        for directory in sorted(data_dir.iterdir()):
+            symbol = bytes.fromhex(directory.name).decode()
+            symbol_store[symbol] = StatsStorage[stats_class](
+                max_size=max_size,
+                stats_class=stats_class,
+                tree_class=tree_class,
+                windows=windows,
+                directory=directory,
+                log=functools.partial(log, symbol) if log is not None else None,
+                linger=linger,
+            )
+
+
+def _symbol_directory(data_dir: Path, symbol: str) -> Path:
+    # Symbols are arbitrary strings, hex keeps them safe as directory names
+    return data_dir / symbol.encode().hex()
@@ -0,0 +1,422 @@
+from collections.abc import Callable, Sequence
+from pathlib import Path
+from typing import Generic, TypeVar
+
+import numpy as np
+
+from service.statistics import Aggregation, ColumnarStatisticProtocol
+from service.utils.interval_tree import level_lengths
+
+StatT = TypeVar("StatT", bound=ColumnarStatisticProtocol)
+
+# Hidden column used to tell empty nodes apart when the statistic has no
+# `count` column of its own
+_COUNT_COLUMN = "__count__"
+
+_LEAF_VALUES: dict[Aggregation, Callable[[np.ndarray], np.ndarray]] = {
+    "min": lambda values: values,
+    "max": lambda values: values,
+    "last": lambda values: values,
+    "sum": lambda values: values,
+    "count": lambda values: np.ones_like(values, dtype=np.int64),
+    "sum_squares": lambda values: values**2,
+    "mean": lambda values: values,
+    "m2": np.zeros_like,
+}
+
+
+def _dtype(agg: Aggregation, *, compact: bool = False) -> np.dtype:
+    if agg == "count":
+        return np.dtype(np.int32 if compact else np.int64)
+    return np.dtype(np.float32 if compact else np.float64)
+
+
+def _open_column(path: Path, length: int, dtype: np.dtype) -> np.ndarray:
+    if not path.exists():
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(length,))
+    column = np.load(path, mmap_mode="r+")
+    if column.shape != (length,) or column.dtype != dtype:
+        msg = f"{path} holds a column of a different tree"
+        raise ValueError(msg)
+    return column
+
+
+class ColumnarIntervalTree(Generic[StatT]):
+    """Fixed-capacity interval tree backed by NumPy arrays.
+
+    Drop-in alternative to `DenaryIntervalTree` for statistics which declare
+    their `COLUMNS`. Every field of the statistic is kept in one contiguous
+    array per tree level, so a whole batch of leaves is written with a single
+    slice assignment and every affected parent level is recomputed
+    with vectorized reductions.
+
+    Note:
+        - This class is **not thread-safe**.
+        - Levels are allocated lazily and grow with the highest inserted index,
+            so memory usage is proportional to the data actually stored.
+        - Every level is sized exactly for `size` leaves, rounded up to
+            a whole group of `fan_out` siblings.
+        - When `directory` is given, every column is a memory-mapped `.npy`
+            file in it. Files are created sparse at full size and reopened
+            as they are, so a restarted process needs no rebuild and the OS
+            page cache decides which levels stay resident.
+        - The lowest `compact_levels` levels store floats in float32 and counts
+            in int32, which halves the size of the leaves that make up most of
+            the tree. Values are rounded to float32 (about 7 significant
+            digits), everything above is reduced in float64. Sums of squares
+            do not survive the rounding, so compact levels need a mean-centered
+            statistic such as `CenteredStatistic`.
+
+    Parameters
+    ----------
+        size (int): Maximum number of leaf nodes.
+        stats_class (type[StatT]): A class implementing
+            `ColumnarStatisticProtocol`.
+        directory (Path | None): Directory of memory-mapped columns,
+            None keeps the tree in memory.
+        fan_out (int): Number of children of every node, 10 by default.
+        compact_levels (int): Number of lowest levels stored in float32,
+            0 by default.
+
+    Attributes
+    ----------
+        _size (int): Logical capacity for values (<= `size`).
+        _stats_class: Class used to build the returned statistics.
+        _columns (dict[str, Aggregation]): Aggregation of every stored column.
+        _count_column (str): Column holding the number of values under a node.
+        _mean_column (str | None): Column holding the mean of the values under
+            a node, which the "m2" aggregation is centered on.
+        _fan_out (int): Number of children of every node.
+        _height (int): Number of levels below the root.
+        _capacities (list[int]): Maximum number of allocated nodes
+            on every level.
+        _levels (list[dict[str, np.ndarray]]): Columns of every tree level,
+            starting from the root.
+        _lengths (list[int]): Number of nodes written so far on every level.
+
+    Example:
+        >>> tree = ColumnarIntervalTree(size=10000, stats_class=Statistic)
+        >>> tree.add([101.0, 102.5, 103.2], index=0)
+        >>> tree.calculate(0, 2).max
+        103.2
+
+    """
+
+    def __init__(
+        self,
+        size: int,
+        stats_class: type[StatT],
+        directory: Path | None = None,
+        fan_out: int = 10,
+        compact_levels: int = 0,
+    ):
+        """Initialize interval tree.
+
+        :param size: Maximum number of leaves in the tree
+        :param stats_class: Class implementing `ColumnarStatisticProtocol`.
+        :param directory: Directory of memory-mapped columns, reopened if it
+            already holds a tree.
+        :param fan_out: Number of children of every node
+        :param compact_levels: Number of lowest levels stored in float32
+        """
+        if not hasattr(stats_class, "COLUMNS"):
+            msg = f"{stats_class.__name__} cannot be stored in columns"
+            raise ValueError(msg)
+        self._size = size
+        self._stats_class = stats_class
+        self._columns: dict[str, Aggregation] = dict(stats_class.COLUMNS)
+        self._count_column = next(
+            (name for name, agg in self._columns.items() if agg == "count"),
+            _COUNT_COLUMN,
+        )
+        self._columns.setdefault(self._count_column, "count")
+        self._mean_column = next(
+            (name for name, agg in self._columns.items() if agg == "mean"),
+            None,
+        )
+        aggregations = set(self._columns.values())
+        if "m2" in aggregations and self._mean_column is None:
+            raise ValueError("The m2 aggregation needs a mean column")
+        if compact_levels < 0:
+            msg = f"Number of compact levels must be non-negative, got {compact_levels}"
+            raise ValueError(msg)
+        if compact_levels and "sum_squares" in aggregations:
+            raise ValueError(
+                "Sums of squares lose all precision in float32, compact levels "
+                "need a mean-centered statistic",
+            )
+
+        self._fan_out = fan_out
+        lengths = level_lengths(size, fan_out)
+        self._height = len(lengths) - 1
+        # Children of every parent are reshaped into rows of `fan_out` nodes,
+        # so levels below the root hold whole groups of siblings
+        self._capacities = [1] + [fan_out * length for length in lengths[:-1]]
+        dtypes = [
+            {
+                name: _dtype(agg, compact=depth > self._height - compact_levels)
+                for name, agg in self._columns.items()
+            }
+            for depth in range(self._height + 1)
+        ]
+        if directory is None:
+            self._levels: list[dict[str, np.ndarray]] = [
+                {name: np.zeros(0, dtype=dtype) for name, dtype in level.items()}
+                for level in dtypes
+            ]
+            self._lengths = [0] * (self._height + 1)
+        else:
+            directory.mkdir(parents=True, exist_ok=True)
+            paths = [
+                {name: directory / f"{depth}_{name}.npy" for name in self._columns}
+                for depth in range(self._height + 1)
+            ]
+            exists = [path.exists() for level in paths for path in level.values()]
+            if any(exists) and not all(exists):
+                msg = f"{directory} holds a tree of a different statistic"
+                raise ValueError(msg)
+            self._levels = [
+                {
+                    name: _open_column(
+                        path,
+                        self._capacities[depth],
+                        dtypes[depth][name],
+                    )
+                    for name, path in level.items()
+                }
+                for depth, level in enumerate(paths)
+            ]
+            self._lengths = list(self._capacities)
+
+    def add(self, values: Sequence[float], index: int) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        len_values = len(values)
+        if len_values + index > self._size:
+            raise ValueError("Index out of range")
+        if len_values == 0:
+            return
+
+        leaves = self._grow_level(self._height, index + len_values)
+        for name, agg in self._columns.items():
+            leaves[name][index : index + len_values] = _LEAF_VALUES[agg](values)
+
+        fan_out = self._fan_out
+        start, end = index, index + len_values
+        for depth in range(self._height - 1, -1, -1):
+            start, end = start // fan_out, (end - 1) // fan_out + 1
+            children = {
+                name: column[start * fan_out : end * fan_out].reshape(-1, fan_out)
+                for name, column in self._levels[depth + 1].items()
+            }
+            level = self._grow_level(depth, end)
+            for name, column in self._reduce(children).items():
+                level[name][start:end] = column
+
+    def flush(self) -> None:
+        """Write memory-mapped columns back to disk."""
+        for level in self._levels:
+            for column in level.values():
+                if isinstance(column, np.memmap):
+                    column.flush()
+
+    @property
+    def nbytes(self) -> int:
+        """Size of all columns, mapped but not necessarily resident for memmaps."""
+        return sum(column.nbytes for level in self._levels for column in level.values())
+
+    def calculate(self, start: int, end: int) -> StatT | None:
+        # Half-open range of nodes at the current depth, walked bottom-up.
+        # Partially covered groups at both boundaries are reduced on the spot
+        # and the rest of the range is handed over to the parent level.
+        fan_out = self._fan_out
+        start, end = max(start, 0), min(end + 1, self._lengths[-1])
+        left_parts: list[dict[str, np.ndarray]] = []
+        right_parts: list[dict[str, np.ndarray]] = []
+        for depth in range(self._height, -1, -1):
+            if start >= end:
+                break
+            level = self._levels[depth]
+            parent_start = -(-start // fan_out)
+            parent_end = end // fan_out
+            if parent_start >= parent_end:
+                left_parts.append(self._reduce_slice(level, start, end))
+                break
+            if start < parent_start * fan_out:
+                left_parts.append(
+                    self._reduce_slice(level, start, parent_start * fan_out),
+                )
+            if parent_end * fan_out < end:
+                right_parts.append(
+                    self._reduce_slice(level, parent_end * fan_out, end),
+                )
+            start, end = parent_start, parent_end
+
+        parts = left_parts + right_parts[::-1]
+        if not parts:
+            return None
+        result = self._reduce(
+            {
+                name: np.concatenate([part[name] for part in parts]).reshape(1, -1)
+                for name in self._columns
+            },
+        )
+        return self._stats(result)[0]
+
+    def calculate_many(
+        self,
+        ranges: Sequence[tuple[int, int]],
+    ) -> list[StatT | None]:
+        """Calculate statistics of every [start, end] range in one tree walk.
+
+        Same walk as `calculate`, vectorized over ranges: on every level the
+        nodes of partially covered groups at both boundaries of all ranges are
+        gathered at once into padded rows, and all gathered rows are reduced
+        together at the end.
+        """
+        if not ranges:
+            return []
+        bounds = np.array(ranges, dtype=np.int64).reshape(-1, 2)
+        start = np.maximum(bounds[:, 0], 0)
+        end = np.maximum(np.minimum(bounds[:, 1] + 1, self._lengths[-1]), start)
+        # Left and right boundary nodes of a range take `fan_out - 1` slots each
+        fan_out = self._fan_out
+        width = fan_out - 1
+        offsets = np.arange(width)
+        left_parts: list[tuple[dict[str, np.ndarray], np.ndarray]] = []
+        right_parts: list[tuple[dict[str, np.ndarray], np.ndarray]] = []
+        for depth in range(self._height, -1, -1):
+            parent_start = -(-start // fan_out)
+            parent_end = np.maximum(end // fan_out, parent_start)
+            left_end = np.minimum(parent_start * fan_out, end)
+            right_start = np.maximum(parent_end * fan_out, left_end)
+            indices = np.concatenate(
+                (start[:, np.newaxis] + offsets, right_start[:, np.newaxis] + offsets),
+                axis=1,
+            )
+            valid = np.concatenate(
+                (
+                    indices[:, :width] < left_end[:, np.newaxis],
+                    indices[:, width:] < end[:, np.newaxis],
+                ),
+                axis=1,
+            )
+            if valid.any():
+                level = self._levels[depth]
+                indices = np.minimum(indices, len(level[self._count_column]) - 1)
+                nodes = {name: column[indices] for name, column in level.items()}
+                left_parts.append(
+                    (
+                        {name: n[:, :width] for name, n in nodes.items()},
+                        valid[:, :width],
+                    ),
+                )
+                right_parts.append(
+                    (
+                        {name: n[:, width:] for name, n in nodes.items()},
+                        valid[:, width:],
+                    ),
+                )
+            if not (parent_start < parent_end).any():
+                break
+            start, end = parent_start, parent_end
+
+        parts = left_parts + right_parts[::-1]
+        if not parts:
+            return [None] * len(bounds)
+        valid = np.concatenate([part_valid for _, part_valid in parts], axis=1)
+        # Padding is given a zero count and sum, `_reduce` treats it as empty
+        return self._stats(
+            self._reduce(
+                {
+                    name: np.where(
+                        valid,
+                        np.concatenate([nodes[name] for nodes, _ in parts], axis=1),
+                        0,
+                    )
+                    for name in self._columns
+                },
+            ),
+        )
+
+    def _stats(self, reduced: dict[str, np.ndarray]) -> list[StatT | None]:
+        columns = {name: reduced[name].tolist() for name in self._stats_class.COLUMNS}
+        return [
+            self._stats_class(**{name: column[i] for name, column in columns.items()})
+            if count
+            else None
+            for i, count in enumerate(reduced[self._count_column])
+        ]
+
+    def _grow_level(self, depth: int, length: int) -> dict[str, np.ndarray]:
+        """Make sure that the first `length` nodes of the level are allocated.
+
+        Allocated arrays always cover whole groups of siblings, so that children
+        of any written parent can be reshaped into rows of `_fan_out` nodes.
+        Capacity grows geometrically to keep sequential writes amortized O(1).
+        """
+        level = self._levels[depth]
+        self._lengths[depth] = max(self._lengths[depth], length)
+        capacity = len(level[self._count_column])
+        if length <= capacity:
+            return level
+        new_capacity = max(length, 2 * capacity)
+        new_capacity = min(
+            -(-new_capacity // self._fan_out) * self._fan_out,
+            self._capacities[depth],
+        )
+        for name, column in level.items():
+            grown = np.zeros(new_capacity, dtype=column.dtype)
+            grown[:capacity] = column
+            level[name] = grown
+        return level
+
+    def _reduce_slice(
+        self,
+        level: dict[str, np.ndarray],
+        start: int,
+        end: int,
+    ) -> dict[str, np.ndarray]:
+        return self._reduce(
+            {name: column[start:end].reshape(1, -1) for name, column in level.items()},
+        )
+
+    def _reduce(self, groups: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+        """Merge every row of `groups` into a single node.
+
+        :param groups: Columns of shape (number of parents, number of children)
+        :return: Columns of shape (number of parents,)
+        """
+        counts = groups[self._count_column]
+        non_empty = counts > 0
+        if self._mean_column is not None:
+            # Weighted mean of the children, "m2" is centered on it
+            total = counts.sum(axis=1)
+            mean = np.divide(
+                (counts * groups[self._mean_column]).sum(axis=1),
+                total,
+                out=np.zeros(len(total)),
+                where=total > 0,
+            )
+        reduced = {}
+        for name, agg in self._columns.items():
+            column = groups[name]
+            if column.dtype == np.float32:
+                # Children on compact levels are reduced in full precision
+                column = column.astype(np.float64)
+            if agg == "min":
+                reduced[name] = np.where(non_empty, column, np.inf).min(axis=1)
+            elif agg == "max":
+                reduced[name] = np.where(non_empty, column, -np.inf).max(axis=1)
+            elif agg == "last":
+                last_child = column.shape[1] - 1 - non_empty[:, ::-1].argmax(axis=1)
+                reduced[name] = column[np.arange(column.shape[0]), last_child]
+            elif agg == "mean":
+                reduced[name] = mean
+            elif agg == "m2":
+                deviations = groups[self._mean_column] - mean[:, np.newaxis]
+                reduced[name] = column.sum(axis=1) + (counts * deviations**2).sum(
+                    axis=1,
+                )
+            else:
+                reduced[name] = column.sum(axis=1)
+        return reduced
@@ -0,0 +1,22 @@
+import os
+from pathlib import Path
+
+
+def fsync_directory(directory: Path) -> None:
+    """Make creation, renaming and removal of files in `directory` durable."""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_atomically(path: Path, data: bytes) -> None:
+    """Durably replace `path` with `data`, readers never see a partial file."""
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with tmp_path.open("wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    tmp_path.replace(path)
+    fsync_directory(path.parent)
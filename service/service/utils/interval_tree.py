@@ -1,22 +1,125 @@
-import math
-from typing import Generic, TypeVar
+import sys
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Generic, Protocol, TypeVar
 
+import numpy as np
 from typing_extensions import NamedTuple
 
-from service.statistics import StatisticProtocol
+from service.statistics import StatisticProtocol, create_many, merge_many
 
 StatT = TypeVar("StatT", bound=StatisticProtocol)
 
 
+class IntervalTreeProtocol(Protocol[StatT]):
+    def __init__(  # noqa: D107
+        self,
+        size: int,
+        stats_class: type[StatT],
+        directory: Path | None = None,
+        fan_out: int = 10,
+        compact_levels: int = 0,
+    ) -> None: ...
+
+    def add(self, values: Sequence[float], index: int) -> None: ...
+
+    def calculate(self, start: int, end: int) -> StatT | None: ...
+
+    def calculate_many(
+        self,
+        ranges: Sequence[tuple[int, int]],
+    ) -> list[StatT | None]: ...
+
+    def flush(self) -> None: ...
+
+    @property
+    def nbytes(self) -> int: ...
+
+
+_POINTER_BYTES = 8
+
+
+def level_lengths(size: int, fan_out: int) -> list[int]:
+    """Return the number of nodes on every level of a tree, from the root.
+
+    Every level holds exactly as many nodes as needed to cover the level below,
+    so the capacity is not rounded up to a power of `fan_out`.
+    """
+    if fan_out < 2:  # noqa: PLR2004
+        msg = f"Fan-out must be at least 2, got {fan_out}"
+        raise ValueError(msg)
+    lengths = [max(size, 1)]
+    while lengths[-1] > 1:
+        lengths.append(-(-lengths[-1] // fan_out))
+    return lengths[::-1]
+
+
 class _Node(NamedTuple):
     interval: tuple[int, int]
     stat: StatisticProtocol
 
 
+def _node_bytes(node: _Node) -> int:
+    size = sys.getsizeof(node) + sys.getsizeof(node.interval)
+    size += sys.getsizeof(node.stat)
+    for field in node.stat:
+        size += sys.getsizeof(field)
+        if isinstance(field, dict):
+            size += sum(map(sys.getsizeof, field.keys()))
+            size += sum(map(sys.getsizeof, field.values()))
+    return size
+
+
+# Pickled form of a level: which nodes are present, and every field of their
+# statistics as an array, or as a tuple of objects when not numeric
+_PackedLevel = tuple[np.ndarray, list[np.ndarray | tuple]]
+
+_NO_LEAF = np.iinfo(np.int64).max
+
+
+def _pack_level(level: list[_Node | None]) -> _PackedLevel:
+    present = np.fromiter(
+        (node is not None for node in level),
+        dtype=bool,
+        count=len(level),
+    )
+    stats = [node.stat for node in level if node is not None]
+    return present, [_pack_column(column) for column in zip(*stats, strict=True)]
+
+
+def _pack_column(column: tuple) -> np.ndarray | tuple:
+    array = np.array(column)
+    return array if array.dtype.kind in "fi" else column
+
+
+def _parent_intervals(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    length: int,
+    fan_out: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return the first and last leaf below every node of a parent level.
+
+    :param starts: First leaf below every child, `_NO_LEAF` for missing ones
+    :param ends: Last leaf below every child, -1 for missing ones
+    """
+    parent_starts = np.full(length * fan_out, _NO_LEAF)
+    parent_ends = np.full(length * fan_out, -1)
+    children = min(len(starts), length * fan_out)
+    parent_starts[:children] = starts[:children]
+    parent_ends[:children] = ends[:children]
+    return (
+        parent_starts.reshape(length, fan_out).min(axis=1),
+        parent_ends.reshape(length, fan_out).max(axis=1),
+    )
+
+
 class DenaryIntervalTree(Generic[StatT]):
-    """Fixed-capacity, denary (base-10) interval tree for rapid computation
+    """Fixed-capacity interval tree for rapid computation
     of aggregate statistics over an interval.
 
+    Every node has up to `fan_out` children, 10 (denary) by default.
+
     This data structure stores up to `size` values and allows
     efficient querying of aggregate statistics
     (e.g., min, max, average, variance) over arbitrary contiguous intervals
@@ -27,22 +130,31 @@ class DenaryIntervalTree(Generic[StatT]):
         - The structure is intended to be used as a static buffer:
             values are inserted only at known indices.
         - It can be further optimized using Cython
+        - Levels are allocated lazily and grow with the highest inserted index,
+            so memory usage is proportional to the data actually stored.
+        - Trees of tuple statistics are pickled, e.g. when spilled, with
+            every numeric field of a level in one array rather than as
+            a Python object per node.
 
     Parameters
     ----------
         size (int): Maximum number of leaf nodes.
-            Internally rounded up to the next power of 10.
         stats_class (type[StatT]): A class implementing the required
             statistic protocol with:
                 - `create(value: float) -> StatT`
                 - `merge(*stats: StatT) -> StatT`
+            and optionally `create_many` and `merge_many`, used when present
+            to create leaves and merge the nodes of a level in bulk.
+        fan_out (int): Number of children of every node.
 
     Attributes
     ----------
         _size (int): Logical capacity for values (<= `size`).
         _stats_class: Class used to compute and merge statistics.
-        _tree (list[_Node | None]): Internal flat list representing a denary tree.
-        _leaves_start_index (int): Start index in `_tree` of the first leaf node.
+        _fan_out (int): Number of children of every node.
+        _height (int): Number of levels below the root.
+        _levels (list[list[_Node | None]]): Nodes of every tree level,
+            starting from the root.
 
     Methods
     -------
@@ -56,6 +168,10 @@ class DenaryIntervalTree(Generic[StatT]):
             over the specified [start, end] interval.
             Returns None if no values exist in the interval.
 
+        calculate_many(ranges: Sequence[tuple[int, int]]) -> list[StatT | None]:
+            Same as `calculate` for every [start, end] range, resolved in
+            a single walk over the tree levels.
+
     Example:
         >>> tree = DenaryIntervalTree(size=10000, stats_class=OnlineStats)
         >>> tree.add([101.0, 102.5, 103.2], index=0)
@@ -65,75 +181,194 @@ class DenaryIntervalTree(Generic[StatT]):
 
     """
 
-    def __init__(self, size: int, stats_class: type[StatT]):
+    def __init__(
+        self,
+        size: int,
+        stats_class: type[StatT],
+        directory: Path | None = None,
+        fan_out: int = 10,
+        compact_levels: int = 0,
+    ):
         """Initialize interval tree.
 
         :param size: Maximum number of leaves in the tree
         :param stats_class: Class implementing `StatisticProtocol`.
+        :param directory: Not supported, nodes are Python objects kept in memory.
+        :param fan_out: Number of children of every node
+        :param compact_levels: Not supported, nodes hold Python floats.
         """
+        if directory is not None:
+            raise ValueError("DenaryIntervalTree can only be kept in memory")
+        if compact_levels:
+            raise ValueError("DenaryIntervalTree has no compact levels")
         self._size = size
-        h = math.ceil(math.log10(self._size))
-        leaves = 10**h
-        total_nodes = (10 ** (h + 1) - 1) // 9
+        self._fan_out = fan_out
+        self._height = len(level_lengths(size, fan_out)) - 1
         self._stats_class = stats_class
-        self._tree: list[_Node | None] = [None for _ in range(total_nodes)]
-        self._leaves_start_index = total_nodes - leaves
+        self._levels: list[list[_Node | None]] = [[] for _ in range(self._height + 1)]
 
-    def add(self, values: list[float], index: int) -> None:
+    def add(self, values: Sequence[float], index: int) -> None:
         len_values = len(values)
         if len_values + index > self._size:
             raise ValueError("Index out of range")
-        for i in range(index, index + len_values):
-            self._tree[i + self._leaves_start_index] = _Node(
-                (i, i),
-                self._stats_class.create(values[i - index]),
-            )
+        if len_values == 0:
+            return
+        leaves = self._grow_level(self._height, index + len_values)
+        leaves[index : index + len_values] = [
+            _Node((i, i), stat)
+            for i, stat in enumerate(create_many(self._stats_class, values), index)
+        ]
+        self._repair_tree(index, index + len_values - 1)
 
-        first_parent = (self._leaves_start_index + index - 1) // 10
-        last_parent = (self._leaves_start_index + index + len_values - 2) // 10
-        self._repair_tree(first_parent, last_parent)
+    def flush(self) -> None:
+        """Nothing to flush, nodes are kept in memory."""
 
-    def calculate(self, start: int, end: int) -> StatT | None:
-        def _query(node_idx: int, interval: tuple[int, int]) -> StatT | None:
-            if node_idx >= len(self._tree) or self._tree[node_idx] is None:
-                return None
-            node = self._tree[node_idx]
-            if node.interval[1] < interval[0] or interval[1] < node.interval[0]:
-                # Node interval is disjoint from the interval
-                return None
-
-            if interval[0] <= node.interval[0] and node.interval[1] <= interval[1]:
-                # The node is fully withing the interval
-                return node.stat
-
-            # Partial overlap
-            children_stats = [
-                _query(10 * node_idx + child_idx + 1, interval)
-                for child_idx in range(10)
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the tree.
+
+        Estimated from the first node of every level, as walking every node
+        would take too long. Statistics of variable size, like sketches, grow
+        with the number of values below a node, so a level is as good a sample
+        as any of its nodes.
+        """
+        return sum(
+            len(level) * _POINTER_BYTES
+            + (len(level) * _node_bytes(level[0]) if level and level[0] else 0)
+            for level in self._levels
+        )
+
+    def __getstate__(self) -> dict:
+        """Return the state to pickle, with every level packed into arrays.
+
+        Nodes pickled one by one take about twice the space of their fields
+        and most of the time goes to the objects. Intervals are left out,
+        `__setstate__` derives them from the nodes present.
+        """
+        state = self.__dict__.copy()
+        if issubclass(self._stats_class, tuple):
+            state["_levels"] = [_pack_level(level) for level in self._levels]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        """Rebuild the nodes of a pickled tree, packed or not."""
+        self.__dict__.update(state)
+        if self._levels and isinstance(self._levels[0], list):
+            # Pickled node by node
+            return
+        packed_levels: list[_PackedLevel] = self._levels
+        new = tuple.__new__
+        levels: list[list[_Node | None]] = []
+        starts = ends = np.empty(0, dtype=np.int64)
+        for depth in range(self._height, -1, -1):
+            present, columns = packed_levels[depth]
+            if depth == self._height:
+                indices = np.arange(len(present))
+                starts = np.where(present, indices, _NO_LEAF)
+                ends = np.where(present, indices, -1)
+            else:
+                starts, ends = _parent_intervals(
+                    starts,
+                    ends,
+                    len(present),
+                    self._fan_out,
+                )
+            stats = [
+                new(self._stats_class, fields)
+                for fields in zip(
+                    *(
+                        column.tolist() if isinstance(column, np.ndarray) else column
+                        for column in columns
+                    ),
+                    strict=True,
+                )
+            ]
+            positions = np.flatnonzero(present)
+            nodes = [
+                new(_Node, ((start, end), stat))
+                for start, end, stat in zip(
+                    starts[positions].tolist(),
+                    ends[positions].tolist(),
+                    stats,
+                    strict=True,
+                )
             ]
-            children_stats = [stat for stat in children_stats if stat is not None]
-            if not children_stats:
-                return None
-            return self._stats_class.merge(*children_stats)
+            level: list[_Node | None] = nodes
+            if len(nodes) < len(present):
+                level = [None] * len(present)
+                for position, node in zip(positions.tolist(), nodes, strict=True):
+                    level[position] = node
+            levels.append(level)
+        self._levels = levels[::-1]
 
-        root = self._tree[0]
-        if root is None:
-            return None
+    def calculate(self, start: int, end: int) -> StatT | None:
+        return self.calculate_many([(start, end)])[0]
 
-        return _query(0, (start, end))
+    def calculate_many(
+        self,
+        ranges: Sequence[tuple[int, int]],
+    ) -> list[StatT | None]:
+        # Half-open ranges of nodes at the current depth, walked bottom-up.
+        # Nodes of partially covered groups at both boundaries are the
+        # canonical covering nodes of the level, the rest of every range is
+        # handed over to the parent level. Only those nodes are merged, once.
+        len_leaves = len(self._levels[-1])
+        bounds = [(max(start, 0), min(end + 1, len_leaves)) for start, end in ranges]
+        left_stats: list[list[StatT]] = [[] for _ in ranges]
+        right_parts: list[list[list[StatT]]] = [[] for _ in ranges]
+        fan_out = self._fan_out
+        for depth in range(self._height, -1, -1):
+            level = self._levels[depth]
+            for i, (start, end) in enumerate(bounds):
+                if start >= end:
+                    continue
+                parent_start, parent_end = -(-start // fan_out), end // fan_out
+                left_end = min(fan_out * parent_start, end)
+                right_start = max(fan_out * parent_end, left_end)
+                left_stats[i].extend(
+                    node.stat for node in level[start:left_end] if node is not None
+                )
+                right_parts[i].append(
+                    [node.stat for node in level[right_start:end] if node is not None],
+                )
+                bounds[i] = (parent_start, parent_end)
 
-    def _repair_tree(self, start: int, end: int) -> None:
-        while start != end or start != 0:
-            for i in range(start, end + 1):
-                children = [self._tree[10 * i + 1 + idx] for idx in range(10)]
-                self._tree[i] = self._create_parent_node(children)
-            start = start if start == 0 else (start - 1) // 10
-            end = (end - 1) // 10
-        self._tree[0] = self._create_parent_node([self._tree[i] for i in range(1, 11)])
-
-    def _create_parent_node(self, children: list[_Node | None]) -> _Node:
-        children = [child for child in children if child is not None]
-        return _Node(
-            interval=(children[0].interval[0], children[-1].interval[1]),
-            stat=self._stats_class.merge(*[child.stat for child in children]),
+        groups = [
+            left + [stat for part in reversed(right) for stat in part]
+            for left, right in zip(left_stats, right_parts, strict=True)
+        ]
+        merged = iter(
+            merge_many(self._stats_class, [group for group in groups if group]),
         )
+        return [next(merged) if group else None for group in groups]
+
+    def _repair_tree(self, start: int, end: int) -> None:
+        """Recompute ancestors of leaves in the [start, end] interval."""
+        fan_out = self._fan_out
+        for depth in range(self._height - 1, -1, -1):
+            start, end = start // fan_out, end // fan_out
+            level = self._grow_level(depth, end + 1)
+            children = self._levels[depth + 1]
+            # Every parent of the level is merged in a single bulk call
+            groups = [
+                [
+                    child
+                    for child in children[fan_out * i : fan_out * (i + 1)]
+                    if child is not None
+                ]
+                for i in range(start, end + 1)
+            ]
+            stats = merge_many(
+                self._stats_class,
+                [[child.stat for child in group] for group in groups],
+            )
+            level[start : end + 1] = [
+                _Node((group[0].interval[0], group[-1].interval[1]), stat)
+                for group, stat in zip(groups, stats, strict=True)
+            ]
+
+    def _grow_level(self, depth: int, length: int) -> list[_Node | None]:
+        level = self._levels[depth]
+        if len(level) < length:
+            level.extend([None] * (length - len(level)))
+        return level
@@ -0,0 +1,85 @@
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+
+
+class TimestampIndex:
+    """Timestamps of the points of a circular buffer, searchable by time.
+
+    Points are appended in time order, so the timestamps of the stored points
+    are sorted except for a single rotation at the write position of the
+    buffer. The points newer than any given time are therefore found with at
+    most two binary searches, one on each side of the rotation.
+
+    Note:
+        - This class is **not thread-safe**.
+        - Timestamps are kept as float64, 8 bytes per point.
+        - In memory the array grows with the highest written index, like the
+            levels of interval trees. With `path`, it is a memory-mapped
+            `.npy` file created sparse at full size and reopened as it is.
+
+    """
+
+    def __init__(self, size: int, path: Path | None = None):
+        """Initialize index.
+
+        :param size: Capacity of the circular buffer
+        :param path: Memory-mapped file of the index, reopened if it exists.
+            None keeps the index in memory.
+        """
+        self._size = size
+        if path is None:
+            self._timestamps = np.zeros(0, dtype=np.float64)
+        elif path.exists():
+            self._timestamps = np.load(path, mmap_mode="r+")
+            if self._timestamps.shape != (size,):
+                msg = f"{path} holds timestamps of a buffer of another size"
+                raise ValueError(msg)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._timestamps = np.lib.format.open_memmap(
+                path,
+                mode="w+",
+                dtype=np.float64,
+                shape=(size,),
+            )
+
+    def add(self, timestamps: Sequence[float], index: int) -> None:
+        """Write timestamps of consecutive points starting at `index`."""
+        end = index + len(timestamps)
+        if end > self._size:
+            raise ValueError("Index out of range")
+        capacity = len(self._timestamps)
+        if end > capacity:
+            grown = np.zeros(min(max(end, 2 * capacity), self._size))
+            grown[:capacity] = self._timestamps
+            self._timestamps = grown
+        self._timestamps[index:end] = timestamps
+
+    def get(self, index: int) -> float:
+        return float(self._timestamps[index])
+
+    def count_after(self, since: float, end: int, length: int) -> int:
+        """Count points later than `since` among `length` points ending at `end`.
+
+        Only the newest points can be later than `since`, so the count is
+        also the number of points to aggregate for the time window.
+        """
+        newer = self._timestamps[max(end - length + 1, 0) : end + 1]
+        count = len(newer) - int(np.searchsorted(newer, since, side="right"))
+        older_length = length - len(newer)
+        if count == len(newer) and older_length > 0:
+            # The window extends past the start of the buffer, to its end
+            older = self._timestamps[self._size - older_length : self._size]
+            count += len(older) - int(np.searchsorted(older, since, side="right"))
+        return count
+
+    def flush(self) -> None:
+        """Write a memory-mapped index back to disk."""
+        if isinstance(self._timestamps, np.memmap):
+            self._timestamps.flush()
+
+    @property
+    def nbytes(self) -> int:
+        return self._timestamps.nbytes
@@ -0,0 +1,332 @@
+import contextlib
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections.abc import Callable, Iterator, Sequence
+from pathlib import Path
+
+import numpy as np
+
+from service import storage
+from service.utils.files import fsync_directory
+
+logger = logging.getLogger(__name__)
+
+# Every record is a header followed by a payload of the symbol length,
+# the UTF-8 encoded symbol, raw little-endian float64 values and as many
+# float64 timestamps. Records written before timestamps were logged have
+# no timestamps and no `_TIMESTAMPED` flag in the symbol length
+_HEADER = struct.Struct("<II")  # payload length, crc32 of the payload
+_SYMBOL_LENGTH = struct.Struct("<H")
+_TIMESTAMPED = 0x8000
+_SEGMENT_SUFFIX = ".wal"
+# Number of recovered values of a symbol applied to its storage at once
+_REPLAY_CHUNK = 2**20
+
+
+class WriteAheadLog:
+    """Append-only log of `(symbol, values, timestamps)` batches with group commit.
+
+    Every record gets a log sequence number (LSN), consecutive from zero.
+    `append` returns only when its record is durable on disk. Writers arriving
+    while a commit is in progress are coalesced into the next commit, which
+    waits `fsync_interval` seconds to collect more of them and then pays for
+    a single write and `fsync` for the whole group.
+
+    The log is split into segment files named after the LSN of their first
+    record, so segments fully covered by snapshots can be deleted with
+    `truncate`. A torn record at the end of the log, left by a crash during
+    a commit that was never acknowledged, is discarded on open. A commit
+    failing to write or fsync is cut off the segment and fails the log for
+    good: after a failed fsync, the state of the file is unknown, and LSNs of
+    later records would no longer match their position in the log. Reopening
+    the log recovers it.
+
+    Attributes:
+        _directory (Path): Directory of segment files.
+        _fsync_interval (float): Seconds a commit waits for more writers.
+        _segment_bytes (int): Size after which a new segment is started.
+        _segments (list[Path]): Segment files, from the oldest.
+        _next_lsn (int): LSN of the next appended record.
+        _durable_lsn (int): All records with a lower LSN are durable.
+        _failed (bool): Set once a commit failed, later appends raise.
+
+    This class is thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        fsync_interval: float = 0.0,
+        segment_bytes: int = 64 * 2**20,
+    ):
+        """Open the log, creating it if needed.
+
+        :param directory: Directory of segment files
+        :param fsync_interval: Seconds a commit waits to group more writers
+        :param segment_bytes: Size after which a new segment is started
+        """
+        self._directory = directory
+        self._fsync_interval = fsync_interval
+        self._segment_bytes = segment_bytes
+        directory.mkdir(parents=True, exist_ok=True)
+
+        self._segments = sorted(directory.glob(f"*{_SEGMENT_SUFFIX}"))
+        if not self._segments:
+            self._segments.append(self._segment_path(0))
+            self._segments[0].touch()
+        last_segment = self._segments[-1]
+        records, valid_bytes = 0, 0
+        for _, end in _scan_segment(last_segment):
+            records, valid_bytes = records + 1, end
+        with last_segment.open("r+b") as file:
+            file.truncate(valid_bytes)
+        self._next_lsn = int(last_segment.stem) + records
+        self._durable_lsn = self._next_lsn
+
+        # Unbuffered, nothing of a failed write may be flushed later
+        self._file = last_segment.open("ab", buffering=0)
+        self._lock = threading.Lock()
+        self._committed = threading.Condition(self._lock)
+        self._segment_lock = threading.Lock()
+        self._committing = False
+        self._pending: list[bytes] = []
+        self._failed = False
+
+    @property
+    def next_lsn(self) -> int:
+        return self._next_lsn
+
+    @property
+    def first_lsn(self) -> int:
+        """LSN of the oldest record still kept, older ones were truncated."""
+        with self._segment_lock:
+            return int(self._segments[0].stem)
+
+    def append(
+        self,
+        symbol: str,
+        values: Sequence[float],
+        timestamps: Sequence[float],
+    ) -> int:
+        """Durably append a batch with the timestamp of every value, return its LSN."""
+        record = _encode(symbol, values, timestamps)
+        with self._lock:
+            if self._failed:
+                raise OSError("Write-ahead log failed, it must be reopened")
+            lsn = self._next_lsn
+            self._next_lsn += 1
+            self._pending.append(record)
+            while self._durable_lsn <= lsn:
+                if self._failed:
+                    raise OSError("Write-ahead log commit failed")
+                if self._committing:
+                    self._committed.wait()
+                    continue
+                self._commit()
+        return lsn
+
+    def read(
+        self,
+        start_lsn: int = 0,
+    ) -> Iterator[tuple[int, str, np.ndarray, np.ndarray]]:
+        """Yield `(lsn, symbol, values, timestamps)` of records from `start_lsn` on.
+
+        Values of records written without timestamps are stamped with -inf,
+        earlier than any time window.
+        """
+        for segment in list(self._segments):
+            lsn = int(segment.stem)
+            for payload, _ in _scan_segment(segment):
+                if lsn >= start_lsn:
+                    yield lsn, *_decode(payload)
+                lsn += 1
+
+    def truncate(self, before_lsn: int) -> None:
+        """Delete segments holding only records with LSN below `before_lsn`."""
+        with self._segment_lock:
+            while len(self._segments) > 1 and int(self._segments[1].stem) <= before_lsn:
+                self._segments.pop(0).unlink()
+
+    def close(self) -> None:
+        with self._segment_lock:
+            self._file.close()
+
+    def _commit(self) -> None:
+        """Write and fsync pending records, must be called with `_lock` held."""
+        self._committing = True
+        try:
+            if self._fsync_interval:
+                self._lock.release()
+                try:
+                    time.sleep(self._fsync_interval)
+                finally:
+                    self._lock.acquire()
+            records, self._pending = self._pending, []
+            end_lsn = self._next_lsn
+            self._lock.release()
+            try:
+                self._write(records, end_lsn - len(records))
+            except Exception:
+                self._failed = True
+                raise
+            finally:
+                self._lock.acquire()
+            self._durable_lsn = end_lsn
+        finally:
+            self._committing = False
+            self._committed.notify_all()
+
+    def _write(self, records: list[bytes], first_lsn: int) -> None:
+        with self._segment_lock:
+            if self._file.tell() >= self._segment_bytes:
+                self._file.close()
+                self._segments.append(self._segment_path(first_lsn))
+                self._file = self._segments[-1].open("ab", buffering=0)
+                fsync_directory(self._directory)
+            offset = self._file.tell()
+            try:
+                data = memoryview(b"".join(records))
+                while data:
+                    data = data[self._file.write(data) :]
+                os.fsync(self._file.fileno())
+            except Exception:
+                # Whatever reached the file is not acknowledged, drop it
+                with contextlib.suppress(OSError):
+                    self._file.truncate(offset)
+                raise
+
+    def _segment_path(self, first_lsn: int) -> Path:
+        return self._directory / f"{first_lsn:020d}{_SEGMENT_SUFFIX}"
+
+
+def snapshot_symbol_store(wal: WriteAheadLog, snapshot_dir: Path) -> None:
+    """Snapshot every storage and drop log segments covered by the snapshots."""
+    # Records below this LSN were applied to their storage before the storage
+    # is snapshotted, as logging and applying happen under its write lock
+    covered_lsn = wal.next_lsn
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    for symbol, symbol_storage in list(storage.symbol_store.items()):
+        symbol_storage.snapshot(storage.snapshot_path(snapshot_dir, symbol))
+    wal.truncate(covered_lsn)
+    # Tombstones are only needed while records older than them are logged
+    first_lsn = wal.first_lsn
+    for path, dropped_lsn in _tombstones(snapshot_dir).items():
+        if dropped_lsn <= first_lsn:
+            path.unlink(missing_ok=True)
+
+
+def run_snapshots(
+    wal: WriteAheadLog,
+    snapshot_dir: Path,
+    interval: float,
+    stop: threading.Event,
+) -> None:
+    """Snapshot the symbol store every `interval` seconds until `stop` is set."""
+    while not stop.wait(interval):
+        try:
+            snapshot_symbol_store(wal, snapshot_dir)
+        except Exception:  # noqa: PERF203
+            logger.exception("Unknown error snapshotting symbol store")
+
+
+def recover_symbol_store(
+    wal: WriteAheadLog,
+    snapshot_dir: Path,
+    get_storage: Callable[[str], storage.StatsStorage],
+) -> None:
+    """Restore storages from snapshots and replay newer log records.
+
+    Records are grouped per symbol and applied in large contiguous chunks,
+    so every tree is repaired once per chunk instead of once per batch.
+    """
+    started_at = time.perf_counter()
+    # Records logged before a symbol was dropped are not replayed
+    dropped = {
+        bytes.fromhex(path.stem).decode(): dropped_lsn
+        for path, dropped_lsn in _tombstones(snapshot_dir).items()
+    }
+    if snapshot_dir.exists():
+        for path in snapshot_dir.glob("*.snapshot"):
+            get_storage(bytes.fromhex(path.stem).decode()).restore(path)
+
+    pending: dict[str, tuple[list[np.ndarray], list[np.ndarray], int, int]] = {}
+
+    def _replay(symbol: str) -> None:
+        chunks, timestamp_chunks, _, next_lsn = pending.pop(symbol)
+        get_storage(symbol).replay(
+            np.concatenate(chunks),
+            next_lsn,
+            np.concatenate(timestamp_chunks),
+        )
+
+    records = 0
+    for lsn, symbol, values, timestamps in wal.read():
+        if lsn < dropped.get(symbol, 0) or lsn < get_storage(symbol).lsn:
+            continue
+        records += 1
+        chunks, timestamp_chunks, size, _ = pending.get(symbol, ([], [], 0, 0))
+        chunks.append(values)
+        timestamp_chunks.append(timestamps)
+        pending[symbol] = (chunks, timestamp_chunks, size + len(values), lsn + 1)
+        if size + len(values) >= _REPLAY_CHUNK:
+            _replay(symbol)
+    for symbol in list(pending):
+        _replay(symbol)
+    logger.info(
+        "Recovered %d log records in %.3fs",
+        records,
+        time.perf_counter() - started_at,
+    )
+
+
+def _tombstones(snapshot_dir: Path) -> dict[Path, int]:
+    """Return the LSN at which every dropped symbol was dropped, by tombstone."""
+    if not snapshot_dir.exists():
+        return {}
+    return {path: int(path.read_bytes()) for path in snapshot_dir.glob("*.dropped")}
+
+
+def _encode(symbol: str, values: Sequence[float], timestamps: Sequence[float]) -> bytes:
+    encoded_symbol = symbol.encode()
+    if len(encoded_symbol) >= _TIMESTAMPED:
+        raise ValueError("Symbol is too long to be logged")
+    payload = b"".join(
+        (
+            _SYMBOL_LENGTH.pack(len(encoded_symbol) | _TIMESTAMPED),
+            encoded_symbol,
+            np.asarray(values, dtype="<f8").tobytes(),
+            np.asarray(timestamps, dtype="<f8").tobytes(),
+        ),
+    )
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _decode(payload: bytes) -> tuple[str, np.ndarray, np.ndarray]:
+    (symbol_length,) = _SYMBOL_LENGTH.unpack_from(payload)
+    symbol_end = _SYMBOL_LENGTH.size + (symbol_length & ~_TIMESTAMPED)
+    symbol = payload[_SYMBOL_LENGTH.size : symbol_end].decode()
+    data = np.frombuffer(payload, dtype="<f8", offset=symbol_end)
+    if not symbol_length & _TIMESTAMPED:
+        return symbol, data, np.full(len(data), -np.inf)
+    values, timestamps = np.split(data, 2)
+    return symbol, values, timestamps
+
+
+def _scan_segment(path: Path) -> Iterator[tuple[bytes, int]]:
+    """Yield payloads of valid records with offsets where they end."""
+    data = path.read_bytes()
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        length, crc = _HEADER.unpack_from(data, offset)
+        end = offset + _HEADER.size + length
+        payload = data[offset + _HEADER.size : end]
+        if end > len(data) or zlib.crc32(payload) != crc:
+            logger.warning("Discarding torn write-ahead log record in %s", path)
+            return
+        yield payload, end
+        offset = end
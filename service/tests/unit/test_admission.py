@@ -0,0 +1,195 @@
+import asyncio
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from main import app
+from service import admission
+from service.admission import AdmissionController, OverloadedError
+from service.config import config
+
+
+async def _hold(
+    controller: AdmissionController,
+    pool: admission.Pool,
+    release: asyncio.Event,
+    symbols: tuple[str, ...] = (),
+) -> None:
+    with controller.limit_symbols(pool, symbols):
+        async with controller.admit(pool):
+            await release.wait()
+
+
+@pytest.mark.unit
+def test_pools_bound_concurrency_and_queues() -> None:
+    async def _run() -> None:
+        controller = AdmissionController(
+            read_concurrency=1,
+            write_concurrency=1,
+            max_queue=1,
+            queue_timeout=0.05,
+            max_symbol_queue=10,
+        )
+        release = asyncio.Event()
+        running = asyncio.create_task(_hold(controller, "write", release))
+        queued = asyncio.create_task(_hold(controller, "write", release))
+        await asyncio.sleep(0)
+        assert controller.queued("write") == 1
+
+        # The queue is full, further writes are rejected at once
+        with pytest.raises(OverloadedError) as error:
+            async with controller.admit("write"):
+                pass
+        assert error.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert error.value.retry_after == 1
+        # Reads are admitted by their own pool
+        async with controller.admit("read"):
+            pass
+
+        release.set()
+        await asyncio.gather(running, queued)
+        assert controller.queued("write") == 0
+
+        # Queued requests time out
+        release.clear()
+        running = asyncio.create_task(_hold(controller, "write", release))
+        await asyncio.sleep(0)
+        with pytest.raises(OverloadedError, match="too long"):
+            async with controller.admit("write"):
+                pass
+        assert controller.queued("write") == 0
+        release.set()
+        await running
+
+    asyncio.run(_run())
+
+
+@pytest.mark.unit
+def test_timed_out_requests_give_their_slot_back() -> None:
+    async def _run() -> None:
+        controller = AdmissionController(
+            read_concurrency=1,
+            write_concurrency=2,
+            max_queue=10,
+            queue_timeout=0.01,
+            max_symbol_queue=10,
+        )
+        release = asyncio.Event()
+        running = [
+            asyncio.create_task(_hold(controller, "write", release)) for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        for _ in range(3):
+            with pytest.raises(OverloadedError) as error:
+                async with controller.admit("write"):
+                    pass
+            assert error.value.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert controller.queued("write") == 0
+        release.set()
+        await asyncio.gather(*running)
+
+        # Both slots are free again, none was handed to a timed out request
+        release.clear()
+        running = [
+            asyncio.create_task(_hold(controller, "write", release)) for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        assert controller.queued("write") == 0
+        release.set()
+        await asyncio.gather(*running)
+
+    asyncio.run(_run())
+
+
+@pytest.mark.unit
+def test_symbol_queue_depth_is_limited() -> None:
+    async def _run() -> None:
+        controller = AdmissionController(
+            read_concurrency=1,
+            write_concurrency=1,
+            max_queue=10,
+            queue_timeout=1.0,
+            max_symbol_queue=2,
+        )
+        release = asyncio.Event()
+        tasks = [
+            asyncio.create_task(_hold(controller, "write", release, ("A",)))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        with (
+            pytest.raises(OverloadedError) as error,
+            controller.limit_symbols("write", ["A", "B"]),
+        ):
+            pass
+        assert error.value.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        tasks.append(asyncio.create_task(_hold(controller, "write", release, ("B",))))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(_run())
+
+
+@pytest.mark.unit
+def test_read_priority_limits_writes_while_reads_wait() -> None:
+    async def _run() -> None:
+        controller = AdmissionController(
+            read_concurrency=1,
+            write_concurrency=3,
+            max_queue=10,
+            queue_timeout=1.0,
+            max_symbol_queue=10,
+            priority="reads",
+        )
+        release_read = asyncio.Event()
+        release_writes = asyncio.Event()
+        reads = [
+            asyncio.create_task(_hold(controller, "read", release_read))
+            for _ in range(2)
+        ]
+        writes = [
+            asyncio.create_task(_hold(controller, "write", release_writes))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        # A read is queued, so a single write runs
+        assert controller.queued("write") == 2  # noqa: PLR2004
+
+        release_read.set()
+        await asyncio.gather(*reads)
+        # Reads were fast, writes run at full concurrency again
+        assert controller.queued("write") == 0
+        release_writes.set()
+        await asyncio.gather(*writes)
+
+    asyncio.run(_run())
+
+
+@pytest.mark.unit
+def test_rejections_carry_retry_after(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(config, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(
+        admission,
+        "controller",
+        AdmissionController(
+            read_concurrency=0,
+            write_concurrency=1,
+            max_queue=0,
+            queue_timeout=1.0,
+            max_symbol_queue=0,
+        ),
+    )
+    client = TestClient(app)
+    response = client.post("/add_batch/", json={"symbol": "BUSY", "values": [1.0]})
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response.headers["Retry-After"] == "1"
+    # Reads cannot be admitted nor queued
+    response = client.get("/stats/", params={"symbol": "BUSY", "k": 1})
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
+
+    monkeypatch.setattr(config, "ADMISSION_ENABLED", False)
+    response = client.post("/add_batch/", json={"symbol": "BUSY", "values": [1.0]})
+    assert response.status_code == status.HTTP_200_OK
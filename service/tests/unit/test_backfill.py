@@ -0,0 +1,215 @@
+import random
+from pathlib import Path
+
+import numpy as np
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from main import app
+from service import storage
+from service.backfill import backfill, read_binary, read_csv
+from service.config import config
+from service.statistics import Statistic
+from service.storage import StatsStorage, StorageClosedError
+from service.utils.columnar_interval_tree import ColumnarIntervalTree
+from service.utils.interval_tree import DenaryIntervalTree, IntervalTreeProtocol
+from service.wal import WriteAheadLog, recover_symbol_store
+
+random.seed(8850213)
+
+MAX_SIZE = 1000
+# Small chunks, so that lines are split across them
+CHUNK_BYTES = 4096
+
+
+def _check(stored: StatsStorage, expected: list[float]) -> None:
+    for last_n in [1, 10, 999, MAX_SIZE]:
+        stats = stored.get(last_n)
+        window = expected[-last_n:]
+        assert stats.count == len(window)
+        assert stats.min == min(window)
+        assert stats.max == max(window)
+        assert stats.last == window[-1]
+        assert stats.sum == pytest.approx(sum(window))
+
+
+@pytest.mark.unit
+def test_csv_is_read_in_chunks(tmp_path: Path) -> None:
+    values = [round(random.uniform(-100, 100), 6) for _ in range(3000)]
+    path = tmp_path / "values.csv"
+    path.write_text("price\n" + "\n".join(map(str, values)))
+    chunks = list(read_csv(path, CHUNK_BYTES))
+    assert len(chunks) > 1
+    assert all(timestamps is None for _, timestamps in chunks)
+    assert np.concatenate([chunk for chunk, _ in chunks]).tolist() == values
+
+    path.write_text("".join(f"{i / 10},{value}\n" for i, value in enumerate(values)))
+    chunks = list(read_csv(path, CHUNK_BYTES))
+    assert np.concatenate([chunk for chunk, _ in chunks]).tolist() == values
+    assert np.concatenate([stamps for _, stamps in chunks]).tolist() == [
+        i / 10 for i in range(len(values))
+    ]
+
+    path.write_text("1.0\n2.0\nprice\n")
+    with pytest.raises(ValueError, match="numeric"):
+        list(read_csv(path))
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    ("text", "line"),
+    [
+        ("1,2\n3,4,5\n6", 2),
+        ("time,price\n1,2\n3\n4,5,6", 3),
+        ("1\n2\n\n3\n", 3),
+        ("\n\n1\n2\nx\n", 5),
+        ("1,2\n3,4\n5,\n", 3),
+    ],
+)
+def test_csv_lines_are_checked_one_by_one(tmp_path: Path, text: str, line: int) -> None:
+    path = tmp_path / "values.csv"
+    path.write_text(text)
+    with pytest.raises(ValueError, match=f"^Line {line} must"):
+        list(read_csv(path))
+
+
+@pytest.mark.unit
+def test_csv_line_numbers_span_chunks(tmp_path: Path) -> None:
+    path = tmp_path / "values.csv"
+    path.write_text("price\n" + "1.5\n" * 2000 + "2.5,3.5\n" + "1.5\n" * 10)
+    with pytest.raises(ValueError, match="^Line 2002 must"):
+        list(read_csv(path, CHUNK_BYTES))
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("tree_class", [DenaryIntervalTree, ColumnarIntervalTree])
+@pytest.mark.parametrize("persistent", [False, True])
+def test_backfill_replaces_symbol(
+    tmp_path: Path,
+    tree_class: type[IntervalTreeProtocol],
+    persistent: bool,  # noqa: FBT001
+) -> None:
+    if persistent and tree_class is DenaryIntervalTree:
+        pytest.skip("Only the columnar tree is memory-mapped")
+    data_dir = tmp_path / "data" if persistent else None
+    old = storage.get_storage_for_symbol(
+        "BACKFILL",
+        MAX_SIZE,
+        Statistic,
+        tree_class,
+        data_dir=data_dir,
+    )
+    old.add([1.0, 2.0])
+
+    # Several times `MAX_SIZE` points, float32 like many tick files
+    values = np.float32([random.uniform(0, 100) for _ in range(3500)])
+    path = tmp_path / "values.f32"
+    values.tofile(path)
+    points = backfill(
+        "BACKFILL",
+        read_binary(path, "float32", CHUNK_BYTES),
+        MAX_SIZE,
+        Statistic,
+        tree_class,
+        tmp_path / "spill",
+        data_dir=data_dir,
+    )
+    assert points == len(values)
+    stored = storage.find_storage_for_symbol("BACKFILL")
+    assert stored is not None
+    assert stored is not old
+    _check(stored, values.tolist())
+    with pytest.raises(StorageClosedError):
+        old.add([3.0])
+    if persistent:
+        assert data_dir is not None
+        assert not storage.staging_directory(data_dir, "BACKFILL").exists()
+        # The installed files are found again after a restart
+        storage.symbol_store.pop("BACKFILL").close()
+        storage.load_symbol_store(data_dir, MAX_SIZE, Statistic, tree_class)
+        _check(storage.symbol_store["BACKFILL"], values.tolist())
+    storage.symbol_store.pop("BACKFILL").close()
+
+
+@pytest.mark.unit
+def test_invalid_backfill_leaves_symbol_untouched(tmp_path: Path) -> None:
+    old = storage.get_storage_for_symbol("BACKFILL_BAD", MAX_SIZE, Statistic)
+    old.add([1.0])
+    path = tmp_path / "values.csv"
+    path.write_text("2,1.0\n1,2.0\n")
+    with pytest.raises(ValueError, match="decrease"):
+        backfill(
+            "BACKFILL_BAD",
+            read_csv(path),
+            MAX_SIZE,
+            Statistic,
+            DenaryIntervalTree,
+            tmp_path,
+        )
+    assert storage.find_storage_for_symbol("BACKFILL_BAD") is old
+    assert old.get(1).last == 1.0
+    storage.symbol_store.pop("BACKFILL_BAD")
+
+
+@pytest.mark.unit
+def test_backfill_survives_log_recovery(tmp_path: Path) -> None:
+    wal = WriteAheadLog(tmp_path / "wal")
+
+    def _get_storage(symbol: str) -> StatsStorage:
+        return storage.get_storage_for_symbol(
+            symbol,
+            MAX_SIZE,
+            Statistic,
+            ColumnarIntervalTree,
+            log=wal.append,
+        )
+
+    _get_storage("BACKFILL_WAL").add([-1.0] * 10)
+    values = [random.random() for _ in range(1500)]
+    backfill(
+        "BACKFILL_WAL",
+        [(np.array(values), None)],
+        MAX_SIZE,
+        Statistic,
+        ColumnarIntervalTree,
+        tmp_path / "snapshots",
+        log=wal.append,
+        next_lsn=lambda: wal.next_lsn,
+    )
+    # Written after the backfill, through the log
+    _get_storage("BACKFILL_WAL").add([5.0])
+    values.append(5.0)
+    wal.close()
+    storage.symbol_store.pop("BACKFILL_WAL")
+
+    wal = WriteAheadLog(tmp_path / "wal")
+    recover_symbol_store(wal, tmp_path / "snapshots", _get_storage)
+    _check(_get_storage("BACKFILL_WAL"), values)
+    wal.close()
+    storage.symbol_store.pop("BACKFILL_WAL")
+
+
+@pytest.mark.unit
+def test_admin_backfill(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    client = TestClient(app)
+    (tmp_path / "values.csv").write_text("timestamp,value\n10,1.5\n20,2.5\n")
+    url = "/admin/symbols/ADMIN_BACKFILL/backfill/"
+    response = client.post(url, json={"path": "values.csv"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    monkeypatch.setattr(config, "ADMIN_ENABLED", True)
+    monkeypatch.setattr(config, "BACKFILL_DIR", tmp_path)
+    response = client.post(url, json={"path": "values.csv"})
+    assert response.json() == {"symbol": "ADMIN_BACKFILL", "points": 2}
+    params = {"symbol": "ADMIN_BACKFILL", "k": 1}
+    stats = client.get("/stats/", params=params).json()["statistics"]
+    assert (stats["min"], stats["last"]) == (1.5, 2.5)
+
+    response = client.post(url, json={"path": "../values.csv"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = client.post(url, json={"path": "missing.csv"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = client.post(url, json={"path": "values.csv", "format": "binary"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    client.delete("/admin/symbols/ADMIN_BACKFILL/")
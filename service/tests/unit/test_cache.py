@@ -0,0 +1,54 @@
+import pytest
+
+from service import metrics
+from service.cache import ResponseCache
+
+
+@pytest.mark.unit
+def test_cache_returns_only_current_version() -> None:
+    cache = ResponseCache(max_bytes=100)
+    assert cache.get("key", 0) is None
+    cache.put("key", 0, b"body")
+    assert cache.get("key", 0) == b"body"
+    assert cache.get("key", 2) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+@pytest.mark.unit
+def test_cache_exports_lookups() -> None:
+    lookups = metrics.Counter("test_lookups", "Test lookups.", labelnames=("result",))
+    metrics.registry.remove(lookups)
+    cache = ResponseCache(max_bytes=100, lookups=lookups)
+    cache.get("key", 0)
+    cache.put("key", 0, b"body")
+    cache.get("key", 0)
+    cache.get("key", 0)
+
+    assert list(lookups.render())[2:] == [
+        'stats_service_test_lookups_total{result="miss"} 1',
+        'stats_service_test_lookups_total{result="hit"} 2',
+    ]
+
+
+@pytest.mark.unit
+def test_cache_evicts_least_recently_used() -> None:
+    cache = ResponseCache(max_bytes=10)
+    cache.put("a", 0, b"aaaa")
+    cache.put("b", 0, b"bbbb")
+    cache.get("a", 0)
+    cache.put("c", 0, b"cccc")
+    assert cache.get("b", 0) is None
+    assert cache.get("a", 0) == b"aaaa"
+    assert cache.get("c", 0) == b"cccc"
+    assert cache.size == 8  # noqa: PLR2004
+
+
+@pytest.mark.unit
+def test_cache_replaces_stale_entries() -> None:
+    cache = ResponseCache(max_bytes=10)
+    cache.put("a", 0, b"aaaa")
+    cache.put("a", 2, b"aaaaaa")
+    cache.put("b", 0, b"b" * 11)
+    assert len(cache) == 1
+    assert cache.size == 6  # noqa: PLR2004
+    assert cache.get("a", 2) == b"aaaaaa"
@@ -0,0 +1,293 @@
+import time
+
+import numpy as np
+import pytest
+from fastapi import WebSocketDisconnect, status
+from fastapi.testclient import TestClient
+
+from main import app
+from service import controllers
+from service.cache import stats_cache
+from service.config import config
+from service.dtos import StreamBatch
+from service.storage import StatsStorage
+
+client = TestClient(app)
+
+
+@pytest.mark.unit
+def test_add_binary_batch() -> None:
+    response = client.post(
+        "/add_batch/BINARY/binary/",
+        content=np.array([1.0, 2.0, 3.0], dtype="<f8").tobytes(),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"symbol": "BINARY", "message": "OK"}
+
+    response = client.post(
+        "/add_batch/BINARY/binary/",
+        params={"value_type": "float32"},
+        content=np.array([4.0], dtype="<f4").tobytes(),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    stats = client.get("/stats/", params={"symbol": "BINARY", "k": 1}).json()
+    assert stats["statistics"] == {
+        "min": 1.0,
+        "max": 4.0,
+        "last": 4.0,
+        "avg": 2.5,
+        "var": 1.25,
+    }
+
+
+@pytest.mark.unit
+def test_add_invalid_binary_batch() -> None:
+    response = client.post(
+        "/add_batch/BINARY_INVALID/binary/",
+        content=np.array([1.0, np.nan]).tobytes(),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.unit
+def test_add_batch_stream() -> None:
+    with client.websocket_connect("/add_batch/stream/") as websocket:
+        hello = websocket.receive_json()
+        assert hello == {"ack": None, "credit": config.STREAM_CREDIT}
+
+        for seq in range(config.STREAM_ACK_EVERY):
+            websocket.send_json({"seq": seq, "symbol": "STREAM_A", "values": [1.0]})
+        assert websocket.receive_json()["ack"] == config.STREAM_ACK_EVERY - 1
+
+        websocket.send_json(
+            {"seq": 100, "symbol": "STREAM_B", "values": [5.0, 7.0], "flush": True},
+        )
+        assert websocket.receive_json()["ack"] == 100  # noqa: PLR2004
+
+    stats = client.get("/stats/", params={"symbol": "STREAM_A", "k": 2}).json()
+    assert stats["statistics"]["avg"] == 1.0
+    stats = client.get("/stats/", params={"symbol": "STREAM_B", "k": 1}).json()
+    assert stats["statistics"]["last"] == 7.0  # noqa: PLR2004
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    ("messages", "expected_code"),
+    [
+        (["not json"], status.WS_1007_INVALID_FRAME_PAYLOAD_DATA),
+        (
+            [
+                '{"seq": 1, "symbol": "STREAM_C", "values": []}',
+                '{"seq": 1, "symbol": "STREAM_C", "values": []}',
+            ],
+            status.WS_1008_POLICY_VIOLATION,
+        ),
+        (
+            [
+                '{"seq": 1, "symbol": "STREAM_D", "values": [1], "timestamps": 2}',
+                '{"seq": 2, "symbol": "STREAM_D", "values": [1], "timestamps": 1}',
+            ],
+            status.WS_1007_INVALID_FRAME_PAYLOAD_DATA,
+        ),
+    ],
+)
+def test_add_batch_stream_rejects_invalid_messages(
+    messages: list[str],
+    expected_code: int,
+) -> None:
+    with client.websocket_connect("/add_batch/stream/") as websocket:
+        websocket.receive_json()
+        for message in messages:
+            websocket.send_text(message)
+        assert "message" in websocket.receive_json()
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            websocket.receive_json()
+        assert exc_info.value.code == expected_code
+
+
+@pytest.mark.unit
+def test_add_batch_stream_enforces_credit(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(config, "STREAM_CREDIT", 2)
+    get_storage = controllers.get_storage
+
+    def _slow_get_storage(batch: StreamBatch) -> StatsStorage:
+        # Every batch is received long before the previous one is applied
+        time.sleep(0.1)
+        return get_storage(batch)
+
+    monkeypatch.setattr(controllers, "get_storage", _slow_get_storage)
+    with client.websocket_connect("/add_batch/stream/") as websocket:
+        assert websocket.receive_json() == {"ack": None, "credit": 2}
+        for seq in range(3):
+            websocket.send_json({"seq": seq, "symbol": "STREAM_E", "values": [1.0]})
+        # Batches within the credit are still applied and acknowledged
+        assert websocket.receive_json() == {"ack": 1, "credit": 2}
+        assert websocket.receive_json()["seq"] == 2  # noqa: PLR2004
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            websocket.receive_json()
+        assert exc_info.value.code == status.WS_1008_POLICY_VIOLATION
+    stats = client.get("/stats/", params={"symbol": "STREAM_E", "k": 1}).json()
+    assert stats["statistics"]["avg"] == 1.0
+
+
+@pytest.mark.unit
+def test_bulk_add_batch_and_stats() -> None:
+    response = client.post(
+        "/add_batch/bulk/",
+        json={"batches": {"BULK_A": [1.0, 3.0], "BULK_B": [10.0]}},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"symbols": ["BULK_A", "BULK_B"], "message": "OK"}
+
+    response = client.post(
+        "/stats/bulk/",
+        json={
+            "queries": [
+                {"symbol": "BULK_A", "k": 1},
+                {"symbol": "BULK_UNKNOWN", "k": 1},
+                {"symbol": "BULK_B", "k": 2},
+                {"symbol": "BULK_A", "k": 3},
+            ],
+        },
+    )
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()["results"]
+    assert [(result["symbol"], result["k"]) for result in results] == [
+        ("BULK_A", 1),
+        ("BULK_UNKNOWN", 1),
+        ("BULK_B", 2),
+        ("BULK_A", 3),
+    ]
+    assert results[0]["statistics"]["avg"] == 2.0  # noqa: PLR2004
+    assert results[1]["statistics"] is None
+    assert results[1]["message"] == "No data points found for the symbol"
+    assert results[2]["statistics"]["last"] == 10.0  # noqa: PLR2004
+    assert results[3]["statistics"] == results[0]["statistics"]
+
+
+@pytest.mark.unit
+def test_stats_are_cached_until_new_data_arrives() -> None:
+    client.post("/add_batch/", json={"symbol": "CACHED", "values": [1.0, 2.0]})
+    params = {"symbol": "CACHED", "k": 1}
+    first = client.get("/stats/", params=params)
+    hits = stats_cache.hits
+    assert client.get("/stats/", params=params).content == first.content
+    assert stats_cache.hits == hits + 1
+
+    client.post("/add_batch/", json={"symbol": "CACHED", "values": [3.0]})
+    response = client.get("/stats/", params=params)
+    assert stats_cache.hits == hits + 1
+    assert response.json()["statistics"]["last"] == 3.0  # noqa: PLR2004
+
+
+@pytest.mark.unit
+def test_duration_stats() -> None:
+    response = client.post(
+        "/add_batch/",
+        json={
+            "symbol": "DURATION",
+            "values": [1.0, 2.0, 3.0, 4.0],
+            "timestamps": [100.0, 101.0, 102.5, 103.0],
+        },
+    )
+    assert response.status_code == status.HTTP_200_OK
+    response = client.post(
+        "/add_batch/",
+        json={"symbol": "DURATION", "values": [5.0], "timestamps": 102.0},
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.get(
+        "/stats/duration/",
+        params={"symbol": "DURATION", "seconds": 1.5},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "symbol": "DURATION",
+        "seconds": 1.5,
+        "statistics": {"min": 3.0, "max": 4.0, "last": 4.0, "avg": 3.5, "var": 0.25},
+    }
+    response = client.get(
+        "/stats/duration/",
+        params={"symbol": "DURATION", "seconds": 0},
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response = client.get(
+        "/stats/duration/",
+        params={"symbol": "DURATION_UNKNOWN", "seconds": 1},
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.unit
+def test_series_stats() -> None:
+    values = [float(value) for value in range(1, 11)]
+    client.post("/add_batch/", json={"symbol": "SERIES", "values": values})
+
+    response = client.get(
+        "/stats/series/",
+        params={"symbol": "SERIES", "k": 1, "buckets": 3, "offset": 2},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "symbol": "SERIES",
+        "k": 1,
+        "offset": 2,
+        "buckets": [
+            {
+                "count": count,
+                "first": bucket[0],
+                "statistics": {
+                    "min": bucket[0],
+                    "max": bucket[-1],
+                    "last": bucket[-1],
+                    "avg": sum(bucket) / count,
+                    "var": pytest.approx(
+                        sum(x**2 for x in bucket) / count - (sum(bucket) / count) ** 2,
+                    ),
+                },
+            }
+            for bucket in ([1.0, 2.0], [3.0, 4.0, 5.0], [6.0, 7.0, 8.0])
+            for count in [len(bucket)]
+        ],
+    }
+
+    params = {"symbol": "SERIES", "k": 1, "buckets": 3, "offset": 10}
+    response = client.get("/stats/series/", params=params)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    params = {"symbol": "SERIES", "k": 1, "buckets": 0}
+    response = client.get("/stats/series/", params=params)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.unit
+def test_admin_symbols(monkeypatch: pytest.MonkeyPatch) -> None:
+    assert client.get("/admin/symbols/").status_code == status.HTTP_404_NOT_FOUND
+    monkeypatch.setattr(config, "ADMIN_ENABLED", True)
+
+    client.post("/add_batch/", json={"symbol": "ADMIN", "values": [1.0, 2.0]})
+    params = {"symbol": "ADMIN", "k": 1}
+    assert client.get("/stats/", params=params).json()["statistics"]["last"] == 2.0  # noqa: PLR2004
+    response = client.get("/admin/symbols/")
+    assert response.status_code == status.HTTP_200_OK
+    [symbol] = [
+        symbol for symbol in response.json()["symbols"] if symbol["symbol"] == "ADMIN"
+    ]
+    assert symbol["resident"]
+    assert symbol["bytes"] > 0
+    assert response.json()["resident_bytes"] >= symbol["bytes"]
+
+    response = client.delete("/admin/symbols/ADMIN/")
+    assert response.json() == {"symbol": "ADMIN", "message": "OK"}
+    assert client.get("/stats/", params=params).status_code == status.HTTP_404_NOT_FOUND
+    response = client.delete("/admin/symbols/ADMIN/")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    # A new storage of the symbol never serves responses cached for the old one
+    client.post("/add_batch/", json={"symbol": "ADMIN", "values": [5.0]})
+    assert client.get("/stats/", params=params).json()["statistics"]["last"] == 5.0  # noqa: PLR2004
+    client.delete("/admin/symbols/ADMIN/")
@@ -0,0 +1,52 @@
+import pytest
+
+from service.config import config
+from service.dependencies import check_config
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    ("settings", "match"),
+    [
+        ({"STORAGE_BACKEND": "mmap"}, "TREE_BACKEND=columnar"),
+        (
+            {"STORAGE_BACKEND": "mmap", "STATISTIC": "quantiles"},
+            "TREE_BACKEND=columnar",
+        ),
+        ({"TREE_BACKEND": "columnar", "STATISTIC": "quantiles"}, "columns"),
+        ({"TREE_BACKEND": "columnar", "TREE_COMPACT_LEVELS": 1}, "float32"),
+        ({"TREE_COMPACT_LEVELS": 1}, "no compact levels"),
+    ],
+)
+def test_invalid_settings_are_rejected(
+    settings: dict[str, object],
+    match: str,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    check_config()
+    for name, value in settings.items():
+        monkeypatch.setattr(config, name, value)
+    with pytest.raises(ValueError, match=match):
+        check_config()
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "settings",
+    [
+        {"STORAGE_BACKEND": "mmap", "TREE_BACKEND": "columnar"},
+        {"STATISTIC": "quantiles"},
+        {
+            "TREE_BACKEND": "columnar",
+            "STATISTIC": "centered",
+            "TREE_COMPACT_LEVELS": 1,
+        },
+    ],
+)
+def test_valid_settings_are_accepted(
+    settings: dict[str, object],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    for name, value in settings.items():
+        monkeypatch.setattr(config, name, value)
+    check_config()
@@ -1,7 +1,23 @@
+import json
+
+import numpy as np
 import pytest
 
-from service.dtos import StatsResponse
-from service.statistics import Statistic
+from service.config import config
+from service.dtos import (
+    AddBatchResponse,
+    BulkAddBatchResponse,
+    DurationStatsResponse,
+    SeriesResponse,
+    StatsResponse,
+    decode_binary_values,
+)
+from service.statistics import (
+    CenteredStatistic,
+    QuantileStatistic,
+    Statistic,
+    SummaryStatistic,
+)
 
 
 @pytest.mark.parametrize(
@@ -47,3 +63,66 @@ def test_stats_response_create(
         assert getattr(response.statistics, field) == pytest.approx(
             getattr(expected_response.statistics, field),
         )
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "stats",
+    [
+        Statistic.merge(*map(Statistic.create, [1e-7, 2.5, 1.2e17])),
+        CenteredStatistic.merge(*map(CenteredStatistic.create, [-1.5, 0.1, 0.2])),
+        QuantileStatistic.merge(*map(QuantileStatistic.create, range(100))),
+        # Columnar trees may return NumPy scalars
+        Statistic(*map(np.float64, [1.0, 3.0, 3.0, 6.0, 3, 14.0])),
+    ],
+)
+def test_rendered_bodies_match_models(stats: SummaryStatistic) -> None:
+    symbol = 'Ä "quoted" \\ symbol'
+    pairs = [
+        (
+            StatsResponse.render(symbol, 3, stats),
+            StatsResponse.create(symbol, 3, stats),
+        ),
+        (
+            DurationStatsResponse.render(symbol, 1.5, stats),
+            DurationStatsResponse.create(symbol, 1.5, stats),
+        ),
+        (
+            SeriesResponse.render(symbol, 2, 7, [(stats, stats)] * 2),
+            SeriesResponse.create(symbol, 2, 7, [(stats, stats)] * 2),
+        ),
+        (
+            AddBatchResponse.render(symbol),
+            AddBatchResponse(symbol=symbol, message="OK"),
+        ),
+        (
+            BulkAddBatchResponse.render([symbol, "B"]),
+            BulkAddBatchResponse(symbols=[symbol, "B"], message="OK"),
+        ),
+    ]
+    for body, model in pairs:
+        assert json.loads(body) == json.loads(model.model_dump_json())
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("value_type", ["float64", "float32"])
+def test_decode_binary_values(value_type: str) -> None:
+    body = np.array([1.5, -2.0, 3.25], dtype=value_type).tobytes()
+    values = decode_binary_values(body, value_type)
+    assert values.dtype == np.float64
+    assert values.tolist() == [1.5, -2.0, 3.25]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"\x00" * 7,
+        np.array([1.0, np.nan]).tobytes(),
+        np.array([np.inf]).tobytes(),
+        np.zeros(config.MAX_BATCH_SIZE + 1).tobytes(),
+    ],
+)
+def test_decode_invalid_binary_values(body: bytes) -> None:
+    with pytest.raises(ValueError):
+        decode_binary_values(body, "float64")
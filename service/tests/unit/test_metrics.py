@@ -0,0 +1,113 @@
+import threading
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from main import app
+from service import metrics
+from service.config import config
+from service.profiler import ProfilerBusyError, SamplingProfiler
+from service.statistics import Statistic
+from service.utils.columnar_interval_tree import ColumnarIntervalTree
+from service.utils.interval_tree import DenaryIntervalTree, IntervalTreeProtocol
+
+client = TestClient(app)
+
+
+@pytest.mark.unit
+def test_histogram_render() -> None:
+    histogram = metrics.Histogram(
+        "test_histogram",
+        "Test histogram.",
+        labelnames=("route",),
+        buckets=(0.1, 1.0),
+    )
+    metrics.registry.remove(histogram)
+    histogram.observe(0.05, '/a"b')
+    histogram.observe(0.5, '/a"b')
+    histogram.observe(5.0, '/a"b')
+
+    assert list(histogram.render()) == [
+        "# HELP stats_service_test_histogram Test histogram.",
+        "# TYPE stats_service_test_histogram histogram",
+        'stats_service_test_histogram_bucket{route="/a\\"b",le="0.1"} 1',
+        'stats_service_test_histogram_bucket{route="/a\\"b",le="1.0"} 2',
+        'stats_service_test_histogram_bucket{route="/a\\"b",le="+Inf"} 3',
+        'stats_service_test_histogram_sum{route="/a\\"b"} 5.55',
+        'stats_service_test_histogram_count{route="/a\\"b"} 3',
+    ]
+
+
+@pytest.mark.unit
+def test_metrics_endpoint() -> None:
+    client.post("/add_batch/", json={"symbol": "METRICS", "values": [1.0, 2.0]})
+    client.get("/stats/", params={"symbol": "METRICS", "k": 1})
+
+    response = client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert any(
+        line.startswith(
+            'stats_service_request_duration_seconds_count{method="POST",'
+            'route="/add_batch/",status="200"} ',
+        )
+        for line in lines
+    )
+    assert any(
+        line.startswith("stats_service_ingested_points_total ") for line in lines
+    )
+    assert any(
+        line.startswith("stats_service_tree_update_duration_seconds_count ")
+        for line in lines
+    )
+    assert any(
+        line.startswith('stats_service_storage_bytes{symbol="METRICS"} ')
+        for line in lines
+    )
+    assert any(
+        line.startswith('stats_service_stats_cache_lookups_total{result="miss"} ')
+        for line in lines
+    )
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("tree_class", [DenaryIntervalTree, ColumnarIntervalTree])
+def test_tree_nbytes_grows_with_data(tree_class: type[IntervalTreeProtocol]) -> None:
+    tree = tree_class(10**6, Statistic)
+    empty = tree.nbytes
+    tree.add([1.0] * 1000, 0)
+    assert tree.nbytes > empty
+    assert tree.nbytes < 10**6
+
+
+@pytest.mark.unit
+def test_profile_endpoint(monkeypatch: pytest.MonkeyPatch) -> None:
+    response = client.get("/debug/profile", params={"seconds": 0.01})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    monkeypatch.setattr(config, "PROFILER_ENABLED", True)
+    response = client.get("/debug/profile", params={"seconds": 0.05})
+    assert response.status_code == status.HTTP_200_OK
+    # The test itself waits for the response in every sample
+    assert "test_profile_endpoint" in response.text
+
+
+@pytest.mark.unit
+def test_single_profile_at_a_time() -> None:
+    profiler = SamplingProfiler()
+    started = threading.Event()
+
+    def _profile() -> None:
+        started.set()
+        profiler.profile(0.2)
+
+    thread = threading.Thread(target=_profile)
+    thread.start()
+    started.wait()
+    with pytest.raises(ProfilerBusyError):
+        profiler.profile(0.01)
+    thread.join()
+    # Released once the first profile ended
+    assert isinstance(profiler.profile(0.01), str)
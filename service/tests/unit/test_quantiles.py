@@ -0,0 +1,103 @@
+import random
+
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from main import app
+from service.config import config
+from service.statistics import QuantileStatistic
+from service.utils.columnar_interval_tree import ColumnarIntervalTree
+from service.utils.interval_tree import DenaryIntervalTree
+
+random.seed(4417092)
+
+SIZE = 20_000
+QS = [0.0, 0.01, 0.25, 0.5, 0.95, 0.99, 0.999, 1.0]
+# Bins are computed with floating-point logarithms, which may put values
+# right at a bin boundary into the neighbouring bin
+TOLERANCE = QuantileStatistic.RELATIVE_ACCURACY * (1 + 1e-9)
+
+
+def _exact(values: list[float], q: float) -> float:
+    return sorted(values)[int(q * (len(values) - 1))]
+
+
+def _assert_accurate(
+    stats: QuantileStatistic | None,
+    values: list[float],
+    qs: list[float],
+) -> None:
+    assert stats is not None
+    for q, estimate in zip(qs, stats.quantiles(qs), strict=True):
+        exact = _exact(values, q)
+        assert abs(estimate - exact) <= TOLERANCE * abs(exact), q
+
+
+@pytest.mark.unit
+def test_tree_quantiles_are_relatively_accurate() -> None:
+    # Prices with duplicates, a few zeros and negative values
+    values = [round(random.lognormvariate(4, 1), 2) for _ in range(SIZE)]
+    values[100:110] = [0.0] * 10
+    values[5000:5010] = [-1.5] * 10
+    tree = DenaryIntervalTree(SIZE, QuantileStatistic)
+    for start in range(0, SIZE, 1000):
+        tree.add(values[start : start + 1000], start)
+
+    ranges = [(0, SIZE - 1), (SIZE - 10**4, SIZE - 1), (95, 5005), (7, 7)]
+    for (start, end), stats in zip(ranges, tree.calculate_many(ranges), strict=True):
+        _assert_accurate(stats, values[start : end + 1], QS)
+        assert stats is not None
+        assert stats.count == end - start + 1
+
+
+@pytest.mark.unit
+def test_merge_does_not_depend_on_grouping() -> None:
+    values = [random.gauss(0, 100) for _ in range(1000)]
+    leaves = QuantileStatistic.create_many(values)
+    whole = QuantileStatistic.merge(*leaves)
+    grouped = QuantileStatistic.merge(
+        QuantileStatistic.merge(*leaves[:1]),
+        QuantileStatistic.merge(*leaves[1:600]),
+        *leaves[600:610],
+        QuantileStatistic.merge(*leaves[610:]),
+    )
+    assert whole.bins == grouped.bins
+    assert whole.quantiles(QS) == grouped.quantiles(QS)
+    assert whole.avg == pytest.approx(sum(values) / len(values))
+
+
+@pytest.mark.unit
+def test_sketches_are_capped_and_keep_their_tails() -> None:
+    # Magnitudes spread over many orders, more bins than a sketch may hold
+    values = [random.choice([-1, 1]) * random.lognormvariate(0, 6) for _ in range(SIZE)]
+    tree = DenaryIntervalTree(SIZE, QuantileStatistic)
+    tree.add(values, 0)
+    stats = tree.calculate(0, SIZE - 1)
+    assert stats is not None
+    assert stats.bins is not None
+    assert len(stats.bins) <= QuantileStatistic.MAX_BINS
+    # Only bins closest to zero are collapsed
+    _assert_accurate(stats, values, [0.0, 0.01, 0.05, 0.95, 0.99, 1.0])
+
+
+@pytest.mark.unit
+def test_quantiles_need_the_denary_tree() -> None:
+    with pytest.raises(ValueError, match="columns"):
+        ColumnarIntervalTree(SIZE, QuantileStatistic)
+
+
+@pytest.mark.unit
+def test_stats_report_quantiles(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(config, "STATISTIC", "quantiles")
+    client = TestClient(app)
+    values = [float(value) for value in range(1, 101)]
+    client.post("/add_batch/", json={"symbol": "QUANTILES", "values": values})
+    response = client.get("/stats/", params={"symbol": "QUANTILES", "k": 2})
+    assert response.status_code == status.HTTP_200_OK
+    quantiles = response.json()["statistics"]["quantiles"]
+    assert list(quantiles) == ["p50", "p95", "p99"]
+    for name, q in zip(quantiles, config.QUANTILES, strict=True):
+        exact = _exact(values, q)
+        assert abs(quantiles[name] - exact) <= TOLERANCE * exact
+    client.delete("/admin/symbols/QUANTILES/")
@@ -0,0 +1,186 @@
+from pathlib import Path
+from urllib.parse import quote
+
+import httpx
+import numpy as np
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from main import app
+from service.config import config
+from service.sharding import ShardClient, router_app, shard_for
+
+SHARD_URLS = ["http://shard-0", "http://shard-1"]
+
+
+class _RecordingTransport(httpx.AsyncBaseTransport):
+    """Serves every shard with the in-process service, recording their hosts."""
+
+    def __init__(self):
+        self.hosts: list[str] = []
+        self._transport = httpx.ASGITransport(app)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.hosts.append(request.url.host)
+        return await self._transport.handle_async_request(request)
+
+
+class _OverloadedTransport(_RecordingTransport):
+    """Rejects the first `rejections` requests like an overloaded shard."""
+
+    def __init__(self, rejections: int):
+        super().__init__()
+        self.rejections = rejections
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.rejections:
+            self.rejections -= 1
+            self.hosts.append(request.url.host)
+            return httpx.Response(
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                json={"message": "Too many concurrent requests for the symbol"},
+                headers={"Retry-After": "0"},
+            )
+        return await super().handle_async_request(request)
+
+
+class _UnavailableTransport(httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("Connection refused", request=request)
+
+
+def _router_client(transport: httpx.AsyncBaseTransport) -> TestClient:
+    router_app.state.shard_client = ShardClient(SHARD_URLS, transport=transport)
+    return TestClient(router_app)
+
+
+def _symbol_on_shard(shard: int, prefix: str) -> str:
+    return next(
+        f"{prefix}_{i}"
+        for i in range(100)
+        if shard_for(f"{prefix}_{i}", len(SHARD_URLS)) == shard
+    )
+
+
+@pytest.mark.unit
+def test_shard_for() -> None:
+    assert shard_for("SYMBOL", 4) == shard_for("SYMBOL", 4)
+    assert shard_for("SYMBOL", 1) == 0
+    shards = {shard_for(f"SYMBOL_{i}", 4) for i in range(100)}
+    assert shards == {0, 1, 2, 3}
+
+
+@pytest.mark.unit
+def test_router_forwards_to_owner() -> None:
+    transport = _RecordingTransport()
+    client = _router_client(transport)
+    symbol = _symbol_on_shard(1, "ROUTED")
+
+    response = client.post("/add_batch/", json={"symbol": symbol, "values": [1, 3]})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"symbol": symbol, "message": "OK"}
+    response = client.get("/stats/", params={"symbol": symbol, "k": 1})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["statistics"]["avg"] == 2.0  # noqa: PLR2004
+    assert transport.hosts == ["shard-1", "shard-1"]
+
+    response = client.get("/stats/", params={"symbol": "ROUTED_MISSING", "k": 1})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.unit
+def test_router_splits_bulk_requests() -> None:
+    transport = _RecordingTransport()
+    client = _router_client(transport)
+    symbols = [_symbol_on_shard(shard, "BULK_ROUTED") for shard in (0, 1)]
+
+    response = client.post(
+        "/add_batch/bulk/",
+        json={"batches": {symbol: [1.0] for symbol in symbols}},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["symbols"] == symbols
+    assert sorted(transport.hosts) == ["shard-0", "shard-1"]
+
+    queries = [
+        {"symbol": symbols[1], "k": 1},
+        {"symbol": symbols[0], "k": 1},
+        {"symbol": "BULK_ROUTED_MISSING", "k": 1},
+    ]
+    response = client.post("/stats/bulk/", json={"queries": queries})
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()["results"]
+    assert [result["symbol"] for result in results] == [
+        query["symbol"] for query in queries
+    ]
+    assert results[0]["statistics"]["last"] == 1.0
+    assert results[2]["statistics"] is None
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("symbol", ["BRK/B", "A?B#C", "100%", "A B"])
+def test_router_encodes_symbols_in_paths(
+    symbol: str,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(config, "ADMIN_ENABLED", True)
+    client = _router_client(_RecordingTransport())
+    path = quote(symbol, safe="")
+
+    response = client.post(
+        f"/add_batch/{path}/binary/",
+        content=np.array([1.0, 3.0]).tobytes(),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"symbol": symbol, "message": "OK"}
+    response = client.get("/stats/", params={"symbol": symbol, "k": 1})
+    assert response.json()["statistics"]["avg"] == 2.0  # noqa: PLR2004
+    response = client.delete(f"/admin/symbols/{path}/")
+    assert response.json() == {"symbol": symbol, "message": "OK"}
+
+
+@pytest.mark.unit
+def test_router_forwards_backfills(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(config, "ADMIN_ENABLED", True)
+    monkeypatch.setattr(config, "BACKFILL_DIR", tmp_path)
+    (tmp_path / "values.csv").write_text("1.5\n2.5\n")
+    transport = _RecordingTransport()
+    client = _router_client(transport)
+    symbol = _symbol_on_shard(1, "BACKFILL_ROUTED")
+
+    response = client.post(
+        f"/admin/symbols/{symbol}/backfill/",
+        json={"path": "values.csv"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"symbol": symbol, "points": 2}
+    assert transport.hosts == ["shard-1"]
+    client.delete(f"/admin/symbols/{symbol}/")
+
+
+@pytest.mark.unit
+def test_router_retries_stream_batches_not_admitted() -> None:
+    transport = _OverloadedTransport(rejections=2)
+    client = _router_client(transport)
+    with client.websocket_connect("/add_batch/stream/") as websocket:
+        websocket.receive_json()
+        websocket.send_json(
+            {"seq": 0, "symbol": "STREAM_ROUTED", "values": [2.0], "flush": True},
+        )
+        assert websocket.receive_json()["ack"] == 0
+    assert len(transport.hosts) == 3  # noqa: PLR2004
+
+    response = client.get("/stats/", params={"symbol": "STREAM_ROUTED", "k": 1})
+    assert response.json()["statistics"]["last"] == 2.0  # noqa: PLR2004
+
+
+@pytest.mark.unit
+def test_router_unavailable_shard() -> None:
+    client = _router_client(_UnavailableTransport())
+    response = client.get("/stats/", params={"symbol": "SYMBOL", "k": 1})
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
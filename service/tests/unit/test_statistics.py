@@ -0,0 +1,47 @@
+from typing import NamedTuple
+
+import pytest
+
+from service.statistics import Statistic, create_many, merge_many
+
+
+class SumStatistic(NamedTuple):
+    sum: float
+
+    @classmethod
+    def create(cls, value: float) -> "SumStatistic":
+        return cls(sum=value)
+
+    @classmethod
+    def merge(cls, *statistics: "SumStatistic") -> "SumStatistic":
+        return cls(sum=sum(stat.sum for stat in statistics))
+
+
+@pytest.mark.unit
+def test_bulk_operations_match_single_ones() -> None:
+    values = [3.0, -1.5, 2.0, 7.25, 0.0]
+    stats = create_many(Statistic, values)
+    assert stats == [Statistic.create(value) for value in values]
+    assert all(type(stat) is Statistic for stat in stats)
+
+    assert merge_many(Statistic, [stats[:1], stats[2:4]]) == [
+        stats[0],
+        Statistic(
+            min=2.0,
+            max=7.25,
+            last=7.25,
+            sum=9.25,
+            count=2,
+            sum_squares=56.5625,
+        ),
+    ]
+
+
+@pytest.mark.unit
+def test_bulk_operations_fall_back_to_single_ones() -> None:
+    stats = create_many(SumStatistic, [1.0, 2.0, 3.0])
+    assert stats == [SumStatistic(1.0), SumStatistic(2.0), SumStatistic(3.0)]
+    assert merge_many(SumStatistic, [stats, stats[1:]]) == [
+        SumStatistic(6.0),
+        SumStatistic(5.0),
+    ]
@@ -0,0 +1,141 @@
+import random
+from fractions import Fraction
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from service.dtos import StatsResponse
+from service.statistics import CenteredStatistic, Statistic
+from service.utils.columnar_interval_tree import ColumnarIntervalTree
+from service.utils.interval_tree import DenaryIntervalTree, IntervalTreeProtocol
+
+random.seed(5110243)
+
+SIZE = 20_000
+# Prices around 10^4 moving by a few cents: sums of squares are ~10^12 times
+# larger than the variance, the worst case for `sum_squares/count - avg**2`
+PRICES = [10_000 + random.gauss(0, 0.01) for _ in range(SIZE)]
+# Relative errors allowed against exact arithmetic: a few ulps for means and
+# the rounding of about a thousand float64 operations for variances
+MEAN_TOLERANCE = 1e-14
+VARIANCE_TOLERANCE = 1e-10
+# Means of compact levels are rounded to float32
+FLOAT32_MEAN_TOLERANCE = 1e-7
+FLOAT32_VARIANCE_TOLERANCE = 1e-5
+
+
+def _exact(values: list[float]) -> tuple[Fraction, Fraction]:
+    """Return the mean and the population variance in exact arithmetic."""
+    fractions = [Fraction(value) for value in values]
+    mean = sum(fractions) / len(fractions)
+    return mean, sum((value - mean) ** 2 for value in fractions) / len(fractions)
+
+
+def _relative_error(value: float, exact: Fraction) -> float:
+    return float(abs(Fraction(value) - exact) / abs(exact))
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("tree_class", [DenaryIntervalTree, ColumnarIntervalTree])
+def test_centered_variance_is_exact_over_large_windows(
+    tree_class: type[IntervalTreeProtocol],
+) -> None:
+    tree = tree_class(SIZE, CenteredStatistic)
+    for start in range(0, SIZE, 3000):
+        tree.add(PRICES[start : start + 3000], start)
+
+    ranges = [(0, SIZE - 1), (SIZE - 10**4, SIZE - 1), (123, 17_890)]
+    for (start, end), batched in zip(ranges, tree.calculate_many(ranges), strict=True):
+        mean, variance = _exact(PRICES[start : end + 1])
+        for stats in (batched, tree.calculate(start, end)):
+            assert stats is not None
+            assert stats.count == end - start + 1
+            assert _relative_error(stats.avg, mean) < MEAN_TOLERANCE
+            assert _relative_error(stats.var, variance) < VARIANCE_TOLERANCE
+
+
+@pytest.mark.unit
+def test_centered_merge_is_exact_for_uneven_groups() -> None:
+    groups = [PRICES[:1], PRICES[1:1000], PRICES[1000:1003], PRICES[1003:]]
+    stats = CenteredStatistic.merge(
+        *(CenteredStatistic.merge(*map(CenteredStatistic.create, g)) for g in groups),
+    )
+    mean, variance = _exact(PRICES)
+    assert _relative_error(stats.avg, mean) < MEAN_TOLERANCE
+    assert _relative_error(stats.var, variance) < VARIANCE_TOLERANCE
+    assert (stats.min, stats.max, stats.last) == (
+        min(PRICES),
+        max(PRICES),
+        PRICES[-1],
+    )
+
+
+@pytest.mark.unit
+def test_responses_of_both_statistics_agree() -> None:
+    values = [1.5, -2.0, 4.25, 8.0, 0.5]
+    sums = StatsResponse.Statistics.create(
+        Statistic.merge(*map(Statistic.create, values)),
+    )
+    centered = StatsResponse.Statistics.create(
+        CenteredStatistic.merge(*map(CenteredStatistic.create, values)),
+    )
+    mean, variance = _exact(values)
+    assert sums.avg == centered.avg == float(mean)
+    assert sums.var == pytest.approx(float(variance))
+    assert centered.var == float(variance)
+
+
+@pytest.mark.unit
+def test_compact_leaves_keep_variance_exact_and_halve_memory() -> None:
+    compact = ColumnarIntervalTree(SIZE, CenteredStatistic, compact_levels=1)
+    full = ColumnarIntervalTree(SIZE, CenteredStatistic)
+    compact.add(PRICES, 0)
+    full.add(PRICES, 0)
+
+    # Leaves hold values rounded to float32, everything above is exact
+    rounded = np.float32(PRICES).astype(np.float64).tolist()
+    for start, end in [(0, SIZE - 1), (17, 4321), (SIZE - 5, SIZE - 1)]:
+        stats = compact.calculate(start, end)
+        mean, variance = _exact(rounded[start : end + 1])
+        assert stats is not None
+        assert stats.last == rounded[end]
+        assert stats.min == min(rounded[start : end + 1])
+        assert _relative_error(stats.avg, mean) < MEAN_TOLERANCE
+        assert _relative_error(stats.var, variance) < VARIANCE_TOLERANCE
+
+    assert compact.nbytes < 0.6 * full.nbytes
+
+
+@pytest.mark.unit
+def test_compact_levels_keep_variance_within_float32_precision() -> None:
+    values = [100 + random.gauss(0, 1) for _ in range(SIZE)]
+    tree = ColumnarIntervalTree(SIZE, CenteredStatistic, compact_levels=3)
+    tree.add(values, 0)
+
+    stats = tree.calculate(0, SIZE - 1)
+    mean, variance = _exact(np.float32(values).astype(np.float64).tolist())
+    assert stats is not None
+    assert _relative_error(stats.avg, mean) < FLOAT32_MEAN_TOLERANCE
+    assert _relative_error(stats.var, variance) < FLOAT32_VARIANCE_TOLERANCE
+
+
+@pytest.mark.unit
+def test_compact_levels_need_centered_statistic(tmp_path: Path) -> None:
+    with pytest.raises(ValueError, match="mean-centered"):
+        ColumnarIntervalTree(SIZE, Statistic, compact_levels=1)
+    with pytest.raises(ValueError, match="compact levels"):
+        DenaryIntervalTree(SIZE, CenteredStatistic, compact_levels=1)
+
+    compact = ColumnarIntervalTree(
+        SIZE,
+        CenteredStatistic,
+        directory=tmp_path,
+        compact_levels=1,
+    )
+    compact.add(PRICES[:10], 0)
+    compact.flush()
+    with pytest.raises(ValueError, match="different tree"):
+        ColumnarIntervalTree(SIZE, CenteredStatistic, directory=tmp_path)
+    with pytest.raises(ValueError, match="different statistic"):
+        ColumnarIntervalTree(SIZE, Statistic, directory=tmp_path)
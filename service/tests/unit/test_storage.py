@@ -1,18 +1,33 @@
 import random
+from pathlib import Path
 
 import pytest
 from tqdm import tqdm
 
+from service import storage as storage_module
 from service.statistics import Statistic
-from service.storage import StatsStorage
+from service.storage import (
+    StatsStorage,
+    StorageClosedError,
+    drop_symbol,
+    evict_cold_symbols,
+    find_storage_for_symbol,
+    get_storage_for_symbol,
+    load_symbol_store,
+    symbol_footprints,
+    symbol_store,
+)
+from service.utils.columnar_interval_tree import ColumnarIntervalTree
+from service.utils.interval_tree import DenaryIntervalTree, IntervalTreeProtocol
 
 random.seed(7236218)
 
 
 @pytest.mark.unit
-def test_storage_fuzzy() -> None:
+@pytest.mark.parametrize("tree_class", [DenaryIntervalTree, ColumnarIntervalTree])
+def test_storage_fuzzy(tree_class: type[IntervalTreeProtocol]) -> None:
     max_elements = 10**4
-    storage = StatsStorage(max_elements, Statistic)
+    storage = StatsStorage(max_elements, Statistic, tree_class)
     data = []
 
     def _generate_input(n: int) -> list[float]:
@@ -36,3 +51,222 @@ def test_storage_fuzzy() -> None:
             sum(x**2 for x in data[-query:]),
         )
         assert query_result.last == data[-1]
+
+
+@pytest.mark.unit
+def test_finding_storage_does_not_create_it() -> None:
+    assert find_storage_for_symbol("UNKNOWN SYMBOL") is None
+    assert "UNKNOWN SYMBOL" not in symbol_store
+
+
+@pytest.mark.unit
+def test_storage_windows_match_tree_queries() -> None:
+    max_elements = 10**3
+    windows = [10**k for k in range(1, 5)]
+    windowed_storage = StatsStorage(max_elements, Statistic, windows=windows)
+    storage = StatsStorage(max_elements, Statistic)
+    assert windowed_storage.get(10) is None
+
+    for _ in range(200):
+        input_ = [random.random() for _ in range(random.randint(1, 300))]
+        windowed_storage.add(input_)
+        storage.add(input_)
+        for window in windows:
+            assert windowed_storage.get(window) == storage.get(window)
+
+
+@pytest.mark.unit
+def test_persistent_storage_is_reopened(tmp_path: Path) -> None:
+    max_elements = 10**3
+    windows = [10, 100]
+    data = [random.random() for _ in range(1500)]
+    storage = StatsStorage(
+        max_elements,
+        Statistic,
+        ColumnarIntervalTree,
+        windows=windows,
+        directory=tmp_path,
+    )
+    storage.add(data[:700])
+    storage.add(data[700:])
+    del storage
+
+    reopened = StatsStorage(
+        max_elements,
+        Statistic,
+        ColumnarIntervalTree,
+        windows=windows,
+        directory=tmp_path,
+    )
+    for last_n in [*windows, 1000]:
+        stats = reopened.get(last_n)
+        assert stats.count == last_n
+        assert stats.min == min(data[-last_n:])
+        assert stats.last == data[-1]
+        assert stats.sum == pytest.approx(sum(data[-last_n:]))
+
+    with pytest.raises(ValueError):
+        StatsStorage(10, Statistic, ColumnarIntervalTree, directory=tmp_path)
+
+
+@pytest.mark.unit
+def test_symbol_store_is_loaded_from_data_dir(tmp_path: Path) -> None:
+    get_storage_for_symbol(
+        "PERSISTED SYMBOL",
+        100,
+        Statistic,
+        ColumnarIntervalTree,
+        data_dir=tmp_path,
+    ).add([1.0, 2.0])
+    symbol_store.pop("PERSISTED SYMBOL")
+
+    load_symbol_store(tmp_path, 100, Statistic, ColumnarIntervalTree)
+    assert find_storage_for_symbol("PERSISTED SYMBOL").get(10).sum == 3.0  # noqa: PLR2004
+    symbol_store.pop("PERSISTED SYMBOL")
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("tree_class", [DenaryIntervalTree, ColumnarIntervalTree])
+def test_storage_get_within(tree_class: type[IntervalTreeProtocol]) -> None:
+    max_elements = 50
+    storage = StatsStorage(max_elements, Statistic, tree_class)
+    assert storage.get_within(1.0) is None
+
+    values: list[float] = []
+    timestamps: list[float] = []
+    for _ in range(40):
+        batch = [random.random() for _ in range(random.randint(0, 7))]
+        # Repeated timestamps and one timestamp for the whole batch are allowed
+        start = timestamps[-1] if timestamps else 0.0
+        if random.random() < 0.5:  # noqa: PLR2004
+            batch_timestamps: list[float] | float = start + random.randint(0, 2)
+            timestamps.extend([batch_timestamps] * len(batch))
+        else:
+            batch_timestamps = [start + random.randint(0, 2) for _ in batch]
+            batch_timestamps.sort()
+            timestamps.extend(batch_timestamps)
+        storage.add(batch, batch_timestamps)
+        values.extend(batch)
+
+        stored = list(zip(values, timestamps, strict=True))[-max_elements:]
+        for seconds in [0.5, 1.0, 3.0, 1000.0]:
+            expected = [value for value, ts in stored if ts > timestamps[-1] - seconds]
+            stats = storage.get_within(seconds)
+            if not expected:
+                assert stats is None
+                continue
+            assert stats.count == len(expected)
+            assert stats.min == min(expected)
+            assert stats.last == expected[-1]
+            assert stats.sum == pytest.approx(sum(expected))
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("tree_class", [DenaryIntervalTree, ColumnarIntervalTree])
+def test_storage_get_series(tree_class: type[IntervalTreeProtocol]) -> None:
+    max_elements = 97
+    storage = StatsStorage(max_elements, Statistic, tree_class)
+    assert storage.get_series(10, 3) == []
+
+    data: list[float] = []
+    for _ in range(60):
+        batch = [random.random() for _ in range(random.randint(1, 20))]
+        storage.add(batch)
+        data = (data + batch)[-max_elements:]
+
+        last_n = random.randint(1, 2 * max_elements)
+        buckets = random.randint(1, 30)
+        offset = random.randint(0, max_elements)
+        window = data[max(len(data) - offset - last_n, 0) : max(len(data) - offset, 0)]
+        series = storage.get_series(last_n, buckets, offset)
+        assert len(series) == min(buckets, len(window))
+        # Buckets are consecutive, in order and differ in size by at most one
+        sizes = [stats.count for _, stats in series]
+        assert sum(sizes) == len(window)
+        assert max(sizes, default=0) - min(sizes, default=0) <= 1
+        start = 0
+        for first, stats in series:
+            bucket = window[start : start + stats.count]
+            start += stats.count
+            assert first.last == bucket[0]
+            assert stats.min == min(bucket)
+            assert stats.max == max(bucket)
+            assert stats.last == bucket[-1]
+            assert stats.sum == pytest.approx(sum(bucket))
+
+
+@pytest.mark.unit
+def test_storage_rejects_invalid_timestamps() -> None:
+    storage = StatsStorage(10, Statistic)
+    storage.add([1.0, 2.0], [5.0, 6.0])
+    with pytest.raises(ValueError):
+        storage.add([3.0], [5.5])
+    with pytest.raises(ValueError):
+        storage.add([3.0, 4.0], [8.0, 7.0])
+    with pytest.raises(ValueError):
+        storage.add([3.0, 4.0], [8.0])
+    assert storage.get(10).count == 2  # noqa: PLR2004
+
+    # Batches without timestamps are stamped with the arrival time, which is
+    # never earlier than stored timestamps
+    storage.add([3.0])
+    storage.add([4.0], 1e12)
+    assert storage.get_within(1.0).sum == 4.0  # noqa: PLR2004
+    assert storage.get_within(2e12).sum == 10.0  # noqa: PLR2004
+
+
+@pytest.mark.unit
+def test_persistent_storage_keeps_timestamps(tmp_path: Path) -> None:
+    storage = StatsStorage(10, Statistic, ColumnarIntervalTree, directory=tmp_path)
+    storage.add([1.0, 2.0, 3.0], [1.0, 2.0, 3.0])
+    storage.add(list(range(10)), 10.0)
+    del storage
+
+    reopened = StatsStorage(10, Statistic, ColumnarIntervalTree, directory=tmp_path)
+    assert reopened.get_within(1.0).count == 10  # noqa: PLR2004
+    reopened.add([20.0], 11.0)
+    assert reopened.get_within(1.0).sum == 20.0  # noqa: PLR2004
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("tree_class", [DenaryIntervalTree, ColumnarIntervalTree])
+def test_cold_symbols_are_spilled_and_loaded_back(
+    tmp_path: Path,
+    tree_class: type[IntervalTreeProtocol],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # Symbols of other tests must not be spilled
+    monkeypatch.setattr(storage_module, "symbol_store", {})
+    monkeypatch.setattr(storage_module, "spilled_symbols", {})
+    symbols = ["COLD_A", "COLD_B", "HOT"]
+    for symbol in symbols:
+        get_storage_for_symbol(symbol, 100, Statistic, tree_class).add(
+            [1.0, 2.0, 3.0],
+            [1.0, 2.0, 3.0],
+        )
+    cold_storage = get_storage_for_symbol("COLD_A", 100, Statistic, tree_class)
+    get_storage_for_symbol("HOT", 100, Statistic, tree_class)
+
+    # Recently used symbols are not spilled
+    assert evict_cold_symbols(0, 1, 3600.0, tmp_path) == []
+    assert evict_cold_symbols(2**40, 1, 0.0, tmp_path) == ["COLD_B", "COLD_A"]
+    assert list(storage_module.symbol_store) == ["HOT"]
+    assert find_storage_for_symbol("COLD_A") is None
+    footprints = {footprint.symbol: footprint for footprint in symbol_footprints()}
+    assert not footprints["COLD_A"].resident
+    assert footprints["COLD_A"].bytes > 0
+    assert footprints["HOT"].resident
+    with pytest.raises(StorageClosedError):
+        cold_storage.add([4.0])
+
+    loaded = get_storage_for_symbol("COLD_A", 100, Statistic, tree_class)
+    assert list(storage_module.spilled_symbols) == ["COLD_B"]
+    assert loaded.get(10).sum == 6.0  # noqa: PLR2004
+    assert loaded.get_within(1.5).sum == 5.0  # noqa: PLR2004
+    loaded.add([4.0])
+    assert loaded.get(10).sum == 10.0  # noqa: PLR2004
+
+    for symbol in symbols:
+        assert drop_symbol(symbol, tmp_path)
+    assert not drop_symbol("COLD_A", tmp_path)
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,147 @@
+import random
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterator
+
+import numpy as np
+import pytest
+
+from service.statistics import Statistic
+from service.storage import StatsStorage, get_storage_for_symbol
+from service.utils.columnar_interval_tree import ColumnarIntervalTree
+from service.utils.interval_tree import DenaryIntervalTree, IntervalTreeProtocol
+
+random.seed(90412775)
+
+BATCH_SIZE = 10
+
+
+@pytest.fixture(autouse=True)
+def _frequent_thread_switches() -> Iterator[None]:
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(switch_interval)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("tree_class", [DenaryIntervalTree, ColumnarIntervalTree])
+def test_storage_stress(tree_class: type[IntervalTreeProtocol]) -> None:
+    # Every batch holds BATCH_SIZE copies of one value, so a consistent
+    # snapshot of the last 10 points has min == max and a consistent snapshot
+    # of the last 20 points is made of exactly two constant batches
+    writers, batches_per_writer, readers = 4, 300, 4
+    max_size = writers * batches_per_writer * BATCH_SIZE
+    storage = StatsStorage(max_size, Statistic, tree_class, windows=[10])
+    # The invariants of the last 20 points only hold from the second batch on
+    storage.add([1.0] * BATCH_SIZE)
+    storage.add([2.0] * BATCH_SIZE)
+    errors: list[str] = []
+    done = threading.Event()
+
+    def _write() -> None:
+        for _ in range(batches_per_writer):
+            storage.add([float(random.randint(1, 1000))] * BATCH_SIZE)
+
+    def _read() -> None:
+        while not done.is_set():
+            window = storage.get(10)
+            if window is not None and window.min != window.max:
+                errors.append(f"torn window read: {window}")
+            pair = storage.get(20)
+            if pair is not None and pair.sum != pytest.approx(
+                BATCH_SIZE * (pair.min + pair.max),
+            ):
+                errors.append(f"torn tree read: {pair}")
+
+    reader_threads = [threading.Thread(target=_read) for _ in range(readers)]
+    writer_threads = [threading.Thread(target=_write) for _ in range(writers)]
+    for thread in reader_threads + writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    done.set()
+    for thread in reader_threads:
+        thread.join()
+
+    assert not errors
+    total = storage.get(max_size)
+    assert total.count == max_size
+    assert storage.get(10).count == BATCH_SIZE
+
+
+@pytest.mark.unit
+def test_concurrent_lookups_create_single_storage() -> None:
+    storages: list[StatsStorage] = []
+
+    def _lookup() -> None:
+        storages.append(get_storage_for_symbol("CONCURRENT", 10, Statistic))
+
+    threads = [threading.Thread(target=_lookup) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(storage) for storage in storages}) == 1
+
+
+def _add_queued(
+    storage: StatsStorage,
+    add: Callable[[list[float]], None],
+    batches: list[list[float]],
+) -> None:
+    """Queue all `batches` behind a held write lock, then let them be applied."""
+    threads = [threading.Thread(target=add, args=(batch,)) for batch in batches]
+    with storage._write_lock:  # noqa: SLF001
+        for queued, thread in enumerate(threads, start=1):
+            thread.start()
+            # Wait for the batch to be queued, so that arrival order is known
+            while len(storage._pending) < queued:  # noqa: SLF001
+                time.sleep(0)
+    for thread in threads:
+        thread.join()
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("tree_class", [DenaryIntervalTree, ColumnarIntervalTree])
+def test_concurrent_adds_are_coalesced(
+    tree_class: type[IntervalTreeProtocol],
+) -> None:
+    logged: list[list[float]] = []
+
+    def _log(values: list[float], _: np.ndarray) -> int:
+        logged.append(list(values))
+        return len(logged) - 1
+
+    storage = StatsStorage(5, Statistic, tree_class, log=_log)
+    initial_version = storage.version
+    _add_queued(storage, storage.add, [[1.0], [2.0, 3.0], [4.0, 5.0, 6.0]])
+
+    # One writer applied every batch, in arrival order, with a single repair
+    assert logged == [[1.0, 2.0, 3.0, 4.0, 5.0, 6.0]]
+    assert storage.lsn == 1
+    assert storage.version == initial_version + 4
+    assert storage.get(1).last == 6.0  # noqa: PLR2004
+    assert storage.get(5).sum == 20.0  # noqa: PLR2004
+
+
+@pytest.mark.unit
+def test_coalesced_add_failure_reaches_every_writer() -> None:
+    def _log(*_: object) -> int:
+        raise OSError("disk full")
+
+    storage = StatsStorage(10, Statistic, log=_log)
+    errors: list[Exception] = []
+
+    def _add(values: list[float]) -> None:
+        try:
+            storage.add(values)
+        except OSError as e:
+            errors.append(e)
+
+    _add_queued(storage, _add, [[1.0], [2.0], [3.0]])
+
+    assert len(errors) == 3  # noqa: PLR2004
+    assert storage.get(1) is None
@@ -0,0 +1,228 @@
+import math
+import os
+import random
+import struct
+import threading
+import zlib
+from pathlib import Path
+
+import pytest
+
+from service import storage
+from service.statistics import Statistic
+from service.utils.columnar_interval_tree import ColumnarIntervalTree
+from service.wal import WriteAheadLog, recover_symbol_store, snapshot_symbol_store
+
+random.seed(5531902)
+
+
+@pytest.mark.unit
+def test_log_is_read_back_after_reopen(tmp_path: Path) -> None:
+    wal = WriteAheadLog(tmp_path)
+    assert wal.append("A", [1.0, 2.0], [10.0, 11.0]) == 0
+    assert wal.append("B SYMBOL", [], []) == 1
+    wal.close()
+
+    wal = WriteAheadLog(tmp_path)
+    assert wal.append("A", [3.0], [12.0]) == 2  # noqa: PLR2004
+    records = [
+        (lsn, symbol, values.tolist(), timestamps.tolist())
+        for lsn, symbol, values, timestamps in wal.read()
+    ]
+    assert records == [
+        (0, "A", [1.0, 2.0], [10.0, 11.0]),
+        (1, "B SYMBOL", [], []),
+        (2, "A", [3.0], [12.0]),
+    ]
+    assert [lsn for lsn, *_ in wal.read(start_lsn=1)] == [1, 2]
+
+
+@pytest.mark.unit
+def test_records_without_timestamps_are_read(tmp_path: Path) -> None:
+    # Payload of a record logged before timestamps were: symbol and values
+    payload = struct.pack("<H", 1) + b"A" + struct.pack("<2d", 1.0, 2.0)
+    (tmp_path / f"{0:020d}.wal").write_bytes(
+        struct.pack("<II", len(payload), zlib.crc32(payload)) + payload,
+    )
+
+    wal = WriteAheadLog(tmp_path)
+    [(_, symbol, values, timestamps)] = wal.read()
+    assert symbol == "A"
+    assert values.tolist() == [1.0, 2.0]
+    assert timestamps.tolist() == [-math.inf, -math.inf]
+
+
+@pytest.mark.unit
+def test_torn_record_is_discarded(tmp_path: Path) -> None:
+    wal = WriteAheadLog(tmp_path)
+    wal.append("A", [1.0], [0.0])
+    wal.append("A", [2.0], [0.0])
+    wal.close()
+    segment = next(tmp_path.glob("*.wal"))
+    segment.write_bytes(segment.read_bytes()[:-3])
+
+    wal = WriteAheadLog(tmp_path)
+    assert [values.tolist() for _, _, values, _ in wal.read()] == [[1.0]]
+    assert wal.append("A", [3.0], [0.0]) == 1
+
+
+@pytest.mark.unit
+def test_concurrent_appends_are_group_committed(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    fsyncs = 0
+    fsync = os.fsync
+
+    def _counting_fsync(fd: int) -> None:
+        nonlocal fsyncs
+        fsyncs += 1
+        fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", _counting_fsync)
+    wal = WriteAheadLog(tmp_path, fsync_interval=0.01)
+    writers, appends = 8, 20
+    threads = [
+        threading.Thread(
+            target=lambda i=i: [
+                wal.append(f"S{i}", [float(i)], [0.0]) for _ in range(appends)
+            ],
+        )
+        for i in range(writers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert wal.next_lsn == writers * appends
+    assert sorted(lsn for lsn, *_ in wal.read()) == list(range(writers * appends))
+    assert fsyncs < writers * appends
+
+
+@pytest.mark.unit
+def test_failed_commit_fails_the_log(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    wal = WriteAheadLog(tmp_path)
+    wal.append("A", [1.0], [0.0])
+    fsync = os.fsync
+
+    def _failing_fsync(_: int) -> None:
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(os, "fsync", _failing_fsync)
+    with pytest.raises(OSError, match="No space"):
+        wal.append("A", [2.0], [0.0])
+    monkeypatch.setattr(os, "fsync", fsync)
+    # The state of the file is unknown after a failed fsync
+    with pytest.raises(OSError, match="reopened"):
+        wal.append("A", [3.0], [0.0])
+    wal.close()
+
+    # The failed record was cut off, new records follow the acknowledged ones
+    wal = WriteAheadLog(tmp_path)
+    assert wal.append("A", [4.0], [0.0]) == 1
+    assert [values.tolist() for _, _, values, _ in wal.read()] == [[1.0], [4.0]]
+
+
+@pytest.mark.unit
+def test_truncate_drops_covered_segments(tmp_path: Path) -> None:
+    wal = WriteAheadLog(tmp_path, segment_bytes=1)
+    for i in range(5):
+        wal.append("A", [float(i)], [float(i)])
+    assert len(list(tmp_path.glob("*.wal"))) == 5  # noqa: PLR2004
+
+    wal.truncate(3)
+    assert [lsn for lsn, *_ in wal.read()] == [3, 4]
+    wal.truncate(100)
+    assert [lsn for lsn, *_ in wal.read()] == [4]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("persistent", [False, True])
+def test_symbol_store_is_recovered(tmp_path: Path, persistent: bool) -> None:  # noqa: FBT001
+    symbols = ["WAL_A", "WAL_B"]
+    data: dict[str, list[float]] = {symbol: [] for symbol in symbols}
+    data_dir = tmp_path / "data" if persistent else None
+    wal = WriteAheadLog(tmp_path / "wal")
+
+    def _get_storage(symbol: str) -> storage.StatsStorage:
+        return storage.get_storage_for_symbol(
+            symbol,
+            1000,
+            Statistic,
+            ColumnarIntervalTree,
+            windows=[10, 100],
+            data_dir=data_dir,
+            log=wal.append,
+        )
+
+    def _ingest(batches: int) -> None:
+        for _ in range(batches):
+            symbol = random.choice(symbols)
+            values = [random.random() for _ in range(random.randint(1, 300))]
+            _get_storage(symbol).add(values)
+            data[symbol].extend(values)
+
+    _ingest(20)
+    snapshot_symbol_store(wal, tmp_path / "snapshots")
+    _ingest(20)
+    wal.close()
+    # Crash: everything kept in memory is lost
+    for symbol in symbols:
+        storage.symbol_store.pop(symbol)
+
+    wal = WriteAheadLog(tmp_path / "wal")
+    if persistent:
+        storage.load_symbol_store(data_dir, 1000, Statistic, ColumnarIntervalTree)
+    recover_symbol_store(wal, tmp_path / "snapshots", _get_storage)
+    for symbol in symbols:
+        for last_n in [10, 100, 1000]:
+            stats = _get_storage(symbol).get(last_n)
+            expected = data[symbol][-last_n:]
+            assert stats.count == len(expected)
+            assert stats.min == min(expected)
+            assert stats.last == expected[-1]
+            assert stats.sum == pytest.approx(sum(expected))
+        storage.symbol_store.pop(symbol)
+
+
+@pytest.mark.unit
+def test_dropped_symbol_is_not_recovered(tmp_path: Path) -> None:
+    snapshot_dir = tmp_path / "snapshots"
+    wal = WriteAheadLog(tmp_path / "wal")
+
+    def _get_storage(symbol: str) -> storage.StatsStorage:
+        return storage.get_storage_for_symbol(
+            symbol,
+            1000,
+            Statistic,
+            ColumnarIntervalTree,
+            log=wal.append,
+        )
+
+    _get_storage("WAL_DROPPED").add([1.0, 2.0, 3.0])
+    _get_storage("WAL_RECREATED").add([1.0, 2.0])
+    snapshot_symbol_store(wal, snapshot_dir)
+    for symbol in ["WAL_DROPPED", "WAL_RECREATED"]:
+        assert storage.drop_symbol(symbol, snapshot_dir, next_lsn=lambda: wal.next_lsn)
+    _get_storage("WAL_RECREATED").add([5.0])
+    # The only segment still holds records of both dropped symbols
+    snapshot_symbol_store(wal, snapshot_dir)
+    wal.close()
+    storage.symbol_store.clear()
+
+    # Every later record starts a new segment
+    wal = WriteAheadLog(tmp_path / "wal", segment_bytes=1)
+    recover_symbol_store(wal, snapshot_dir, _get_storage)
+    assert storage.find_storage_for_symbol("WAL_DROPPED") is None
+    stats = _get_storage("WAL_RECREATED").get(10)
+    assert (stats.count, stats.sum) == (1, 5.0)
+
+    # Tombstones go once no older record is logged
+    _get_storage("WAL_RECREATED").add([6.0])
+    snapshot_symbol_store(wal, snapshot_dir)
+    assert not list(snapshot_dir.glob("*.dropped"))
+    storage.symbol_store.clear()
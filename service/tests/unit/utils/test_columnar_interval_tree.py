@@ -0,0 +1,65 @@
+import random
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from service.statistics import Statistic
+from service.utils.columnar_interval_tree import ColumnarIntervalTree
+from service.utils.interval_tree import DenaryIntervalTree
+
+random.seed(4401926)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    ("max_size", "fan_out"),
+    [(10**3, 10), (777, 2), (1234, 16), (2000, 64)],
+)
+def test_columnar_tree_matches_denary_tree(max_size: int, fan_out: int) -> None:
+    columnar_tree = ColumnarIntervalTree[Statistic](
+        max_size,
+        Statistic,
+        fan_out=fan_out,
+    )
+    denary_tree = DenaryIntervalTree[Statistic](max_size, Statistic, fan_out=fan_out)
+
+    for _ in range(500):
+        index = random.randint(0, max_size - 1)
+        values = [
+            (random.random() - 0.5) * 100
+            for _ in range(random.randint(1, max_size - index))
+        ]
+        columnar_tree.add(values, index)
+        denary_tree.add(values, index)
+
+        start = random.randint(0, max_size - 1)
+        end = random.randint(start, max_size - 1)
+        expected = denary_tree.calculate(start, end)
+        result = columnar_tree.calculate(start, end)
+        if expected is None:
+            assert result is None
+            continue
+        assert result.min == expected.min
+        assert result.max == expected.max
+        assert result.last == expected.last
+        assert result.count == expected.count
+        assert result.sum == pytest.approx(expected.sum)
+        assert result.sum_squares == pytest.approx(expected.sum_squares)
+
+
+@pytest.mark.unit
+def test_memory_mapped_columns_are_sized_exactly(tmp_path: Path) -> None:
+    tree = ColumnarIntervalTree[Statistic](2 * 10**4, Statistic, tmp_path, fan_out=8)
+    tree.add([1.0, 2.0], 0)
+    tree.flush()
+
+    # 20000 leaves need 2500, 313, 40, 5 and 1 nodes above them, every level
+    # below the root is allocated in whole groups of 8 siblings
+    lengths = [
+        len(np.load(tmp_path / f"{depth}_count.npy", mmap_mode="r"))
+        for depth in range(6)
+    ]
+    assert lengths == [1, 8, 40, 320, 2504, 20000]
+    assert not (tmp_path / "6_count.npy").exists()
+    assert tuple(tree.calculate(0, 2 * 10**4 - 1))[:3] == (1.0, 2.0, 2.0)
@@ -1,14 +1,26 @@
+import pickle
+import random
+import tracemalloc
 from typing import NamedTuple
 
+import numpy as np
 import pytest
 
-from service.utils.interval_tree import DenaryIntervalTree
+from service.statistics import CenteredStatistic, QuantileStatistic
+from service.utils.columnar_interval_tree import ColumnarIntervalTree
+from service.utils.interval_tree import (
+    DenaryIntervalTree,
+    IntervalTreeProtocol,
+    level_lengths,
+)
 
 
 class SumAndLastStatistic(NamedTuple):
     sum: float
     last: float
 
+    COLUMNS = {"sum": "sum", "last": "last"}  # noqa: RUF012
+
     @classmethod
     def create(cls, value: float) -> "SumAndLastStatistic":
         return cls(sum=value, last=value)
@@ -18,26 +30,37 @@ class SumAndLastStatistic(NamedTuple):
         return cls(sum=sum(stat.sum for stat in statistics), last=statistics[-1].last)
 
 
-def _create_interval_tree(max_size: int) -> DenaryIntervalTree[SumAndLastStatistic]:
-    return DenaryIntervalTree[SumAndLastStatistic](max_size, SumAndLastStatistic)
+@pytest.fixture(params=[DenaryIntervalTree, ColumnarIntervalTree])
+def tree_class(request: pytest.FixtureRequest) -> type[IntervalTreeProtocol]:
+    return request.param
+
+
+def _create_interval_tree(
+    tree_class: type[IntervalTreeProtocol],
+    max_size: int,
+    fan_out: int = 10,
+) -> IntervalTreeProtocol[SumAndLastStatistic]:
+    return tree_class(max_size, SumAndLastStatistic, fan_out=fan_out)
 
 
 @pytest.mark.unit
-def test_reading_from_empty_tree() -> None:
-    assert _create_interval_tree(1).calculate(0, 0) is None
+def test_reading_from_empty_tree(tree_class: type[IntervalTreeProtocol]) -> None:
+    assert _create_interval_tree(tree_class, 1).calculate(0, 0) is None
 
 
 @pytest.mark.unit
-def test_reading_from_empty_range() -> None:
-    tree = _create_interval_tree(10)
+def test_reading_from_empty_range(tree_class: type[IntervalTreeProtocol]) -> None:
+    tree = _create_interval_tree(tree_class, 10)
     tree.add([1, 2, 3], 0)
     assert tree.calculate(9, 9) is None
 
 
 @pytest.mark.unit
-def test_adding_more_values_than_supported() -> None:
+def test_adding_more_values_than_supported(
+    tree_class: type[IntervalTreeProtocol],
+) -> None:
     with pytest.raises(ValueError):
-        _create_interval_tree(10).add([1, 2, 3], 9)
+        _create_interval_tree(tree_class, 10).add([1, 2, 3], 9)
 
 
 @pytest.mark.unit
@@ -82,14 +105,95 @@ def test_adding_more_values_than_supported() -> None:
     ],
 )
 def test_interval_tree(
+    tree_class: type[IntervalTreeProtocol],
     inserts: list[tuple[list[float], int]],
     query: tuple[int, int],
     expected_result: tuple[float, float],
     max_size: int,
 ) -> None:
-    interval_tree = _create_interval_tree(max_size)
+    interval_tree = _create_interval_tree(tree_class, max_size)
     for values, index in inserts:
         interval_tree.add(values, index)
 
     result = interval_tree.calculate(*query)
     assert tuple(result) == expected_result
+
+
+@pytest.mark.unit
+def test_memory_grows_with_inserted_data(
+    tree_class: type[IntervalTreeProtocol],
+) -> None:
+    tracemalloc.start()
+    try:
+        tree = _create_interval_tree(tree_class, 10**8)
+        tree.add(list(range(10)), 0)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 10**5
+    assert tuple(tree.calculate(0, 10**8 - 1)) == (45, 9)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("fan_out", [2, 10, 32])
+def test_calculate_many(tree_class: type[IntervalTreeProtocol], fan_out: int) -> None:
+    rng = random.Random(20240117)
+    values = [float(rng.randint(-100, 100)) for _ in range(2345)]
+    tree = _create_interval_tree(tree_class, 10**4, fan_out)
+    tree.add(values, 0)
+
+    ranges = [(0, 2344), (3000, 4000), (5, 5), (2340, 9999), (-5, 3), (10, 1)]
+    ranges += [tuple(sorted(rng.sample(range(2400), 2))) for _ in range(100)]
+    expected = [
+        (sum(values[max(start, 0) : end + 1]), values[min(end, len(values) - 1)])
+        if max(start, 0) <= min(end, len(values) - 1)
+        else None
+        for start, end in ranges
+    ]
+    results = tree.calculate_many(ranges)
+    assert [None if r is None else tuple(r) for r in results] == expected
+    assert [tree.calculate(start, end) for start, end in ranges] == results
+    assert tree.calculate_many([]) == []
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "stats_class",
+    [SumAndLastStatistic, CenteredStatistic, QuantileStatistic],
+)
+@pytest.mark.parametrize("fan_out", [2, 10])
+def test_denary_tree_pickles_levels_as_arrays(
+    stats_class: type[NamedTuple],
+    fan_out: int,
+) -> None:
+    tree = DenaryIntervalTree(10**4, stats_class, fan_out=fan_out)
+    values = np.random.default_rng(0).normal(100, 10, 1000)
+    # Leaves are left out between and after the batches
+    tree.add(values[:300], 0)
+    tree.add(values[300:], 517)
+
+    restored = pickle.loads(pickle.dumps(tree))  # noqa: S301
+    assert vars(restored) == vars(tree)
+    ranges = [(0, 9999), (250, 600), (517, 517), (300, 516)]
+    assert restored.calculate_many(ranges) == tree.calculate_many(ranges)
+
+
+@pytest.mark.unit
+def test_level_lengths() -> None:
+    assert level_lengths(1, 10) == [1]
+    assert level_lengths(10**3, 10) == [1, 10, 100, 1000]
+    assert level_lengths(2 * 10**8, 10) == [
+        1,
+        2,
+        20,
+        200,
+        2000,
+        20000,
+        200000,
+        2000000,
+        20000000,
+        200000000,
+    ]
+    assert level_lengths(5, 2) == [1, 2, 3, 5]
+    with pytest.raises(ValueError):
+        level_lengths(10, 1)